@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def _configure_sqlite(sender, connection, **kwargs):
+    # WAL lets the reader's frequent polls read while settings are written,
+    # and NORMAL sync is safe with WAL while avoiding an fsync per commit
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL;')
+            cursor.execute('PRAGMA synchronous=NORMAL;')
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        connection_created.connect(_configure_sqlite)
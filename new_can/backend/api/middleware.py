@@ -0,0 +1,57 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+from canutils import metrics
+
+REQUEST_TIME = metrics.histogram("http_request_seconds", "Time to handle one API request")
+DB_QUERY_TIME = metrics.histogram("db_query_seconds", "Time to run one database query")
+DB_QUERIES = metrics.counter("db_queries_total", "Database queries run")
+
+
+def _time_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_TIME.observe(time.perf_counter() - start)
+        DB_QUERIES.inc()
+
+
+class MetricsMiddleware:
+    """Times requests and their database queries while metrics are enabled
+
+    Works under both WSGI and ASGI, so async views are not pushed into a
+    thread just to pass through it. Async requests are timed as a whole;
+    their queries run in other threads and are not wrapped.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    async def __acall__(self, request):
+        if not metrics.enabled:
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        REQUEST_TIME.observe(time.perf_counter() - start)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.enabled:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(_time_query):
+            response = self.get_response(request)
+        REQUEST_TIME.observe(time.perf_counter() - start)
+        return response
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.11 on 2026-10-19 00:23
+
+import api.models
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanSettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('bustype', models.CharField(max_length=100, validators=[api.models.validate_alpha])),
+                ('channel', models.CharField(max_length=100, validators=[api.models.validate_alpha])),
+                ('bitrate', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DbcFile',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('FileName', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('FileData', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SelectedDBCFile',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('FileName', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('FileData', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.11 on 2026-10-19 00:23
+
+from django.db import migrations, models
+import cantools
+
+
+def compute_summaries(apps, schema_editor):
+    DbcFile = apps.get_model('api', 'DbcFile')
+    for dbc_file in DbcFile.objects.all():
+        try:
+            db = cantools.database.load_string(dbc_file.FileData)
+        except Exception:
+            continue
+        dbc_file.message_count = len(db.messages)
+        dbc_file.signal_count = sum(len(msg.signals) for msg in db.messages)
+        dbc_file.size = len(dbc_file.FileData.encode('utf-8'))
+        dbc_file.save(update_fields=['message_count', 'signal_count', 'size'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dbcfile',
+            name='message_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dbcfile',
+            name='signal_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dbcfile',
+            name='size',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(compute_summaries, migrations.RunPython.noop),
+    ]
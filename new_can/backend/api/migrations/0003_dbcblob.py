@@ -0,0 +1,87 @@
+# Generated by Django 4.2.11 on 2026-10-19 01:10
+
+import hashlib
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_to_blobs(apps, schema_editor):
+    DbcBlob = apps.get_model('api', 'DbcBlob')
+    for model_name in ('DbcFile', 'SelectedDBCFile'):
+        model = apps.get_model('api', model_name)
+        for row in model.objects.all():
+            contents = row.FileData.encode('utf-8')
+            blob, created = DbcBlob.objects.get_or_create(
+                sha256=hashlib.sha256(contents).hexdigest(),
+                defaults={'data': zlib.compress(contents), 'size': len(contents)}
+            )
+            row.blob = blob
+            row.save(update_fields=['blob'])
+
+
+def move_from_blobs(apps, schema_editor):
+    for model_name in ('DbcFile', 'SelectedDBCFile'):
+        model = apps.get_model('api', model_name)
+        for row in model.objects.select_related('blob'):
+            row.FileData = zlib.decompress(bytes(row.blob.data)).decode('utf-8')
+            row.save(update_fields=['FileData'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_dbcfile_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DbcBlob',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.IntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dbcfile',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='api.dbcblob'),
+        ),
+        migrations.AddField(
+            model_name='selecteddbcfile',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='api.dbcblob'),
+        ),
+        migrations.AlterField(
+            model_name='dbcfile',
+            name='FileData',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='selecteddbcfile',
+            name='FileData',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(move_to_blobs, move_from_blobs),
+        migrations.RemoveField(
+            model_name='dbcfile',
+            name='FileData',
+        ),
+        migrations.RemoveField(
+            model_name='selecteddbcfile',
+            name='FileData',
+        ),
+        migrations.AlterField(
+            model_name='dbcfile',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.dbcblob'),
+        ),
+        migrations.AlterField(
+            model_name='selecteddbcfile',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.dbcblob'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:30
+
+from django.db import migrations
+
+SETTINGS_ID = 1
+
+
+def keep_latest_settings(apps, schema_editor):
+    # Settings used to be replaced by delete + insert, so there may be stray
+    # rows and the current one can have any id; keep the newest as the singleton
+    CanSettings = apps.get_model('api', 'CanSettings')
+    latest = CanSettings.objects.order_by('-updated', '-pk').first()
+    if latest is None:
+        return
+    CanSettings.objects.exclude(pk=latest.pk).delete()
+    if latest.pk != SETTINGS_ID:
+        CanSettings.objects.filter(pk=latest.pk).update(id=SETTINGS_ID)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_dbcblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_settings, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,11 @@
-from django.db import models
+import codecs
+import hashlib
+import time
+import zlib
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 
@@ -8,12 +15,108 @@ def validate_alpha(value):
             f'{value} must contain alphabetical characters'
         )
 
+# The CAN settings table holds a single row with this primary key
+SETTINGS_ID = 1
+
+# In-process cache of the settings and selection rows, which are read on
+# every poll but rarely written. Entries are dropped whenever either model
+# is saved or deleted in this process (and again on commit). Other server
+# processes do not see those signals, so entries also expire after
+# CURRENT_TTL seconds: a write in one worker reaches the rest within that.
+CURRENT_TTL = 1.0
+_current = {}
+
+
+def cached_current(key, load):
+    """load() once per CURRENT_TTL seconds, or after invalidate_current(key)"""
+    entry = _current.get(key)
+    now = time.monotonic()
+    if entry is None or entry[0] <= now:
+        entry = (now + CURRENT_TTL, load())
+        _current[key] = entry
+    return entry[1]
+
+
+def invalidate_current(key=None):
+    if key is None:
+        _current.clear()
+    else:
+        _current.pop(key, None)
+
+
+class DbcBlob(models.Model):
+    # zlib compressed DBC contents, stored once per distinct file
+    created = models.DateTimeField(auto_now_add=True)
+
+    sha256 = models.CharField(primary_key=True, max_length=64)
+    data = models.BinaryField()
+    size = models.IntegerField()
+
+    @classmethod
+    def read(cls, chunks):
+        """Read DBC contents from an iterable of byte chunks into an unsaved blob
+
+        Returns the blob and the decoded text. Chunks are hashed and
+        compressed as they arrive. Nothing is written, so an upload that
+        fails after this leaves nothing behind; see save_or_reuse().
+        """
+        sha = hashlib.sha256()
+        compressor = zlib.compressobj()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        compressed = []
+        text = []
+        size = 0
+        for chunk in chunks:
+            sha.update(chunk)
+            compressed.append(compressor.compress(chunk))
+            text.append(decoder.decode(chunk))
+            size += len(chunk)
+        compressed.append(compressor.flush())
+        text.append(decoder.decode(b'', final=True))
+        return cls(sha256=sha.hexdigest(), data=b''.join(compressed), size=size), ''.join(text)
+
+    @classmethod
+    def store(cls, chunks):
+        """read() and save_or_reuse() in one go"""
+        blob, text = cls.read(chunks)
+        return blob.save_or_reuse(), text
+
+    def save_or_reuse(self):
+        """The stored blob with this hash, saving this one if there is none
+
+        Call it in the same transaction that saves the file pointing to the
+        blob, so no other request ever sees the blob unreferenced.
+        """
+        blob, created = DbcBlob.objects.get_or_create(
+            sha256=self.sha256,
+            defaults={'data': self.data, 'size': self.size}
+        )
+        return blob
+
+    def discard(self):
+        """Delete this blob if no file or selection points to it any more"""
+        DbcBlob.objects.filter(pk=self.pk, dbcfile=None, selecteddbcfile=None).delete()
+
+    @property
+    def text(self):
+        return zlib.decompress(bytes(self.data)).decode('utf-8')
+
+
 class DbcFile(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     FileName = models.CharField(primary_key=True, max_length=100, blank=False)
-    FileData = models.TextField(blank=False)
+    blob = models.ForeignKey(DbcBlob, on_delete=models.PROTECT)
+
+    # Summary of FileData, computed on upload so listings never parse files
+    message_count = models.IntegerField(default=0)
+    signal_count = models.IntegerField(default=0)
+    size = models.IntegerField(default=0)
+
+    @property
+    def FileData(self):
+        return self.blob.text
 
 class CanSettings(models.Model):
     created = models.DateTimeField(auto_now_add=True)
@@ -24,9 +127,57 @@ class CanSettings(models.Model):
     channel = models.CharField(blank=False, max_length=100, validators=[validate_alpha])
     bitrate = models.IntegerField(blank=False, validators=[MinValueValidator(0)])
 
+    @classmethod
+    def current(cls):
+        """The settings row, or None if never set; cached, see CURRENT_TTL"""
+        return cached_current('settings', cls.objects.filter(pk=SETTINGS_ID).first)
+
+    @classmethod
+    def put(cls, **values):
+        """Insert or update the single settings row"""
+        with transaction.atomic():
+            settings, created = cls.objects.update_or_create(pk=SETTINGS_ID, defaults=values)
+        return settings
+
 class SelectedDBCFile(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     FileName = models.CharField(primary_key=True, max_length=100, blank=False)
-    FileData = models.TextField(blank=False)
\ No newline at end of file
+    blob = models.ForeignKey(DbcBlob, on_delete=models.PROTECT)
+
+    @property
+    def FileData(self):
+        return self.blob.text
+
+    @classmethod
+    def current(cls):
+        """The selected file with its blob, or None; cached, see CURRENT_TTL"""
+        return cached_current('selection', cls.objects.select_related('blob').first)
+
+    @classmethod
+    def select(cls, dbc_file):
+        """Make dbc_file the only selected file, writing nothing if it already is"""
+        current = cls.current()
+        if current is not None and current.FileName == dbc_file.FileName and current.blob_id == dbc_file.blob_id:
+            return current
+        with transaction.atomic():
+            cls.objects.exclude(FileName=dbc_file.FileName).delete()
+            selected, created = cls.objects.update_or_create(
+                FileName=dbc_file.FileName,
+                defaults={'blob_id': dbc_file.blob_id}
+            )
+        return selected
+
+
+@receiver([post_save, post_delete], sender=CanSettings)
+def _settings_changed(sender, **kwargs):
+    invalidate_current('settings')
+    # A concurrent request may have cached the old row before the commit
+    transaction.on_commit(lambda: invalidate_current('settings'))
+
+
+@receiver([post_save, post_delete], sender=SelectedDBCFile)
+def _selection_changed(sender, **kwargs):
+    invalidate_current('selection')
+    transaction.on_commit(lambda: invalidate_current('selection'))
\ No newline at end of file
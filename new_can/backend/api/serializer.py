@@ -3,6 +3,9 @@ from .models import DbcFile, CanSettings, SelectedDBCFile
 
 
 class DbcFileSerializer(serializers.ModelSerializer):
+    # Contents live in DbcBlob, so FileData is read only here
+    FileData = serializers.CharField(read_only=True)
+
     class Meta:
         model = DbcFile
         fields = ('FileName', 'FileData')
@@ -13,6 +16,8 @@ class CanSettingsSerializer(serializers.ModelSerializer):
         fields = ('bustype', 'channel', 'bitrate')
 
 class SelectedDBCFileSerializer(serializers.ModelSerializer):
+    FileData = serializers.CharField(read_only=True)
+
     class Meta:
         model = SelectedDBCFile
         fields = ('FileName', 'FileData')
\ No newline at end of file
@@ -1,3 +1,204 @@
+import json
+import time
+from unittest import mock
+
+import can
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+from canutils.aio import BusSender
+
+from . import views
+from . import models
+from .models import CanSettings, DbcBlob, DbcFile, SelectedDBCFile
+
+TEST_DBC = b'''VERSION ""
+
+NS_ :
+
+BS_:
+
+BU_: ECU
+
+BO_ 256 EngineStatus: 8 ECU
+ SG_ Rpm : 0|16@1+ (1,0) [0|65535] "rpm" Vector__XXX
+ SG_ Gear : 16|4@1+ (1,0) [0|15] "" Vector__XXX
+
+BO_ 512 Brake: 2 ECU
+ SG_ Pressure : 0|12@1+ (0.1,0) [0|409.5] "bar" Vector__XXX
+'''
+
+
+def dbc_upload(name='test.dbc', contents=TEST_DBC):
+    return SimpleUploadedFile(name, contents, content_type='application/octet-stream')
+
+
+class AsyncViewTests(TestCase):
+    """Upload, preview and transmit, served by the async views"""
+
+    async def test_read_file_previews_messages(self):
+        response = await self.async_client.post('/api/read/dbc', {'data': dbc_upload()})
+        self.assertEqual(response.status_code, 200)
+        messages = response.json()['response']
+        self.assertEqual(messages['256'], {'name': 'EngineStatus', 'signals': {'Rpm': 16, 'Gear': 4}})
+        self.assertEqual(messages['512'], {'name': 'Brake', 'signals': {'Pressure': 12}})
+
+    async def test_read_file_rejects_non_dbc(self):
+        response = await self.async_client.post('/api/read/dbc', {'data': dbc_upload(contents=b'hello\n')})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_upload_file_stores_summary(self):
+        response = await self.async_client.post('/api/upload/dbc', {'data': dbc_upload()})
+        self.assertEqual(response.status_code, 201)
+        dbc_file = await DbcFile.objects.select_related('blob').aget(FileName='test.dbc')
+        self.assertEqual((dbc_file.message_count, dbc_file.signal_count), (2, 3))
+        self.assertEqual(dbc_file.FileData, TEST_DBC.decode('utf-8'))
+
+        response = await self.async_client.post('/api/upload/dbc', {'data': dbc_upload()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['response'], 'Filename Already Exists')
+
+    async def test_upload_file_rejects_unparsable_dbc(self):
+        response = await self.async_client.post('/api/upload/dbc', {'data': dbc_upload(contents=b'BO_ nonsense')})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await DbcFile.objects.aexists())
+
+    async def test_send_can_message(self):
+        await self.async_client.post('/api/upload/dbc', {'data': dbc_upload()})
+        receiver = can.Bus(interface='virtual', channel='api-test')
+        bus = can.Bus(interface='virtual', channel='api-test')
+        sender = BusSender(bus)
+        for cleanup in (receiver.shutdown, bus.shutdown, sender.close):
+            self.addCleanup(cleanup)
+
+        body = {'file': 'test.dbc', 'name': 'EngineStatus', 'frame_id': 256, 'signals': {'Rpm': 1000, 'Gear': 3}}
+        with mock.patch.object(views, 'bus_sender', sender):
+            response = await self.async_client.post('/api/transmit', json.dumps(body),
+                                                    content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+
+            frame = receiver.recv(timeout=1)
+            self.assertEqual(frame.arbitration_id, 256)
+            self.assertEqual(bytes(frame.data[:3]), bytes((0xE8, 0x03, 0x03)))
+
+            body['signals']['Gear'] = 16
+            response = await self.async_client.post('/api/transmit', json.dumps(body),
+                                                    content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['response'], 'Gear value out of bounds')
+
+            body['file'] = 'missing.dbc'
+            response = await self.async_client.post('/api/transmit', json.dumps(body),
+                                                    content_type='application/json')
+            self.assertEqual(response.status_code, 404)
+
+    async def test_send_can_message_rejects_get(self):
+        response = await self.async_client.get('/api/transmit')
+        self.assertEqual(response.status_code, 405)
+
+
+class DbcListingTests(TestCase):
+    """Cursor pagination of /view/dbc"""
+
+    @classmethod
+    def setUpTestData(cls):
+        blob, text = DbcBlob.store([TEST_DBC])
+        DbcFile.objects.bulk_create([
+            DbcFile(FileName=f'file_{i}.dbc', blob=blob, message_count=2, signal_count=3, size=blob.size)
+            for i in range(5)
+        ])
+
+    def test_pages_follow_cursor(self):
+        names = []
+        query = '?limit=2'
+        while True:
+            body = self.client.get('/api/view/dbc' + query).json()
+            self.assertLessEqual(len(body['response']), 2)
+            names += body['response']
+            if body['next'] is None:
+                break
+            query = '?limit=2&cursor=' + body['next']
+        self.assertEqual(names, [f'file_{i}.dbc' for i in range(5)])
+
+    def test_summary(self):
+        body = self.client.get('/api/view/dbc?limit=1&summary=true').json()
+        [row] = body['response']
+        self.assertEqual((row['FileName'], row['message_count'], row['signal_count']), ('file_0.dbc', 2, 3))
+        self.assertIsNotNone(body['next'])
+
+    def test_invalid_limit_or_cursor(self):
+        for query in ('?limit=0', '?limit=-3', '?limit=many', '?cursor=abc'):
+            response = self.client.get('/api/view/dbc' + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertEqual(response.json()['response'], 'Invalid limit or cursor')
+
+
+class CurrentRowTests(TestCase):
+    """Cached settings and selection, as seen by this and other server processes"""
+
+    def setUp(self):
+        models.invalidate_current()
+        self.addCleanup(models.invalidate_current)
+
+    def test_settings_upsert(self):
+        self.assertIsNone(CanSettings.current())
+        CanSettings.put(bustype='virtual', channel='vcan0', bitrate=500000)
+        CanSettings.put(bustype='virtual', channel='vcan1', bitrate=500000)
+        self.assertEqual(CanSettings.objects.count(), 1)
+        self.assertEqual(CanSettings.current().channel, 'vcan1')
+
+    def test_write_by_another_process_seen_after_ttl(self):
+        CanSettings.put(bustype='virtual', channel='vcan0', bitrate=500000)
+        self.assertEqual(CanSettings.current().channel, 'vcan0')
+        # A queryset update sends no signals, like a write in another worker
+        CanSettings.objects.update(channel='vcan1')
+        self.assertEqual(CanSettings.current().channel, 'vcan0')
+        later = time.monotonic() + models.CURRENT_TTL
+        with mock.patch.object(models.time, 'monotonic', return_value=later):
+            self.assertEqual(CanSettings.current().channel, 'vcan1')
+
+    def test_select_replaces_selection(self):
+        blob, text = DbcBlob.store([TEST_DBC])
+        first = DbcFile.objects.create(FileName='first.dbc', blob=blob)
+        second = DbcFile.objects.create(FileName='second.dbc', blob=blob)
+        SelectedDBCFile.select(first)
+        self.assertEqual(SelectedDBCFile.current().FileName, 'first.dbc')
+        SelectedDBCFile.select(second)
+        self.assertEqual(SelectedDBCFile.current().FileName, 'second.dbc')
+        self.assertEqual(SelectedDBCFile.objects.count(), 1)
+
+
+class DbcStorageTests(TestCase):
+    """Blobs are written together with the file that points to them"""
+
+    def update(self, contents):
+        body = encode_multipart(BOUNDARY, {'data': dbc_upload(contents=contents)})
+        return self.client.patch('/api/upload/dbc/update', body, content_type=MULTIPART_CONTENT)
+
+    async def test_failed_upload_writes_nothing(self):
+        # An upload elsewhere that has stored its blob but not yet its file
+        other, text = await sync_to_async(DbcBlob.store)([TEST_DBC.replace(b'Brake', b'Parking')])
+        response = await self.async_client.post('/api/upload/dbc', {'data': dbc_upload(contents=b'BO_ nonsense')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([blob.sha256 async for blob in DbcBlob.objects.all()], [other.sha256])
+
+    def test_update_discards_only_the_replaced_blob(self):
+        old, text = DbcBlob.store([TEST_DBC])
+        DbcFile.objects.create(FileName='test.dbc', blob=old)
+        DbcFile.objects.create(FileName='copy.dbc', blob=old)
+        edited = TEST_DBC.replace(b'(1,0) [0|65535]', b'(2,0) [0|131070]')
+
+        response = self.update(edited)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['changes']['changed'][0]['changed_signals'], {'Rpm': ['scale', 'maximum']})
+        self.assertEqual(DbcFile.objects.get(FileName='test.dbc').FileData, edited.decode('utf-8'))
+        # Still used by copy.dbc
+        self.assertTrue(DbcBlob.objects.filter(pk=old.pk).exists())
 
-# Create your tests here.
+        DbcFile.objects.filter(FileName='copy.dbc').delete()
+        response = self.update(TEST_DBC)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(DbcBlob.objects.count(), 1)
+        self.assertEqual(DbcFile.objects.get(FileName='test.dbc').blob_id, old.pk)
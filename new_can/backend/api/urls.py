@@ -1,6 +1,5 @@
-from django.conf.urls import url
 from django.urls import path
-from can_server import views
+from . import views
 
 urlpatterns = [
     path('upload/dbc', views.upload_file),
@@ -11,5 +10,10 @@ urlpatterns = [
     path('transmit', views.send_can_message),
     path('change_can_settings', views.change_can_settings),
     path('get_can_settings', views.get_can_settings),
-    path('view/selected', views.get_current_file)
+    path('view/selected', views.get_current_file),
+    path('stats', views.post_bus_stats),
+    path('view/stats', views.get_bus_stats),
+    path('search/capture/<str:filename>', views.search_capture),
+    path('metrics', views.metrics_endpoint),
+    path('profile', views.profile)
 ]
\ No newline at end of file
@@ -1,4 +1,7 @@
-from django.http.response import JsonResponse
+from django.http.response import JsonResponse, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import parser_classes
 from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework import status
@@ -6,29 +9,219 @@ from rest_framework.decorators import api_view
 import cantools
 import can
 import json
+import base64
+import binascii
+import hashlib
 import logging
-
-from can_server.models import DbcFile, CanSettings, SelectedDBCFile
-from can_server.serializers import CanSettingsSerializer, DbcFileSerializer, SelectedDBCFileSerializer
+from django.core.cache import cache
+from django.conf import settings
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.db import transaction
+
+from canutils.trace_index import open_index
+from canutils import metrics
+from canutils import profiler
+from canutils.aio import Busy, BusSender, WorkPool
+from canutils import dbc_scan
+from canutils.dbc_diff import diff_databases
+
+from .models import DbcBlob, DbcFile, CanSettings, SelectedDBCFile, invalidate_current
+from .serializer import CanSettingsSerializer, DbcFileSerializer, SelectedDBCFileSerializer
+
+logger = logging.getLogger(__name__)
 
 ALREADY_EXISTS_ERROR = "dbc file with this FileName already exists."
-can_bus = can.interface.Bus('vcan0', bustype='socketcan')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SUMMARY_FIELDS = ('FileName', 'message_count', 'signal_count', 'size', 'updated')
 
-def contex
+# Parsed databases by blob hash; blobs are content addressed, so entries never go stale
+MAX_CACHED_DBCS = 8
+_dbc_cache = OrderedDict()
+_dbc_cache_lock = threading.Lock()
 
-@api_view(['POST'])
-@parser_classes([MultiPartParser])
-def upload_file(request):
-    # Get dbc file as bytes
-    file = request.FILES['data']
-    dbc_file_data = file.read()
-
-    # Django BinaryField is buggy so dbc file contents are stored as a TextField
-    db_input = {'FileName': file.name,
-                'FileData': dbc_file_data.decode('utf-8')}
-    dbc_serializer = DbcFileSerializer(data=db_input)
-    if dbc_serializer.is_valid():
-        dbc_serializer.save()
+BUS_SEND_TIME = metrics.histogram("can_bus_send_seconds", "Time to send one frame on the CAN bus")
+
+# Async views keep parsing and bus sends off the event loop
+work_pool = WorkPool(name='can-api')
+BUSY_RESPONSE = 'Server busy, try again later'
+
+
+def open_can_bus():
+    return can.interface.Bus(settings.CAN_BUS_CHANNEL, interface=settings.CAN_BUS_INTERFACE)
+
+
+# The bus is opened by the sender on the first transmit
+bus_sender = BusSender(open_bus=open_can_bus, send_time=BUS_SEND_TIME)
+
+
+def dbc_summary(blob, dbc_text):
+    # Stored alongside the file so listings never have to parse it
+    existing = DbcFile.objects.filter(blob_id=blob.sha256).values('message_count', 'signal_count', 'size').first()
+    if existing:
+        return existing
+    return parse_summary(blob, dbc_text)
+
+
+def parse_summary(blob, dbc_text):
+    # Parsing also caches the database for the first view of the file
+    dbc_file_db = load_dbc(blob, dbc_text)
+    return {
+        'message_count': len(dbc_file_db.messages),
+        'signal_count': sum(len(msg.signals) for msg in dbc_file_db.messages),
+        'size': blob.size
+    }
+
+
+def cached_dbc(sha256, get_text):
+    """Parsed cantools database for the contents with this hash, parsing each distinct file once
+
+    get_text() is only called when the database is not cached. Safe to
+    call from the work pool.
+    """
+    with _dbc_cache_lock:
+        db = _dbc_cache.get(sha256)
+        if db is not None:
+            _dbc_cache.move_to_end(sha256)
+            return db
+    db = cantools.database.load_string(get_text())
+    with _dbc_cache_lock:
+        _dbc_cache[sha256] = db
+        if len(_dbc_cache) > MAX_CACHED_DBCS:
+            _dbc_cache.popitem(last=False)
+    return db
+
+
+def load_dbc(blob, dbc_text=None):
+    # Pass dbc_text when the contents are at hand to skip decompressing them
+    return cached_dbc(blob.sha256, lambda: dbc_text if dbc_text is not None else blob.text)
+
+
+def describe_messages(dbc_file_db):
+    """{frame_id: {"name", "signals": {name: length}}} for a database's messages"""
+    can_message_dict = {}
+    for msg in dbc_file_db.messages:
+        can_message_dict[msg.frame_id] = {"name": msg.name, "signals": {}}
+        for sig in msg.signals:
+            can_message_dict[msg.frame_id]["signals"][sig.name] = sig.length
+    return can_message_dict
+
+
+def message_dict(blob):
+    return describe_messages(load_dbc(blob))
+
+
+def request_files(request):
+    # Parsing multipart bodies reads the spooled upload, so it runs in the work pool
+    return request.FILES
+
+
+def preview_file(file):
+    """Scan an upload line by line as its chunks are read
+
+    Only the BO_ and SG_ lines are looked at; the full parse happens later,
+    if at all. Returns the preview, the contents' hash and the chunks.
+    """
+    sha = hashlib.sha256()
+    chunks = []
+
+    def read():
+        for chunk in file.chunks():
+            sha.update(chunk)
+            chunks.append(chunk)
+            yield chunk
+
+    messages = dbc_scan.scan_dbc(dbc_scan.iter_lines(read()))
+    return dbc_scan.message_dict(messages), sha.hexdigest(), chunks
+
+
+def parse_preview(sha256, chunks):
+    # A previewed file is usually uploaded next, and blobs share its hash
+    cached_dbc(sha256, lambda: b''.join(chunks).decode('utf-8'))
+
+
+def encode_message(blob, msg_name, frame_id, signals):
+    """Check signal values against a message of a blob's DBC and build the frame
+
+    Raises ValueError with the reason when the request does not fit the message.
+    """
+    dbc_file_db = load_dbc(blob)
+
+    try:
+        msg = dbc_file_db.get_message_by_name(msg_name)
+    except KeyError as e:
+        raise ValueError("Message '{}' does not exist".format(msg_name))
+
+    if msg.frame_id != frame_id:
+        raise ValueError('Invalid frame id')
+
+    data = {}
+    for sig_name, sig_val in signals.items():
+        data[sig_name] = int(sig_val)
+
+    for signal in msg.signals:
+        # Checks whether a signal is missing the CAN message
+        if signal.name not in data:
+            raise ValueError("{} missing in request".format(signal.name))
+        # Checks whether the signal value is greater than its allowed length
+        if data[signal.name] >= (1 << signal.length):
+            raise ValueError("{} value out of bounds".format(signal.name))
+
+    try:
+        encoded_data = msg.encode(data)
+    except Exception as e:
+        raise ValueError(str(e))
+
+    return can.Message(arbitration_id=frame_id, data=encoded_data)
+
+
+def encode_cursor(filename):
+    return base64.urlsafe_b64encode(filename.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
+
+def save_upload(dbc_serializer, blob, summary):
+    # The blob and the file pointing to it are committed together
+    with transaction.atomic():
+        dbc_serializer.save(blob=blob.save_or_reuse(), **summary)
+
+
+@csrf_exempt
+@require_POST
+async def upload_file(request):
+    # Contents are streamed into compressed, content-addressed storage
+    try:
+        file = (await work_pool.run(request_files, request))['data']
+    except Busy as e:
+        return JsonResponse(
+            {'response': BUSY_RESPONSE},
+            status=503
+        )
+    dbc_serializer = DbcFileSerializer(data={'FileName': file.name})
+    if await sync_to_async(dbc_serializer.is_valid)():
+        # Nothing is written until the file has parsed
+        try:
+            blob, dbc_text = await work_pool.run(DbcBlob.read, file.chunks())
+            summary = await DbcFile.objects.filter(blob_id=blob.sha256).values('message_count', 'signal_count', 'size').afirst()
+            if summary is None:
+                summary = await work_pool.run(parse_summary, blob, dbc_text)
+        except Busy as e:
+            return JsonResponse(
+                {'response': BUSY_RESPONSE},
+                status=503
+            )
+        except Exception as e:
+            return JsonResponse(
+                {'response': 'Unable to parse DBC file'},
+                status=400
+            )
+        await sync_to_async(save_upload)(dbc_serializer, blob, summary)
     else:
         # Error occurs when an already existing file name is used
         # In the future this response will allow frontend to create confirmation message and update database
@@ -48,27 +241,26 @@ def upload_file(request):
     )
 
 
-@api_view(['POST'])
-@parser_classes([MultiPartParser])
-def read_file(request):
+@csrf_exempt
+@require_POST
+async def read_file(request):
     try:
-        file = request.FILES["data"]
-        dbc_file_data = file.read()
-        decoded = dbc_file_data.decode('utf-8')
-        dbc_file_db = cantools.database.load_string(decoded)
-        can_message_dict = {}
-        for msg in dbc_file_db.messages:
-            can_message_dict[msg.frame_id] = {"name": msg.name, "signals": {}}
-            for sig in msg.signals:
-                can_message_dict[msg.frame_id]["signals"][sig.name] = sig.length
+        file = (await work_pool.run(request_files, request))["data"]
+        can_message_dict, sha256, chunks = await work_pool.run(preview_file, file)
+        work_pool.background(parse_preview, sha256, chunks)
 
         return JsonResponse(
                     {'response': can_message_dict},
                     status=200
         )
+    except Busy as e:
+        return JsonResponse(
+            {'response': BUSY_RESPONSE},
+            status=503
+        )
     except Exception as e:
         return JsonResponse(
-            {'response': e},
+            {'response': str(e)},
             status=400
         )
 
@@ -76,37 +268,81 @@ def read_file(request):
 @api_view(['PATCH'])
 @parser_classes([MultiPartParser])
 def update_dbc_file(request):
-    # Get dbc file as bytesa\
     file = request.FILES['data']
-    dbc_file_data = file.read()
 
     try:
-        dbc_file = DbcFile.objects.get(FileName=file.name)
-        dbc_file.FileData = dbc_file_data.decode('utf-8')
-        dbc_file.save()
+        dbc_file = DbcFile.objects.select_related('blob').get(FileName=file.name)
+        blob, dbc_text = DbcBlob.read(file.chunks())
+        summary = dbc_summary(blob, dbc_text)
     except DbcFile.DoesNotExist as e:
         return JsonResponse(
             {'response': 'File does not exist'},
             status=404
         )
+    except Exception as e:
+        return JsonResponse(
+            {'response': 'Unable to parse DBC file'},
+            status=400
+        )
+
+    # Consumers can apply just these changes rather than reloading everything
+    try:
+        changes = diff_databases(load_dbc(dbc_file.blob), load_dbc(blob, dbc_text)).as_dict()
+    except Exception as e:
+        changes = None
+
+    old_blob = dbc_file.blob
+    for field, value in summary.items():
+        setattr(dbc_file, field, value)
+    with transaction.atomic():
+        dbc_file.blob = blob.save_or_reuse()
+        dbc_file.save()
+        # A selection of this file follows the new contents
+        SelectedDBCFile.objects.filter(FileName=dbc_file.FileName).update(blob=dbc_file.blob)
+    invalidate_current('selection')
+    # Only the contents this file used to point to, if nothing else shares them
+    old_blob.discard()
 
     return JsonResponse(
-                {'response': 'DBC File Updated Successfully'},
+                {'response': 'DBC File Updated Successfully', 'changes': changes},
                 status=201
             )    
 
 
+# example GET request: view/dbc?limit=50&summary=true&cursor=<next from previous page>
 @api_view(['GET'])
 def get_dbc_files(request):
-    dbc_files = DbcFile.objects.all()
-    dbc_file_serializer = DbcFileSerializer(dbc_files, many=True)
-    files_list = []
+    params = request.query_params
+    try:
+        limit = min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+        after = decode_cursor(params['cursor']) if 'cursor' in params else None
+    except (ValueError, binascii.Error) as e:
+        return JsonResponse(
+            {'response': 'Invalid limit or cursor'},
+            status=400
+        )
+    summary = params.get('summary', '').lower() in ('1', 'true', 'yes')
+
+    # Only the listed columns are fetched, FileData is never loaded
+    dbc_files = DbcFile.objects.order_by('FileName')
+    if after is not None:
+        dbc_files = dbc_files.filter(FileName__gt=after)
+    if summary:
+        files_list = list(dbc_files.values(*SUMMARY_FIELDS)[:limit + 1])
+    else:
+        files_list = list(dbc_files.values_list('FileName', flat=True)[:limit + 1])
+
+    # One extra row tells us whether there is another page
+    next_cursor = None
+    if len(files_list) > limit:
+        files_list = files_list[:limit]
+        last = files_list[-1]
+        next_cursor = encode_cursor(last['FileName'] if summary else last)
 
-    for entry in dbc_file_serializer.data:
-        db = cantools.database.load_string(entry['FileData'])
-        files_list.append(entry['FileName'])
     return JsonResponse(
-                {'response': files_list},
+                {'response': files_list, 'next': next_cursor},
                 status=200
             )
 
@@ -114,36 +350,18 @@ def get_dbc_files(request):
 @api_view(['GET'])
 def get_can_messages(request, filename):
     try:
-        dbc_file = DbcFile.objects.get(FileName=filename)
+        dbc_file = DbcFile.objects.select_related('blob').get(FileName=filename)
     except DbcFile.DoesNotExist as e:
         return JsonResponse(
             {'response': 'File does not exist'},
             status=404
         )
 
-    dbc_file_serializer = DbcFileSerializer(dbc_file)
-    dbc_file_db = cantools.database.load_string(dbc_file_serializer.data['FileData'])
-
-    can_message_dict = {}
-    for msg in dbc_file_db.messages:
-        can_message_dict[msg.frame_id] = {"name": msg.name, "signals": {}}
-        for sig in msg.signals:
-            can_message_dict[msg.frame_id]["signals"][sig.name] = sig.length
-
-    db_input = {
-        'FileName': dbc_file_serializer.data['FileName'],
-        'FileData': dbc_file_serializer.data['FileData']
-    }
-    selected_serializer = SelectedDBCFileSerializer(data=db_input)
+    can_message_dict = message_dict(dbc_file.blob)
 
-    if selected_serializer.is_valid():
-        SelectedDBCFile.objects.all().delete()
-        selected_serializer.save()
-    else:
-        return JsonResponse(
-            {'response': 'Unable to select file'},
-            status=404
-        )
+    # The selection only points at the stored contents, and is left alone
+    # when this file is already selected
+    SelectedDBCFile.select(dbc_file)
 
     return JsonResponse(
                 {'response': can_message_dict},
@@ -151,68 +369,50 @@ def get_can_messages(request, filename):
     )
 
 
-@api_view(['POST'])
-@parser_classes([JSONParser])
-def send_can_message(request):
-    data = {}
-    signals = request.data["signals"]
-    frame_id = int(request.data["frame_id"])
-    file = request.data["file"]
-    msg_name = request.data["name"]
+@csrf_exempt
+@require_POST
+async def send_can_message(request):
+    try:
+        request_data = json.loads(request.body)
+        signals = request_data["signals"]
+        frame_id = int(request_data["frame_id"])
+        file = request_data["file"]
+        msg_name = request_data["name"]
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse(
+            {'response': 'Invalid request'},
+            status=400
+        )
 
     try:
-        dbc_file = DbcFile.objects.get(FileName=file)
+        dbc_file = await DbcFile.objects.select_related('blob').aget(FileName=file)
     except DbcFile.DoesNotExist as e:
         return JsonResponse(
             {'response': 'File does not exist'},
             status=404
         )
-    dbc_file_serializer = DbcFileSerializer(dbc_file)
-    dbc_file_db = cantools.database.load_string(dbc_file_serializer.data['FileData'])
 
     try:
-        msg = dbc_file_db.get_message_by_name(msg_name)
-    except KeyError as e:
+        message = await work_pool.run(encode_message, dbc_file.blob, msg_name, frame_id, signals)
+        # Frames go out in order through the single sender task
+        await bus_sender.send(message)
+    except ValueError as e:
         return JsonResponse(
-            {'response': "Message '{}' does not exist".format(msg_name)},
+            {'response': str(e)},
             status=400
         )
-
-    if msg.frame_id != frame_id:
+    except Busy as e:
         return JsonResponse(
-            {'response': 'Invalid frame id'},
-            status=400
+            {'response': BUSY_RESPONSE},
+            status=503
         )
-
-    for sig_name, sig_val in signals.items():
-        data[sig_name] = int(sig_val)
-
-    for signal in msg.signals:
-        # Checks whether a signal is missing the CAN message
-        if signal.name not in data:
-            return JsonResponse(
-                {'response': "{} missing in request".format(signal.name)},
-                status=400
-            )
-        # Checks whether the signal value is greater than its allowed length
-        if data[signal.name] >= (1 << signal.length):
-            return JsonResponse(
-                {'response': "{} value out of bounds".format(signal.name)},
-                status=400
-            )
-
-    try:
-        encoded_data = msg.encode(data)
-    except Exception as e:
+    except (can.CanError, OSError) as e:
+        # OSError when the interface cannot be opened
         return JsonResponse(
-            {'response': str(e)},
-            status=400
+            {'response': 'Unable to send message: {}'.format(e)},
+            status=500
         )
 
-    message = can.Message(arbitration_id=frame_id, data=encoded_data)
-
-    can_bus.send(message)
-
     return JsonResponse(
             {'response': 'Message sent successfully'},
             status=201
@@ -222,12 +422,11 @@ def send_can_message(request):
 # example PUT request: {"bustype": "virtual", "channel":"vcan", "bitrate":"800000"}
 @api_view(['PUT'])
 def change_can_settings(request):
-    CanSettings.objects.all().delete()
     can_settings_data = request.data
     can_settings_serializer = CanSettingsSerializer(data=can_settings_data)
 
     if can_settings_serializer.is_valid():
-        can_settings_serializer.save()
+        CanSettings.put(**can_settings_serializer.validated_data)
     else:
         return JsonResponse(
             {'response': "An error occurred while saving CAN settings"},
@@ -244,7 +443,7 @@ def change_can_settings(request):
 def get_can_settings(request):
     # should only be one instance
     try:
-        settings = CanSettings.objects.all().first()
+        settings = CanSettings.current()
         if settings:
             settings_serializer = CanSettingsSerializer(settings)
             return JsonResponse(settings_serializer.data, status=200)
@@ -263,15 +462,138 @@ def get_can_settings(request):
 @api_view(['GET'])
 def get_current_file(request):
     # should only be one instance
-    selected_file = SelectedDBCFile.objects.all().first()
-    selected_dbc_string = SelectedDBCFileSerializer(selected_file).data['FileData']
+    selected_file = SelectedDBCFile.current()
+    if selected_file is None:
+        return JsonResponse(
+            {'response': 'No DBC file selected'},
+            status=404
+        )
 
-    dbc_file_db = cantools.database.load_string(selected_dbc_string)
+    return JsonResponse(message_dict(selected_file.blob), status=200)
 
-    can_message_dict = {}
-    for msg in dbc_file_db.messages:
-        can_message_dict[msg.frame_id] = {"name": msg.name, "signals": {}}
-        for sig in msg.signals:
-            can_message_dict[msg.frame_id]["signals"][sig.name] = sig.length
 
-    return JsonResponse(can_message_dict, status=200)
\ No newline at end of file
+# Bus statistics are pushed by the CAN reader and kept in the cache
+BUS_STATS_CACHE_KEY = "bus_stats"
+
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def post_bus_stats(request):
+    cache.set(BUS_STATS_CACHE_KEY, request.data, timeout=None)
+    return JsonResponse(
+        {'response': 'Statistics updated'},
+        status=200
+    )
+
+
+@api_view(['GET'])
+def get_bus_stats(request):
+    bus_stats = cache.get(BUS_STATS_CACHE_KEY)
+    if bus_stats is None:
+        return JsonResponse(
+            {'response': 'No statistics available'},
+            status=404
+        )
+
+    return JsonResponse(bus_stats, status=200)
+
+
+@api_view(['GET'])
+def search_capture(request, filename):
+    # example GET request: search/capture/run1.cap?id=0x1A0&signal=State&value=FAULT&start=1.5&end=9
+    capture_path = os.path.join(settings.CAPTURE_DIR, os.path.basename(filename))
+    if not os.path.exists(capture_path):
+        return JsonResponse(
+            {'response': 'Capture does not exist'},
+            status=404
+        )
+
+    # Choice names are resolved against the selected DBC file
+    selected_file = SelectedDBCFile.current()
+    db = load_dbc(selected_file.blob) if selected_file else None
+
+    params = request.query_params
+    try:
+        value = params.get('value')
+        if value is not None and value.lstrip('-').isdigit():
+            value = int(value)
+        index = open_index(capture_path, db)
+        offsets = index.query(
+            frame_id=int(params['id'], 16) if 'id' in params else None,
+            t_start=float(params['start']) if 'start' in params else None,
+            t_end=float(params['end']) if 'end' in params else None,
+            signal=params.get('signal'),
+            value=value,
+            limit=int(params.get('limit', 1000))
+        )
+    except (ValueError, KeyError) as e:
+        return JsonResponse(
+            {'response': str(e)},
+            status=400
+        )
+
+    return JsonResponse(
+        {'response': index.frames(offsets)},
+        status=200
+    )
+
+
+# Metrics pushed by the CAN reader process, exported alongside our own
+READER_METRICS_CACHE_KEY = "reader_metrics"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@api_view(['GET', 'POST'])
+@parser_classes([JSONParser])
+def metrics_endpoint(request):
+    if request.method == 'POST':
+        cache.set(READER_METRICS_CACHE_KEY, request.data, timeout=None)
+        return JsonResponse(
+            {'response': 'Metrics updated'},
+            status=200
+        )
+
+    sources = [({'process': 'backend'}, metrics.snapshot())]
+    reader_metrics = cache.get(READER_METRICS_CACHE_KEY)
+    if reader_metrics:
+        sources.append(({'process': 'reader'}, reader_metrics))
+    return HttpResponse(metrics.render_prometheus(sources), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+MAX_PROFILE_DURATION = 300
+
+# example POST request: {"duration": 10}
+@api_view(['GET', 'POST'])
+@parser_classes([JSONParser])
+def profile(request):
+    # Samples every thread of this server process, including request workers
+    if request.method == 'POST':
+        try:
+            duration = float(request.data.get('duration', 10))
+            interval = float(request.data.get('interval', profiler.DEFAULT_INTERVAL))
+        except (TypeError, ValueError) as e:
+            return JsonResponse(
+                {'response': 'Invalid duration or interval'},
+                status=400
+            )
+        if not 0 < duration <= MAX_PROFILE_DURATION or interval <= 0:
+            return JsonResponse(
+                {'response': f'Duration must be between 0 and {MAX_PROFILE_DURATION} seconds'},
+                status=400
+            )
+        prefix = profiler.output_prefix(settings.PROFILE_DIR, 'backend')
+        if not profiler.profile_for(duration, prefix, interval):
+            return JsonResponse(
+                {'response': 'Profiling already running'},
+                status=409
+            )
+        return JsonResponse(
+            {'response': 'Profiling started', 'output': prefix},
+            status=202
+        )
+
+    result = profiler.last_result()
+    return JsonResponse({
+        'running': profiler.is_running(),
+        'samples': result.samples if result else 0,
+        'files': list(result.paths) if result and result.paths else [],
+        'top': result.top(int(request.query_params.get('top', profiler.DEFAULT_TOP))) if result else []
+    }, status=200)
@@ -3,6 +3,15 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The CAN API is meant to be served from here, e.g.
+
+    uvicorn backend.asgi:application --host 0.0.0.0 --port 8000
+
+so that one process handles many GUI and automation clients: the async
+views (transmit, upload/dbc, read/dbc) wait on the database, the work pool
+and the bus sender task without holding a worker, and the remaining views
+run in Django's sync thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -10,11 +10,15 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared CAN helpers live in new_can/canutils next to the backend
+sys.path.insert(0, str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -38,7 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'api',
-    'djangorestframework'
+    'rest_framework'
 ]
 
 
@@ -51,6 +55,7 @@ CORS_ORIGIN_WHITELIST = (
 
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +84,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database
@@ -88,6 +94,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Wait for a writer instead of failing with "database is locked"
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -132,3 +140,15 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Bus used by the transmit endpoint, opened on the first transmit
+CAN_BUS_CHANNEL = 'vcan0'
+CAN_BUS_INTERFACE = 'socketcan'
+
+
+# Capture files recorded by the CAN reader
+CAPTURE_DIR = BASE_DIR / 'captures'
+
+# Output of the sampling profiler started from the /profile endpoint
+PROFILE_DIR = BASE_DIR / 'profiles'
@@ -15,9 +15,9 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
 urlpatterns = [
-    path('api/'. include('api.urls')),
+    path('api/', include('api.urls')),
     path('admin/', admin.site.urls),
 ]
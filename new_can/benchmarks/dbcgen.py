@@ -0,0 +1,90 @@
+# Synthetic DBC generator for benchmarks
+#
+# Produces valid DBC files of any size with a realistic mix of signals:
+# scaled and offset values, signed values, big endian signals and enums
+# (VAL_ tables), plus GenMsgCycleTime attributes so the statistics engine has
+# expected periods to check against.
+#
+#   python benchmarks/dbcgen.py large.dbc --messages 10000 --signals 8
+
+import argparse
+import random
+
+CHOICES = ["OFF", "ON", "STANDBY", "FAULT"]
+
+
+def _signal_line(name, start, length, big_endian, signed, scale, offset):
+    raw_max = (1 << (length - 1)) - 1 if signed else (1 << length) - 1
+    raw_min = -(1 << (length - 1)) if signed else 0
+    minimum = raw_min * scale + offset
+    maximum = raw_max * scale + offset
+    return (f' SG_ {name} : {start}|{length}@{0 if big_endian else 1}{"-" if signed else "+"} '
+            f'({scale:g},{offset:g}) [{minimum:g}|{maximum:g}] "" RX')
+
+
+def generate_dbc(messages=1000, signals_per_message=8, extended=False, scaled=True, seed=0):
+    """Return the text of a DBC with the given number of 8 byte messages
+
+    Signals are packed without overlap, so signals_per_message must divide
+    64. Every fourth signal is an enum and every third is big endian when it
+    is byte aligned. With scaled=False every signal has a scale of 1 and no
+    offset, so raw values are also valid physical values.
+    """
+    if 64 % signals_per_message:
+        raise ValueError("signals_per_message must divide 64")
+    rng = random.Random(seed)
+    length = 64 // signals_per_message
+
+    lines = ['VERSION ""', "", "NS_ :", "", "BS_:", "", "BU_: TX RX", ""]
+    attributes = []
+    value_tables = []
+    for m in range(messages):
+        frame_id = 0x100 + m
+        if extended:
+            frame_id = (0x18000000 + m) | 0x80000000
+        lines.append(f"BO_ {frame_id} MSG_{m:05d}: 8 TX")
+        for s in range(signals_per_message):
+            name = f"SIG_{m:05d}_{s:02d}"
+            is_enum = s % 4 == 3 and length >= 2
+            big_endian = s % 3 == 2 and length % 8 == 0
+            signed = not is_enum and s % 5 == 1
+            scale = rng.choice([1, 0.5, 0.1, 0.01]) if scaled and not is_enum else 1
+            offset = rng.choice([0, 0, -40, 100]) if scaled and not is_enum else 0
+            # Big endian start bits are the MSB in sawtooth numbering
+            start = s * length + 7 if big_endian else s * length
+            lines.append(_signal_line(name, start, length, big_endian, signed, scale, offset))
+            if is_enum:
+                count = min(len(CHOICES), 1 << length)
+                choices = " ".join(f'{value} "{CHOICES[value]}"' for value in range(count))
+                value_tables.append(f"VAL_ {frame_id} {name} {choices} ;")
+        lines.append("")
+        attributes.append(f'BA_ "GenMsgCycleTime" BO_ {frame_id} {rng.choice([10, 20, 50, 100, 1000])};')
+
+    lines.append('BA_DEF_ BO_ "GenMsgCycleTime" INT 0 65535;')
+    lines.append('BA_DEF_DEF_ "GenMsgCycleTime" 0;')
+    lines.extend(attributes)
+    lines.extend(value_tables)
+    lines.append("")
+    return "\n".join(lines)
+
+
+def write_dbc(path, messages=1000, signals_per_message=8, extended=False, scaled=True, seed=0):
+    with open(path, "w") as f:
+        f.write(generate_dbc(messages, signals_per_message, extended, scaled, seed))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DBC file")
+    parser.add_argument("path", help="output .dbc file")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--signals", type=int, default=8, help="signals per message (must divide 64)")
+    parser.add_argument("--extended", action="store_true", help="use 29-bit identifiers")
+    parser.add_argument("--unscaled", action="store_true", help="give every signal a scale of 1 and no offset")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+    write_dbc(options.path, options.messages, options.signals, options.extended, not options.unscaled, options.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# GUI startup benchmark
+#
+# Measures how long `import p` takes using `python -X importtime` and, when a
+# display is available, the time until the first CANApp window is drawn.
+# Results can be saved and compared against a previous run to catch
+# regressions, e.g.
+#
+#   python benchmarks/startup.py --save startup.json
+#   python benchmarks/startup.py --baseline startup.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+
+FIRST_WINDOW_SCRIPT = """
+import time
+start = time.perf_counter()
+import tkinter as tk
+import p
+root = tk.Tk()
+app = p.CANApp(root)
+root.update()
+print(time.perf_counter() - start)
+root.destroy()
+"""
+
+
+def _run(args):
+    # Run from a scratch directory so the app's log and settings files stay out of the tree
+    env = dict(os.environ, PYTHONPATH=FRONTEND_DIR)
+    with tempfile.TemporaryDirectory() as cwd:
+        return subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def measure_imports():
+    """Return the cumulative import time of p and its slowest imports, in ms"""
+    result = _run(["-X", "importtime", "-c", "import p"])
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    total = next(cumulative for name, _, cumulative in modules if name == "p")
+    slowest = sorted(modules, key=lambda m: m[1], reverse=True)[:10]
+    return total, [{"module": name, "self_ms": self_ms, "cumulative_ms": cumulative_ms}
+                   for name, self_ms, cumulative_ms in slowest]
+
+
+def measure_first_window():
+    """Return seconds until the first window is drawn, or None without a display"""
+    result = _run(["-c", FIRST_WINDOW_SCRIPT])
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI startup benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="number of runs to take the median of")
+    parser.add_argument("--save", help="write results to a JSON file")
+    parser.add_argument("--baseline", help="compare against a previously saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    options = parser.parse_args()
+
+    import_times = []
+    for _ in range(options.runs):
+        total, slowest = measure_imports()
+        import_times.append(total)
+    window_times = [t for t in (measure_first_window() for _ in range(options.runs)) if t is not None]
+
+    results = {
+        "import_ms": statistics.median(import_times),
+        "first_window_ms": statistics.median(window_times) * 1000 if window_times else None,
+        "slowest_imports": slowest,
+    }
+
+    print(f"import p:      {results['import_ms']:.1f} ms")
+    if results["first_window_ms"] is not None:
+        print(f"first window:  {results['first_window_ms']:.1f} ms")
+    else:
+        print("first window:  skipped (no display)")
+    print("slowest imports (self time):")
+    for entry in slowest:
+        print(f"  {entry['module']:40} {entry['self_ms']:8.1f} ms")
+
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressed = False
+        for key in ("import_ms", "first_window_ms"):
+            if results[key] is None or baseline.get(key) is None:
+                continue
+            if results[key] > baseline[key] * (1 + options.tolerance):
+                print(f"REGRESSION: {key} {results[key]:.1f} ms vs baseline {baseline[key]:.1f} ms")
+                regressed = True
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
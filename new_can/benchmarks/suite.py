@@ -0,0 +1,454 @@
+# Performance benchmark suite
+#
+# Runs a set of micro and end-to-end benchmarks against synthetic DBC files
+# from dbcgen.py and prints the results. Like startup.py, results can be
+# saved as JSON and compared against a previous release to catch
+# regressions, e.g.
+#
+#   python benchmarks/suite.py --save bench.json
+#   python benchmarks/suite.py --baseline bench.json --only decode simulator
+#
+# Benchmarks that need something unavailable (a display for the Tk
+# benchmarks, a working backend for the Django ones) are reported as skipped.
+#
+# Metric names end in their unit. Lower is better for times (_us, _ms) and
+# higher is better for rates (_per_s) and speedups (_x).
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+FRONTEND_DIR = os.path.join(ROOT_DIR, "frontend")
+BACKEND_DIR = os.path.join(ROOT_DIR, "backend")
+sys.path[:0] = [ROOT_DIR, FRONTEND_DIR, BENCHMARKS_DIR]
+
+import dbcgen
+from canutils import dbc_snapshot, dbc_scan
+from canutils.capture import CaptureWriter, extract_raw_values
+from canutils.delta import DeltaEncoder
+from canutils.parallel import DecodeStats, decode_capture
+
+
+class Skipped(Exception):
+    """Raised by a benchmark that cannot run in this environment"""
+
+
+def _best_of(runs, fn):
+    """Fastest of several timed runs of fn(), in seconds"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _load_db(workdir, messages, signals=8, scaled=True):
+    name = f"bench_{messages}_{signals}{'' if scaled else '_unscaled'}.dbc"
+    path = dbcgen.write_dbc(os.path.join(workdir, name), messages, signals, scaled=scaled)
+    return path, dbc_snapshot.load_file(path, use_snapshot=False)
+
+
+def _random_frames(db, count, seed=0):
+    rng = random.Random(seed)
+    messages = db.messages
+    frames = []
+    for _ in range(count):
+        msg = rng.choice(messages)
+        frames.append((msg.frame_id, bytes(rng.getrandbits(8) for _ in range(msg.length))))
+    return frames
+
+
+def _simulated_message(msg, rng):
+    """A message dict in the shape OfflineCANSimulator queues (unscaled DBCs only)"""
+    data = {signal.name: rng.randint(0, (1 << (signal.length - 1)) - 1) for signal in msg.signals}
+    encoded_data = msg.encode(data)
+    return {
+        "timestamp": str(time.strftime("%Y-%m-%d %H:%M:%S")) + ".000000",
+        "name": msg.name,
+        "sender": msg.senders[0] if msg.senders else "Unknown",
+        "arbitration_id": hex(msg.frame_id),
+        "dlc": len(encoded_data),
+        "hex": encoded_data.hex(),
+        "bin_data": "".join(format(byte, "08b") for byte in encoded_data),
+        "dec": int.from_bytes(encoded_data, byteorder="big", signed=False),
+        "decoded_data": data
+    }
+
+
+def bench_decode(options, workdir):
+    """cantools decode_message per frame vs the vectorized capture decoder"""
+    path, db = _load_db(workdir, options.messages)
+    frames = _random_frames(db, options.frames)
+
+    def cantools_decode():
+        for frame_id, data in frames:
+            db.decode_message(frame_id, data)
+
+    def cantools_decode_raw():
+        for frame_id, data in frames:
+            db.decode_message(frame_id, data, decode_choices=False, scaling=False)
+
+    # The vectorized decoder works on a batch of frames grouped by ID
+    ids = np.array([frame_id for frame_id, _ in frames], dtype=np.uint32)
+    payloads = np.frombuffer(b"".join(data for _, data in frames), dtype=np.uint8).reshape(-1, 8)
+    messages = {msg.frame_id: msg for msg in db.messages}
+
+    def vectorized_decode():
+        order = np.argsort(ids, kind="stable")
+        unique_ids, starts = np.unique(ids[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        for row, frame_id in enumerate(unique_ids):
+            data = payloads[order[bounds[row]:bounds[row + 1]]]
+            for signal in messages[int(frame_id)].signals:
+                extract_raw_values(data, signal) * signal.scale + signal.offset
+
+    count = len(frames)
+    return {
+        "cantools_decode_us": _best_of(options.runs, cantools_decode) / count * 1e6,
+        "cantools_decode_raw_us": _best_of(options.runs, cantools_decode_raw) / count * 1e6,
+        "vectorized_decode_us": _best_of(options.runs, vectorized_decode) / count * 1e6,
+    }
+
+
+def _periodic_frames(db, count, seed=0):
+    """Decoded frames shaped like vehicle traffic: cyclic IDs, mostly constant or slowly moving signals"""
+    rng = random.Random(seed)
+    messages = db.messages
+    # Per signal: 0 = constant, 1 = slow ramp, 2 = noisy
+    kinds = {(msg.frame_id, signal.name): rng.choices((0, 1, 2), (6, 3, 1))[0]
+             for msg in messages for signal in msg.signals}
+    frames = []
+    for i in range(count):
+        msg = messages[i % len(messages)]
+        cycle = i // len(messages)
+        decoded = {}
+        for signal in msg.signals:
+            kind = kinds[(msg.frame_id, signal.name)]
+            decoded[signal.name] = 0 if kind == 0 else cycle // 20 if kind == 1 else rng.randint(0, 3)
+        frames.append((msg.frame_id, msg.name, cycle * 0.01, decoded))
+    return frames
+
+
+def bench_delta(options, workdir):
+    """Signals passed on by the change-only stage for periodic traffic, and its cost"""
+    path, db = _load_db(workdir, min(options.messages, 200))
+    frames = _periodic_frames(db, options.frames)
+    encoder = DeltaEncoder()
+
+    def encode():
+        encoder.reset()
+        for frame_id, name, timestamp, decoded in frames:
+            encoder.changes(frame_id, decoded, name, timestamp)
+
+    changes_time = _best_of(options.runs, encode)
+    encoder.signals_in = encoder.signals_out = 0
+    encode()
+    return {
+        "delta_changes_us": changes_time / len(frames) * 1e6,
+        "signals_passed_percent": 100.0 * (1.0 - encoder.reduction),
+    }
+
+
+def bench_parallel_decode(options, workdir):
+    """canutils.parallel decode throughput and speedup over one worker, per worker count"""
+    path, db = _load_db(workdir, min(options.messages, 500))
+    capture_path = os.path.join(workdir, "parallel.cap")
+    if not os.path.exists(capture_path):
+        with CaptureWriter(capture_path) as writer:
+            for i, (frame_id, data) in enumerate(_random_frames(db, options.parallel_frames)):
+                writer.write(i * 0.0001, frame_id, data)
+
+    results = {}
+    baseline = None
+    for workers in options.workers:
+        for split in ("range", "id"):
+            stats = DecodeStats()
+            for _ in decode_capture(capture_path, path, workers, split, stats=stats):
+                pass
+            rate = stats.frames / stats.seconds
+            results[f"{split}_{workers}_workers_frames_per_s"] = rate
+            if split == "range":
+                baseline = baseline or rate
+                results[f"speedup_{workers}_workers_x"] = rate / baseline
+    return results
+
+
+def bench_simulator(options, workdir):
+    """Maximum frame rate of OfflineCANSimulator with no pacing delay"""
+    import p
+
+    # The simulator picks values from the raw range, so scaled signals would fail to encode
+    path, db = _load_db(workdir, options.messages, scaled=False)
+    simulator = p.OfflineCANSimulator(path)
+    simulator.start_simulation(frequency=1e9)
+    time.sleep(options.duration)
+    simulator.stop_simulation()
+    produced = simulator.message_queue.qsize()
+
+    drain_start = time.perf_counter()
+    simulator.get_messages()
+    drain_time = time.perf_counter() - drain_start
+
+    return {
+        "simulated_frames_per_s": produced / options.duration,
+        "queue_drain_us": drain_time / max(produced, 1) * 1e6,
+    }
+
+
+def bench_update_ui(options, workdir):
+    """CANApp._update_ui with N new messages per tick on a headless Tk"""
+    import tkinter as tk
+    import p
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        raise Skipped(f"no display ({e})")
+    root.withdraw()
+
+    results = {}
+    try:
+        app = p.CANApp(root)
+        root.after_cancel(app.update_timer_id)
+        root.after_cancel(app.stats_timer_id)
+        path, db = _load_db(workdir, options.messages, scaled=False)
+        app.simulator.load_db(path)
+
+        rng = random.Random(0)
+        for per_tick in options.per_tick:
+            ticks = []
+            for _ in range(options.runs):
+                batch = [_simulated_message(rng.choice(db.messages), rng) for _ in range(per_tick)]
+                for message in batch:
+                    app.simulator.queue_message(message)
+                start = time.perf_counter()
+                app._update_ui()
+                root.update_idletasks()
+                ticks.append(time.perf_counter() - start)
+            results[f"update_ui_{per_tick}_per_tick_ms"] = statistics.median(ticks) * 1000
+        app.settings_manager.flush()
+    finally:
+        root.destroy()
+    return results
+
+
+_django_error = None
+_django_ready = False
+
+def _setup_django(workdir):
+    """Configure the backend against a scratch SQLite database"""
+    global _django_error, _django_ready
+    if _django_error:
+        raise Skipped(_django_error)
+    if _django_ready:
+        return
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    try:
+        import django
+        from django.conf import settings
+        settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+        django.setup()
+        from django.core.management import call_command
+        call_command("migrate", verbosity=0)
+    except Exception as e:
+        # django.setup() cannot be retried, so remember why it failed
+        _django_error = f"backend unavailable ({e})"
+        raise Skipped(_django_error)
+    _django_ready = True
+
+
+def bench_dbc_preview(options, workdir):
+    """Full cantools parse vs the BO_/SG_ scanner used for DBC previews"""
+    import cantools
+
+    results = {}
+    for messages in options.preview_messages:
+        # Extended IDs, since a 10k message DBC does not fit 11-bit IDs
+        text = dbcgen.generate_dbc(messages, extended=True)
+        data = text.encode("utf-8")
+        # A full parse of a large DBC takes seconds, so fewer runs of it
+        parse = _best_of(min(options.runs, 2), lambda: cantools.database.load_string(text))
+        scan = _best_of(options.runs, lambda: dbc_scan.message_dict(dbc_scan.scan_text(data)))
+        results[f"cantools_load_{messages}_ms"] = parse * 1000
+        results[f"scan_{messages}_ms"] = scan * 1000
+        results[f"scan_{messages}_speedup_x"] = parse / scan
+    return results
+
+
+def _backend_views():
+    try:
+        from api import views
+    except Exception as e:
+        raise Skipped(f"backend views unavailable ({e})")
+    return views
+
+
+def bench_send_can_message(options, workdir):
+    """Latency of the /transmit view, sending on a virtual bus, alone and under concurrent requests"""
+    import asyncio
+    import can
+
+    _setup_django(workdir)
+    views = _backend_views()
+    from django.test import RequestFactory
+    from api.models import DbcBlob, DbcFile
+    from canutils.aio import BusSender
+
+    path, db = _load_db(workdir, options.messages)
+    with open(path, "rb") as f:
+        blob, text = DbcBlob.store(iter(lambda: f.read(1 << 16), b""))
+    DbcFile.objects.update_or_create(FileName="bench.dbc", defaults={"blob": blob})
+
+    views.bus_sender = BusSender(can.Bus(interface="virtual", channel="bench"), send_time=views.BUS_SEND_TIME)
+    msg = db.messages[len(db.messages) // 2]
+    body = json.dumps({
+        "frame_id": msg.frame_id,
+        "name": msg.name,
+        "file": "bench.dbc",
+        "signals": {signal.name: max(1, int(signal.minimum or 0)) for signal in msg.signals}
+    })
+    factory = RequestFactory()
+
+    async def send():
+        response = await views.send_can_message(factory.post("/transmit", body, content_type="application/json"))
+        assert response.status_code == 201, response.content
+
+    async def measure():
+        await send()
+        latencies = []
+        for _ in range(options.requests):
+            start = time.perf_counter()
+            await send()
+            latencies.append(time.perf_counter() - start)
+        # All requests at once, as from many clients
+        start = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(options.requests)))
+        return latencies, time.perf_counter() - start
+
+    latencies, concurrent = asyncio.run(measure())
+    return {
+        "send_can_message_median_ms": statistics.median(latencies) * 1000,
+        "send_can_message_p95_ms": sorted(latencies)[int(len(latencies) * 0.95)] * 1000,
+        "send_can_message_concurrent_per_s": options.requests / concurrent,
+    }
+
+
+def bench_get_dbc_files(options, workdir):
+    """Latency of /view/dbc as the DBC library grows"""
+    _setup_django(workdir)
+    views = _backend_views()
+    from django.test import RequestFactory
+    from api.models import DbcBlob, DbcFile
+
+    path, db = _load_db(workdir, 100)
+    with open(path, "rb") as f:
+        blob, text = DbcBlob.store(iter(lambda: f.read(1 << 16), b""))
+    factory = RequestFactory()
+
+    results = {}
+    for size in options.library_sizes:
+        DbcFile.objects.all().delete()
+        DbcFile.objects.bulk_create([
+            DbcFile(FileName=f"lib_{i:06d}.dbc", blob=blob, message_count=100, signal_count=800, size=blob.size)
+            for i in range(size)
+        ])
+        for query in ("", "?summary=true"):
+            def list_files():
+                response = views.get_dbc_files(factory.get("/view/dbc" + query))
+                assert response.status_code == 200, response.content
+            name = "get_dbc_files_summary" if query else "get_dbc_files"
+            results[f"{name}_{size}_ms"] = _best_of(options.runs, list_files) * 1000
+    return results
+
+
+BENCHMARKS = {
+    "decode": bench_decode,
+    "delta": bench_delta,
+    "parallel_decode": bench_parallel_decode,
+    "dbc_preview": bench_dbc_preview,
+    "simulator": bench_simulator,
+    "update_ui": bench_update_ui,
+    "send_can_message": bench_send_can_message,
+    "get_dbc_files": bench_get_dbc_files,
+}
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression descriptions against a baseline"""
+    regressions = []
+    for name, metrics in results.items():
+        for key, value in (metrics or {}).items():
+            old = (baseline.get(name) or {}).get(key)
+            if old is None or value is None:
+                continue
+            if key.endswith(("_per_s", "_x")):
+                regressed = value < old * (1 - tolerance)
+            else:
+                regressed = value > old * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{name}.{key}: {value:.3f} vs baseline {old:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmark suite")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--messages", type=int, default=2000, help="messages in the synthetic DBC")
+    parser.add_argument("--frames", type=int, default=50000, help="frames to decode")
+    parser.add_argument("--parallel-frames", type=int, default=500000, help="frames in the parallel decode capture")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                        help="worker counts for the parallel decode benchmark")
+    parser.add_argument("--preview-messages", type=int, nargs="+", default=[1000, 10000],
+                        help="messages in the DBCs previewed by the dbc_preview benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="repetitions per measurement")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds to run the simulator for")
+    parser.add_argument("--per-tick", type=int, nargs="+", default=[10, 100, 1000], help="messages per UI tick")
+    parser.add_argument("--requests", type=int, default=200, help="requests per backend latency measurement")
+    parser.add_argument("--library-sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--save", help="write results to a JSON file")
+    parser.add_argument("--baseline", help="compare against a previously saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    options = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # The app writes its log, settings and DBC library to the working directory
+        os.chdir(workdir)
+        for name in options.only or BENCHMARKS:
+            try:
+                results[name] = BENCHMARKS[name](options, workdir)
+            except Skipped as e:
+                results[name] = None
+                print(f"{name}: skipped, {e}")
+                continue
+            for key, value in results[name].items():
+                print(f"{name}.{key:40} {value:12.3f}")
+        os.chdir(cwd)
+
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# Helpers for async (ASGI) views
+#
+# Under ASGI one event loop serves every client, so nothing blocking may run
+# on it. Two helpers keep blocking work off the loop:
+#
+#   WorkPool   a bounded thread pool for parsing and encoding. At most
+#              max_pending jobs are queued or running; past that run() raises
+#              Busy straight away, so an overloaded server sheds requests
+#              (503) instead of queueing them without limit.
+#
+#   BusSender  a single sender task per event loop that owns the python-can
+#              bus. send() queues a frame and waits until the bus has taken
+#              it; the task sends queued frames in batches from one dedicated
+#              thread, so frames go out in request order and concurrent
+#              requests never call bus.send() at the same time. The bus can
+#              be opened on the first send, so importing the views does not
+#              need the CAN interface to exist.
+#
+# Parsing in threads still holds the GIL, so it does not make cantools
+# faster; it keeps the loop free to answer other clients while it runs.
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Jobs queued or running before run() starts turning requests away
+DEFAULT_MAX_PENDING = 256
+DEFAULT_SEND_QUEUE = 1024
+# Frames handed to the sender thread at once
+MAX_SEND_BATCH = 64
+
+
+class Busy(Exception):
+    """Raised when a WorkPool or BusSender has no room for more work"""
+
+
+class WorkPool:
+    """Runs blocking functions in a bounded thread pool from async code"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, name="work"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool and return its result, or raise Busy if the pool is full"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Busy(f"{self.pending} jobs already pending")
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def background(self, fn, *args):
+        """Start fn(*args) without waiting for it, only if a worker is idle
+
+        For work that can be skipped, like warming a cache; returns whether
+        it was started. Errors are left in the discarded future.
+        """
+        with self._lock:
+            if self.pending >= self.workers:
+                return False
+            self.pending += 1
+        self._executor.submit(fn, *args).add_done_callback(self._done)
+        return True
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BusSender:
+    """Sends frames on a python-can bus from a dedicated task and thread
+
+    Pass either a python-can bus, or open_bus, a function that opens one in
+    the sender thread when the first frame is sent (and again after opening
+    failed). Pass a metrics histogram as send_time to record how long each
+    frame takes on the bus.
+    """
+
+    def __init__(self, bus=None, max_queue=DEFAULT_SEND_QUEUE, send_time=None, open_bus=None):
+        self.bus = bus
+        self._open_bus = open_bus
+        self.max_queue = max_queue
+        self.send_time = send_time
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="can-send")
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self.sent = 0
+        self.errors = 0
+        self.rejected = 0
+
+    @property
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task.done():
+            # First use, or a new loop (development servers run each async
+            # view in a loop of its own)
+            self._loop = loop
+            self._queue = asyncio.Queue(self.max_queue)
+            self._task = loop.create_task(self._run())
+
+    async def send(self, message):
+        """Queue a python-can Message and wait until it is on the bus
+
+        Raises Busy if the queue is full and re-raises errors from bus.send().
+        """
+        self._start()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((message, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Busy(f"{self.max_queue} frames already queued")
+        await future
+
+    async def _run(self):
+        queue = self._queue
+        loop = self._loop
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < MAX_SEND_BATCH and not queue.empty():
+                batch.append(queue.get_nowait())
+            errors = await loop.run_in_executor(self._executor, self._send_batch,
+                                                [message for message, future in batch])
+            for (message, future), error in zip(batch, errors):
+                # The request may have gone away (client disconnected)
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def _send_batch(self, messages):
+        errors = []
+        for message in messages:
+            try:
+                if self.bus is None:
+                    self.bus = self._open_bus()
+                if self.send_time is not None:
+                    with self.send_time.time():
+                        self.bus.send(message)
+                else:
+                    self.bus.send(message)
+            except Exception as e:
+                self.errors += 1
+                errors.append(e)
+            else:
+                self.sent += 1
+                errors.append(None)
+        return errors
+
+    def close(self):
+        if self._task is not None and not self._task.done():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,165 @@
+# Non-blocking, rate limited logging
+#
+# setup_logging() replaces logging.basicConfig(): records go onto a bounded
+# queue and a QueueListener thread formats and writes them, so slow stdout
+# or disk I/O never stalls the thread that logged. When the queue is full
+# records are dropped (and counted) rather than blocking.
+#
+# Repeated records are rate limited per key before they are queued. The key
+# is the record's `rate_key` extra if given, otherwise its logger, level and
+# message template. The first record for a key in each interval is logged,
+# the rest are counted and summarised once the interval is over, e.g.
+#
+#   logger.error("Error decoding %s: %s", hex(frame_id), e, extra={"rate_key": hex(frame_id)})
+#   ... 41 more errors for 0x123 in the last 1.0s: Error decoding 0x123: ...
+#
+# Records logged with extra={"rate_key": False} are never rate limited.
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_INTERVAL = 1.0
+
+
+class RateLimitedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops when full and aggregates repeated records"""
+
+    def __init__(self, log_queue, interval=DEFAULT_INTERVAL):
+        super().__init__(log_queue)
+        self.interval = interval
+        self.dropped = 0
+        # key -> [window start, suppressed count, last suppressed record]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _key(self, record):
+        key = getattr(record, "rate_key", None)
+        if key is not None:
+            return key
+        return (record.name, record.levelno, record.msg)
+
+    def emit(self, record):
+        if self.interval and getattr(record, "rate_key", None) is not False:
+            key = self._key(record)
+            now = time.monotonic()
+            with self._lock:
+                window = self._windows.get(key)
+                if window is not None and now - window[0] < self.interval:
+                    window[1] += 1
+                    window[2] = record
+                    return
+                self._windows[key] = [now, 0, None]
+            if window is not None and window[1]:
+                self._emit_summary(key, window, now)
+        super().emit(record)
+
+    def _emit_summary(self, key, window, now):
+        count, record = window[1], window[2]
+        what = f"{logging.getLevelName(record.levelno).lower()}s"
+        target = f" for {key}" if getattr(record, "rate_key", None) is not None else ""
+        summary = logging.LogRecord(
+            record.name, record.levelno, record.pathname, record.lineno,
+            "%d more %s%s in the last %.1fs: %s", (count, what, target, now - window[0], record.getMessage()),
+            None
+        )
+        super().emit(summary)
+
+    def flush_suppressed(self, force=False):
+        """Summarise keys whose interval has ended (or all, with force) and forget idle ones"""
+        now = time.monotonic()
+        finished = []
+        with self._lock:
+            for key, window in list(self._windows.items()):
+                if force or now - window[0] >= self.interval:
+                    del self._windows[key]
+                    if window[1]:
+                        finished.append((key, window))
+        for key, window in finished:
+            self._emit_summary(key, window, now)
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread; only copy the record so
+        # later changes by other handlers don't leak into the queued one
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+_flush_timer = None
+
+
+def _schedule_flush():
+    global _flush_timer
+    _handler.flush_suppressed()
+    _flush_timer = threading.Timer(_handler.interval, _schedule_flush)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+
+def setup_logging(level=logging.INFO, filename=None, stream=None, fmt=DEFAULT_FORMAT,
+                  interval=DEFAULT_INTERVAL, queue_size=DEFAULT_QUEUE_SIZE):
+    """Route the root logger through a queue to a file and/or stream
+
+    Returns the queue handler. Calling it again replaces the previous setup.
+    """
+    global _listener, _handler
+    shutdown()
+
+    handlers = []
+    if filename:
+        handlers.append(logging.FileHandler(filename))
+    if stream is not None or not filename:
+        handlers.append(logging.StreamHandler(stream))
+    formatter = logging.Formatter(fmt)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _handler = RateLimitedQueueHandler(queue.Queue(queue_size), interval)
+    _listener = logging.handlers.QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_handler)
+    if interval:
+        _schedule_flush()
+    return _handler
+
+
+def shutdown():
+    """Summarise suppressed records, drain the queue and stop the listener"""
+    global _listener, _handler, _flush_timer
+    if _flush_timer is not None:
+        _flush_timer.cancel()
+        _flush_timer = None
+    if _handler is not None:
+        _handler.flush_suppressed(force=True)
+        logging.getLogger().removeHandler(_handler)
+        if _handler.dropped:
+            # The listener still runs, so this is the last record it writes
+            _handler.queue.put(logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "Dropped %d log records because the log queue was full", (_handler.dropped,), None
+            ))
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
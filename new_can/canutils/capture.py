@@ -0,0 +1,211 @@
+# Binary capture files of raw CAN frames
+#
+# A capture is a 24 byte header followed by fixed-size 24 byte records, so a
+# frame's offset is simply its index and the whole file can be memory mapped
+# as a NumPy structured array.
+
+import os
+import queue
+import threading
+
+import numpy as np
+
+MAGIC = b"CANCAP01"
+HEADER_SIZE = 24
+
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+
+# Full chunks a background writer may fall behind by before write() blocks
+MAX_PENDING_CHUNKS = 64
+
+FRAME_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("arbitration_id", "<u4"),
+    ("dlc", "u1"),
+    ("flags", "u1"),
+    ("reserved", "<u2"),
+    ("data", "u1", (8,)),
+])
+
+
+def data_as_uint64(data, byteorder="little"):
+    """View an (N, 8) uint8 payload array as N unsigned 64-bit integers"""
+    data = np.ascontiguousarray(data, dtype=np.uint8)
+    return data.view("<u8" if byteorder == "little" else ">u8").reshape(-1).astype(np.uint64)
+
+
+def extract_raw_values(data, signal):
+    """Vectorized raw (unscaled) values of a cantools signal from (N, 8) payloads"""
+    mask = np.uint64((1 << signal.length) - 1)
+    if signal.byte_order == "little_endian":
+        raw = (data_as_uint64(data, "little") >> np.uint64(signal.start)) & mask
+    else:
+        # cantools numbers big endian start bits from the MSB in sawtooth order
+        msb = (signal.start // 8) * 8 + (7 - signal.start % 8)
+        shift = 64 - (msb + signal.length)
+        raw = (data_as_uint64(data, "big") >> np.uint64(shift)) & mask
+    raw = raw.astype(np.int64)
+    if signal.is_signed:
+        sign_bit = 1 << (signal.length - 1)
+        raw = np.where(raw & sign_bit, raw - (1 << signal.length), raw)
+    return raw
+
+
+class CaptureWriter:
+    """Appends frames to a capture file in chunks
+
+    With background=True full chunks are handed to a writer thread, so the
+    thread calling write() never waits on disk I/O unless the writer falls
+    MAX_PENDING_CHUNKS chunks behind.
+
+    With changes_only=True a frame is skipped when its payload equals the
+    last one recorded for the same ID, so a capture of mostly periodic
+    traffic holds only the frames where something changed. Every signal
+    keeps its value until the next recorded frame of its ID; with refresh
+    set an unchanged frame is still recorded once that many seconds have
+    passed, so a sender going silent shows up as a gap.
+    """
+
+    def __init__(self, path, chunk_size=4096, background=False, changes_only=False, refresh=None):
+        self.path = path
+        self.changes_only = changes_only
+        self.refresh = refresh
+        # (arbitration_id, flags) -> [last recorded payload, its timestamp]
+        self._last = {}
+        self.skipped = 0
+        self._chunk_size = chunk_size
+        self._buffer = np.zeros(chunk_size, dtype=FRAME_DTYPE)
+        self._pending = 0
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new_file:
+            self._file.write(MAGIC.ljust(HEADER_SIZE, b"\0"))
+
+        self._chunks = None
+        self._writer = None
+        if background:
+            self._chunks = queue.Queue(MAX_PENDING_CHUNKS)
+            self._writer = threading.Thread(target=self._write_chunks, daemon=True)
+            self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, timestamp, arbitration_id, data, is_extended=False, is_remote=False, is_error=False):
+        """Buffer a frame, writing the chunk out once it is full"""
+        flags = (FLAG_EXTENDED if is_extended else 0) | \
+                (FLAG_REMOTE if is_remote else 0) | \
+                (FLAG_ERROR if is_error else 0)
+        if self.changes_only:
+            payload = bytes(data)
+            last = self._last.get((arbitration_id, flags))
+            if last is not None and last[0] == payload and \
+                    (self.refresh is None or timestamp - last[1] < self.refresh):
+                self.skipped += 1
+                return
+            self._last[(arbitration_id, flags)] = [payload, timestamp]
+        record = self._buffer[self._pending]
+        record["timestamp"] = timestamp
+        record["arbitration_id"] = arbitration_id
+        record["dlc"] = len(data)
+        record["flags"] = flags
+        payload = bytes(data[:8]).ljust(8, b"\0")
+        record["data"] = np.frombuffer(payload, dtype=np.uint8)
+        self._pending += 1
+        if self._pending == len(self._buffer):
+            self._write_buffer()
+
+    def write_message(self, message):
+        """Write a python-can Message"""
+        self.write(
+            message.timestamp,
+            message.arbitration_id,
+            message.data,
+            message.is_extended_id,
+            message.is_remote_frame,
+            message.is_error_frame
+        )
+
+    def _write_buffer(self):
+        if not self._pending:
+            return
+        if self._writer is None:
+            self._file.write(self._buffer[:self._pending].tobytes())
+        else:
+            # Hand the filled buffer over and start a fresh one
+            self._chunks.put(self._buffer[:self._pending])
+            self._buffer = np.zeros(self._chunk_size, dtype=FRAME_DTYPE)
+        self._pending = 0
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._chunks.get()
+            if isinstance(chunk, threading.Event):
+                self._file.flush()
+                chunk.set()
+            elif chunk is None:
+                return
+            else:
+                self._file.write(chunk.tobytes())
+
+    def flush(self):
+        """Write out buffered frames and wait until they reach the file"""
+        self._write_buffer()
+        if self._writer is None:
+            self._file.flush()
+        else:
+            done = threading.Event()
+            self._chunks.put(done)
+            done.wait()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            if self._writer is not None:
+                self._chunks.put(None)
+                self._writer.join()
+                self._writer = None
+            self._file.close()
+
+
+class CaptureReader:
+    """Read-only memory mapped view of a capture file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a capture file")
+        count = (os.path.getsize(path) - HEADER_SIZE) // FRAME_DTYPE.itemsize
+        if count:
+            self.frames = np.memmap(path, dtype=FRAME_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.frames = np.zeros(0, dtype=FRAME_DTYPE)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def timestamps(self):
+        return self.frames["timestamp"]
+
+    @property
+    def arbitration_ids(self):
+        return self.frames["arbitration_id"]
+
+    def frame_dict(self, offset):
+        """Return one frame in the same shape as the reader's message dicts"""
+        frame = self.frames[offset]
+        data = bytes(frame["data"][:frame["dlc"]])
+        return {
+            "offset": int(offset),
+            "timestamp": float(frame["timestamp"]),
+            "arbitration_id": hex(int(frame["arbitration_id"])),
+            "dlc": int(frame["dlc"]),
+            "hex": data.hex(),
+        }
@@ -0,0 +1,363 @@
+# Differences between two versions of a DBC
+#
+# diff_databases() compares two cantools databases (or message lists)
+# message by message, keyed by arbitration ID, and reports the messages that
+# were added, removed or changed. A changed message lists the message
+# attributes that differ and which of its signals were added, removed or
+# redefined, field by field.
+#
+# Live consumers use a diff to reload incrementally: DecodeRouter.
+# replace_database() swaps in only the added and changed messages, so
+# decoders of everything else stay in place. DbcWatcher notices DBC files
+# changing on disk.
+#
+# Parsing a large DBC, and pickling or unpickling a whole database, hold the
+# GIL for hundreds of milliseconds at a time, which would stall a live
+# pipeline even from a worker thread. A DbcReloader does the parse in a
+# worker process that remembers a signature of every message it has seen,
+# so only the added and changed messages are sent back.
+#
+# The worker is a fresh interpreter that takes requests as pickles on its
+# stdin. A forked worker would inherit the caller's threads and locks
+# mid-operation. multiprocessing's spawn and forkserver workers would import
+# the calling script again, and the reader script does all its setup at
+# module level.
+#
+#   python -m canutils.dbc_diff old.dbc new.dbc [--json]
+
+import argparse
+import json
+import operator
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import threading
+
+MESSAGE_FIELDS = ("name", "length", "is_extended_frame", "senders", "cycle_time", "protocol")
+SIGNAL_FIELDS = ("start", "length", "byte_order", "is_signed", "scale", "offset", "minimum", "maximum",
+                 "unit", "choices", "is_multiplexer", "multiplexer_ids", "multiplexer_signal", "receivers")
+# Fields that do not affect how a frame decodes
+DESCRIPTIVE_FIELDS = frozenset(("senders", "cycle_time", "minimum", "maximum", "unit", "receivers"))
+
+# Whole definitions are compared as tuples first; most messages of a
+# reloaded DBC are unchanged and never need a field by field comparison
+_message_signature = operator.attrgetter(*MESSAGE_FIELDS)
+_signal_signature = operator.attrgetter("name", *SIGNAL_FIELDS)
+
+
+def _messages(db):
+    if db is None:
+        return []
+    return db.messages if hasattr(db, "messages") else list(db)
+
+
+def _key(msg):
+    return msg.frame_id, msg.is_extended_frame
+
+
+def _field(obj, field):
+    value = getattr(obj, field, None)
+    if field == "choices" and value:
+        # Choice values are objects; compare them by their names
+        return {int(raw): str(name) for raw, name in value.items()}
+    if isinstance(value, list):
+        return sorted(value)
+    return value
+
+
+def _changed_fields(old, new, fields):
+    return [field for field in fields if _field(old, field) != _field(new, field)]
+
+
+class MessageChange:
+    """A message present in both versions that is defined differently"""
+
+    def __init__(self, old, new, fields, added_signals, removed_signals, changed_signals):
+        self.old = old
+        self.new = new
+        # Message attributes that changed
+        self.fields = fields
+        self.added_signals = added_signals
+        self.removed_signals = removed_signals
+        # Signal name -> fields that changed
+        self.changed_signals = changed_signals
+
+    @property
+    def frame_id(self):
+        return self.new.frame_id
+
+    @property
+    def affects_decoding(self):
+        """False when only descriptive attributes (senders, cycle time, units, ranges) changed"""
+        if self.added_signals or self.removed_signals:
+            return True
+        if any(field not in DESCRIPTIVE_FIELDS for field in self.fields):
+            return True
+        return any(field not in DESCRIPTIVE_FIELDS
+                   for fields in self.changed_signals.values() for field in fields)
+
+    def as_dict(self):
+        return {
+            "frame_id": self.frame_id,
+            "name": self.new.name,
+            "old_name": self.old.name,
+            "fields": self.fields,
+            "added_signals": self.added_signals,
+            "removed_signals": self.removed_signals,
+            "changed_signals": self.changed_signals,
+        }
+
+    def __str__(self):
+        parts = [f"{field} changed" for field in self.fields]
+        parts += [f"+{name}" for name in self.added_signals]
+        parts += [f"-{name}" for name in self.removed_signals]
+        parts += [f"~{name} ({', '.join(fields)})" for name, fields in self.changed_signals.items()]
+        return f"{hex(self.frame_id)} {self.new.name}: {', '.join(parts)}"
+
+
+class DbcDiff:
+    """Added, removed and changed messages between two DBC versions"""
+
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def affected_ids(self):
+        """Frame IDs whose decoding may differ after applying the diff"""
+        ids = {msg.frame_id for msg in self.added}
+        ids.update(msg.frame_id for msg in self.removed)
+        ids.update(change.frame_id for change in self.changed if change.affects_decoding)
+        ids.update(change.old.frame_id for change in self.changed if change.affects_decoding)
+        return ids
+
+    def as_dict(self):
+        return {
+            "added": [{"frame_id": msg.frame_id, "name": msg.name} for msg in self.added],
+            "removed": [{"frame_id": msg.frame_id, "name": msg.name} for msg in self.removed],
+            "changed": [change.as_dict() for change in self.changed],
+        }
+
+    def summary(self):
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed"
+
+    def __str__(self):
+        lines = [self.summary()]
+        lines += [f"+ {hex(msg.frame_id)} {msg.name}" for msg in self.added]
+        lines += [f"- {hex(msg.frame_id)} {msg.name}" for msg in self.removed]
+        lines += [f"~ {change}" for change in self.changed]
+        return "\n".join(lines)
+
+
+def diff_messages(old, new):
+    """MessageChange for two definitions of the same ID, or None if they are the same"""
+    if old is new:
+        return None
+    if _message_signature(old) == _message_signature(new) and \
+            list(map(_signal_signature, old.signals)) == list(map(_signal_signature, new.signals)):
+        return None
+    fields = _changed_fields(old, new, MESSAGE_FIELDS)
+    old_signals = {signal.name: signal for signal in old.signals}
+    new_signals = {signal.name: signal for signal in new.signals}
+    added = [name for name in new_signals if name not in old_signals]
+    removed = [name for name in old_signals if name not in new_signals]
+    changed = {}
+    for name, signal in new_signals.items():
+        previous = old_signals.get(name)
+        if previous is not None:
+            signal_fields = _changed_fields(previous, signal, SIGNAL_FIELDS)
+            if signal_fields:
+                changed[name] = signal_fields
+    if not (fields or added or removed or changed):
+        return None
+    return MessageChange(old, new, fields, added, removed, changed)
+
+
+def message_signature(msg):
+    """Comparable summary of everything diff_messages() looks at"""
+    return _message_signature(msg), list(map(_signal_signature, msg.signals))
+
+
+def diff_changes(old, changed, removed_keys):
+    """DbcDiff from old given only the new versions of added or changed messages
+
+    removed_keys are (frame_id, is_extended_frame) of removed messages.
+    """
+    old_messages = {_key(msg): msg for msg in _messages(old)}
+    added = []
+    changes = []
+    for msg in changed:
+        previous = old_messages.get(_key(msg))
+        if previous is None:
+            added.append(msg)
+            continue
+        change = diff_messages(previous, msg)
+        if change is not None:
+            changes.append(change)
+    removed = [old_messages[key] for key in removed_keys if key in old_messages]
+    return DbcDiff(added, removed, changes)
+
+
+def diff_databases(old, new):
+    """DbcDiff from old to new; either may be a database, a list of messages or None"""
+    old_messages = {_key(msg): msg for msg in _messages(old)}
+    new_messages = {_key(msg): msg for msg in _messages(new)}
+    added = [msg for key, msg in new_messages.items() if key not in old_messages]
+    removed = [msg for key, msg in old_messages.items() if key not in new_messages]
+    changed = []
+    for key, msg in new_messages.items():
+        previous = old_messages.get(key)
+        if previous is not None:
+            change = diff_messages(previous, msg)
+            if change is not None:
+                changed.append(change)
+    return DbcDiff(added, removed, changed)
+
+
+# Directory canutils is imported from, for the reload worker's sys.path
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_WORKER_SCRIPT = "import sys; from canutils.dbc_diff import _serve; _serve(sys.argv[1:])"
+
+# In the reload worker: path -> {key: message signature} as last loaded
+_baselines = {}
+
+
+def _load(dbc_path):
+    from canutils import dbc_snapshot
+    return dbc_snapshot.load_file(dbc_path)
+
+
+def _track(dbc_paths):
+    for dbc_path in dbc_paths:
+        _baselines[dbc_path] = {_key(msg): message_signature(msg) for msg in _load(dbc_path).messages}
+
+
+def _load_changes(dbc_path):
+    db = _load(dbc_path)
+    baseline = _baselines.get(dbc_path, {})
+    signatures = {_key(msg): message_signature(msg) for msg in db.messages}
+    changed = [msg for msg in db.messages if baseline.get(_key(msg)) != signatures[_key(msg)]]
+    removed = [key for key in baseline if key not in signatures]
+    _baselines[dbc_path] = signatures
+    return changed, removed
+
+
+def _serve(dbc_paths):
+    """Reload worker: answers each pickled path on stdin with (ok, result) on stdout"""
+    # Ctrl-C reaches the whole process group; the worker stops when the
+    # caller closes its stdin instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Replies get the real stdout; anything printed goes to stderr instead
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    requests = sys.stdin.buffer
+    _track(dbc_paths)
+    while True:
+        try:
+            dbc_path = pickle.load(requests)
+        except EOFError:
+            # The caller closed the reloader or exited
+            return
+        try:
+            reply = (True, _load_changes(dbc_path))
+        except Exception as e:
+            reply = (False, e)
+        pickle.dump(reply, replies, protocol=pickle.HIGHEST_PROTOCOL)
+        replies.flush()
+
+
+class DbcReloader:
+    """Loads new versions of DBC files in a worker process, returning only what changed
+
+    The worker takes its baseline from the files as they are when the
+    reloader is created, so create it right after loading them.
+    """
+
+    def __init__(self, dbc_paths):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, (_PACKAGE_ROOT, env.get("PYTHONPATH"))))
+        # The worker starts taking the baseline now
+        self._worker = subprocess.Popen([sys.executable, "-c", _WORKER_SCRIPT] + list(dbc_paths),
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        self._lock = threading.Lock()
+
+    def changes(self, dbc_path):
+        """(added or changed messages, removed keys) of a file since it was last loaded
+
+        Pass them to diff_changes() with the messages currently in use.
+        Blocks until the worker has parsed the file, so call it from a
+        thread. Raises whatever loading the file raised.
+        """
+        with self._lock:
+            try:
+                pickle.dump(dbc_path, self._worker.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+                self._worker.stdin.flush()
+                ok, result = pickle.load(self._worker.stdout)
+            except (OSError, EOFError) as e:
+                raise RuntimeError(f"DBC reload worker exited with {self._worker.poll()}") from e
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        if self._worker.poll() is None:
+            # The worker exits once its stdin is closed
+            try:
+                self._worker.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._worker.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self._worker.kill()
+                self._worker.wait()
+        self._worker.stdout.close()
+
+
+class DbcWatcher:
+    """Notices DBC files changing on disk, by modification time and size"""
+
+    def __init__(self, paths):
+        self._stamps = {path: self._stamp(path) for path in paths}
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self):
+        """Paths that changed since the last call (or since the watcher was created)"""
+        changed = []
+        for path, stamp in self._stamps.items():
+            current = self._stamp(path)
+            # A file being replaced can be missing for a moment; wait for it
+            if current is not None and current != stamp:
+                self._stamps[path] = current
+                changed.append(path)
+        return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what changed between two DBC files")
+    parser.add_argument("old", help="previous version of the DBC")
+    parser.add_argument("new", help="new version of the DBC")
+    parser.add_argument("--json", action="store_true", help="print the differences as JSON")
+    options = parser.parse_args()
+
+    from canutils import dbc_snapshot
+
+    diff = diff_databases(dbc_snapshot.load_file(options.old), dbc_snapshot.load_file(options.new))
+    print(json.dumps(diff.as_dict(), indent=2) if options.json else diff)
+
+
+if __name__ == "__main__":
+    main()
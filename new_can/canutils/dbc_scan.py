@@ -0,0 +1,109 @@
+# Fast DBC outline scanner
+#
+# Previewing a DBC (message names and signal layouts) does not need the full
+# cantools model: building it for a multi-MB vendor DBC takes seconds.
+# scan_dbc() makes a single pass over the raw lines and only picks out BO_
+# and SG_ entries, so the cost is a couple of byte regex matches per message
+# and signal and nothing else (attributes, value tables and comments are
+# skipped).
+#
+# The result has the frame IDs, names and signal positions cantools would
+# report, but the file is not validated beyond those lines: a file that
+# scans cleanly can still be rejected by a full parse.
+
+import itertools
+import re
+from collections import namedtuple
+
+ScannedSignal = namedtuple("ScannedSignal", "name start length byte_order is_signed multiplexer")
+ScannedMessage = namedtuple("ScannedMessage", "frame_id is_extended name length sender signals")
+
+# Bit 31 of a DBC message ID marks a 29-bit (extended) identifier
+EXTENDED_FLAG = 0x80000000
+# Holds signals that belong to no message; cantools drops it too
+INDEPENDENT_SIGNALS = "VECTOR__INDEPENDENT_SIG_MSG"
+
+_MESSAGE = re.compile(rb"BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)\s+(\w+)")
+_SIGNAL = re.compile(rb"SG_\s+(\w+)\s*(M|m\d+M?)?\s*:\s*(\d+)\|(\d+)@([01])([+-])")
+# Keywords that can only appear in a DBC
+_HEADER_KEYWORDS = (b"VERSION", b"NS_", b"BS_", b"BU_", b"BO_")
+
+
+def scan_dbc(lines):
+    """Scan an iterable of DBC lines (bytes, e.g. an open binary file or iter_lines()) into ScannedMessages
+
+    Raises ValueError for a malformed BO_ or SG_ line, or if nothing in the
+    input looks like a DBC.
+    """
+    messages = []
+    current = None
+    in_string = False
+    is_dbc = False
+    for number, line in enumerate(lines, 1):
+        stripped = line.lstrip()
+        if not in_string and stripped:
+            if stripped.startswith(b"SG_ "):
+                if current is not None:
+                    match = _SIGNAL.match(stripped)
+                    if match is None:
+                        raise ValueError(f"Malformed signal on line {number}")
+                    name, multiplexer, start, length, byte_order, sign = match.groups()
+                    current.signals.append(ScannedSignal(
+                        name.decode(), int(start), int(length),
+                        "little_endian" if byte_order == b"1" else "big_endian",
+                        sign == b"-", multiplexer.decode() if multiplexer else None))
+            elif stripped.startswith(b"BO_ "):
+                match = _MESSAGE.match(stripped)
+                if match is None:
+                    raise ValueError(f"Malformed message on line {number}")
+                frame_id, name, length, sender = match.groups()
+                frame_id = int(frame_id)
+                name = name.decode()
+                current = ScannedMessage(frame_id & ~EXTENDED_FLAG, bool(frame_id & EXTENDED_FLAG), name,
+                                         int(length), sender.decode(), [])
+                if name != INDEPENDENT_SIGNALS:
+                    messages.append(current)
+                is_dbc = True
+            else:
+                # Any other section ends the signals of the last message
+                current = None
+                if not is_dbc and stripped.startswith(_HEADER_KEYWORDS):
+                    is_dbc = True
+        # Comments and attribute strings can span lines, and their text
+        # must not be mistaken for BO_ or SG_ entries
+        if b'"' in line:
+            quotes = line.count(b'"') - line.count(b'\\"')
+            if quotes % 2:
+                in_string = not in_string
+    if not is_dbc:
+        raise ValueError("Not a DBC file")
+    return messages
+
+
+def _line_blocks(chunks):
+    tail = b""
+    for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        yield lines
+    yield [tail]
+
+
+def iter_lines(chunks):
+    """Lines from an iterable of byte chunks (e.g. an upload's chunks()), split as they arrive"""
+    return itertools.chain.from_iterable(_line_blocks(chunks))
+
+
+def scan_text(text):
+    """scan_dbc() for DBC contents already in memory (str or bytes)"""
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    return scan_dbc(text.splitlines())
+
+
+def message_dict(messages):
+    """{frame_id: {"name", "signals": {name: length}}}, the shape the API returns for a parsed DBC"""
+    return {
+        msg.frame_id: {"name": msg.name, "signals": {sig.name: sig.length for sig in msg.signals}}
+        for msg in messages
+    }
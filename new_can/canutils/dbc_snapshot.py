@@ -0,0 +1,204 @@
+# Precompiled DBC snapshots
+#
+# Parsing a DBC with cantools is slow for large files, so the parsed database
+# is pickled next to the .dbc as <name>.dbc.snapshot. The snapshot header
+# records the source file's mtime, size and SHA-256 so a stale snapshot is
+# never used.
+#
+# Usage: python -m canutils.dbc_snapshot profile dbc_files/*.dbc
+
+import argparse
+import gc
+import hashlib
+import io
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(dbc_path):
+    return dbc_path + SNAPSHOT_SUFFIX
+
+
+def _file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _cantools():
+    # Imported on first use so importing this module stays cheap for GUI startup
+    import cantools
+    return cantools
+
+
+def _header(stat, file_hash):
+    return {
+        "version": SNAPSHOT_VERSION,
+        "cantools": _cantools().__version__,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_hash,
+    }
+
+
+def _read_source(dbc_path):
+    # The stat is taken before reading, so if the file changes while it is
+    # read the snapshot looks touched and its hash is checked against the file
+    with open(dbc_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        return stat, f.read()
+
+
+def _parse(dbc_path, data):
+    # Same format and encoding choices as cantools.database.load_file
+    database_format = os.path.splitext(dbc_path)[1][1:].lower()
+    encoding = "cp1252" if database_format in ("dbc", "sym") else "utf-8"
+    with io.TextIOWrapper(io.BytesIO(data), encoding=encoding, errors="replace") as f:
+        return _cantools().database.load(f, database_format)
+
+
+def _loads_without_gc(f):
+    # Unpickling creates many small objects; the cyclic GC would otherwise
+    # run repeatedly during the load and dominate its cost
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.load(f)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def write_snapshot(dbc_path, db, header=None):
+    """Write a snapshot of an already parsed database next to its DBC file
+
+    Without a header the DBC file is assumed to be the one db was parsed from.
+    """
+    path = snapshot_path(dbc_path)
+    try:
+        if header is None:
+            header = _header(os.stat(dbc_path), _file_hash(dbc_path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(db, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # A failed write must not leave partial snapshots behind
+            _remove(tmp_path)
+            raise
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write DBC snapshot {path}: {e}")
+        return False
+
+
+def read_snapshot(dbc_path):
+    """Return the snapshot database for a DBC file, or None if missing or stale"""
+    path = snapshot_path(dbc_path)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)
+            if header.get("version") != SNAPSHOT_VERSION or header.get("cantools") != _cantools().__version__:
+                return None
+
+            stat = os.stat(dbc_path)
+            if stat.st_size != header["size"]:
+                return None
+            if stat.st_mtime_ns != header["mtime_ns"]:
+                # Touched but possibly unchanged (e.g. copied or checked out)
+                file_hash = _file_hash(dbc_path)
+                if file_hash != header["sha256"]:
+                    return None
+                db = _loads_without_gc(f)
+                refresh_header = True
+            else:
+                db = _loads_without_gc(f)
+                refresh_header = False
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable DBC snapshot {path}: {e}")
+        return None
+
+    if refresh_header:
+        write_snapshot(dbc_path, db, _header(stat, file_hash))
+    return db
+
+
+def load_file(dbc_path, use_snapshot=True):
+    """Drop-in replacement for cantools.database.load_file using snapshots"""
+    if not use_snapshot:
+        return _cantools().database.load_file(dbc_path)
+    db = read_snapshot(dbc_path)
+    if db is not None:
+        return db
+
+    # Parse the same bytes that are fingerprinted, so a DBC saved mid-load
+    # can't end up in a snapshot labelled with the new file's hash
+    stat, data = _read_source(dbc_path)
+    db = _parse(dbc_path, data)
+    write_snapshot(dbc_path, db, _header(stat, hashlib.sha256(data).hexdigest()))
+    return db
+
+
+def profile(dbc_paths):
+    """Time a full parse against a snapshot load for each DBC file"""
+    results = []
+    for dbc_path in dbc_paths:
+        start = time.perf_counter()
+        db = _cantools().database.load_file(dbc_path)
+        parse_time = time.perf_counter() - start
+
+        write_snapshot(dbc_path, db)
+
+        start = time.perf_counter()
+        read_snapshot(dbc_path)
+        snapshot_time = time.perf_counter() - start
+
+        results.append({
+            "file": dbc_path,
+            "messages": len(db.messages),
+            "signals": sum(len(msg.signals) for msg in db.messages),
+            "parse_time": parse_time,
+            "snapshot_time": snapshot_time,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DBC snapshot tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    profile_parser = subparsers.add_parser("profile", help="compare parse and snapshot load times")
+    profile_parser.add_argument("files", nargs="+", help="DBC files")
+    options = parser.parse_args()
+
+    if options.command == "profile":
+        print(f"{'File':40} {'Messages':>8} {'Signals':>8} {'Parse (ms)':>11} {'Snapshot (ms)':>14} {'Speedup':>8}")
+        for result in profile(options.files):
+            speedup = result["parse_time"] / result["snapshot_time"] if result["snapshot_time"] else 0
+            print(f"{os.path.basename(result['file']):40} {result['messages']:>8} {result['signals']:>8} "
+                  f"{result['parse_time'] * 1000:>11.1f} {result['snapshot_time'] * 1000:>14.1f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
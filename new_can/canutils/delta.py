@@ -0,0 +1,118 @@
+# Change-only (delta) encoding of decoded signals
+#
+# Most periodic signals repeat the same value frame after frame. A
+# DeltaEncoder remembers the last value sent for every (ID, signal) and
+# passes on only the signals that changed, so consumers update a handful of
+# signals per frame instead of all of them and skip unchanged frames
+# entirely.
+#
+# A deadband can be set per signal, either by signal name ("Voltage") or by
+# message and signal ("Battery.Voltage", which wins). A numeric signal is
+# then only passed on once it moves more than the deadband away from the
+# last value sent, so slow drift still gets through.
+#
+# Consumers must keep last-known values themselves: a signal missing from a
+# delta still has the value it was last sent with.
+
+_MISSING = object()
+
+
+def parse_deadbands(specs):
+    """Parse ["Signal=0.5", "Message.Signal=2", ...] into a deadband dict
+
+    Raises ValueError for malformed entries.
+    """
+    deadbands = {}
+    for spec in specs or ():
+        key, sep, value = spec.partition("=")
+        key = key.strip()
+        if not sep or not key:
+            raise ValueError(f"Expected [MESSAGE.]SIGNAL=DEADBAND, got {spec!r}")
+        deadband = float(value)
+        if deadband < 0:
+            raise ValueError(f"Deadband for {key} must not be negative")
+        deadbands[key] = deadband
+    return deadbands
+
+
+class DeltaEncoder:
+    """Tracks last-known signal values per ID and reports only changes
+
+    With refresh set, every signal of an ID is sent again once that many
+    seconds have passed since its last full update, so a consumer that
+    joins late (or a missing sender) is noticed within that time.
+    """
+
+    def __init__(self, deadbands=None, refresh=None):
+        self.deadbands = dict(deadbands or {})
+        self.refresh = refresh
+        # frame_id -> [last sent values, deadbands of its signals, time of last full update]
+        self._state = {}
+        self.signals_in = 0
+        self.signals_out = 0
+
+    def reset(self):
+        """Forget last-known values, so the next frame of every ID is sent in full"""
+        self._state.clear()
+
+    def forget(self, frame_ids):
+        """Forget last-known values of some IDs (e.g. redefined by a DBC reload)"""
+        for frame_id in frame_ids:
+            self._state.pop(frame_id, None)
+
+    def last_values(self, frame_id):
+        """Last values sent for an ID, or None if nothing was sent yet"""
+        state = self._state.get(frame_id)
+        return dict(state[0]) if state is not None else None
+
+    def _message_deadbands(self, name, signals):
+        deadbands = {}
+        if self.deadbands:
+            for signal in signals:
+                deadband = self.deadbands.get(f"{name}.{signal}", self.deadbands.get(signal))
+                if deadband is not None:
+                    deadbands[signal] = deadband
+        return deadbands
+
+    def changes(self, frame_id, decoded, name=None, timestamp=None):
+        """The signals of a decoded frame that changed, or None if none did"""
+        self.signals_in += len(decoded)
+        state = self._state.get(frame_id)
+        if state is None:
+            self._state[frame_id] = [dict(decoded), self._message_deadbands(name, decoded), timestamp]
+            self.signals_out += len(decoded)
+            return decoded
+
+        last, deadbands, refreshed = state
+        if self.refresh is not None and timestamp is not None and \
+                (refreshed is None or timestamp - refreshed >= self.refresh):
+            last.update(decoded)
+            state[2] = timestamp
+            self.signals_out += len(decoded)
+            return decoded
+
+        changed = None
+        for signal, value in decoded.items():
+            previous = last.get(signal, _MISSING)
+            if value == previous:
+                continue
+            deadband = deadbands.get(signal)
+            if deadband is not None and previous is not _MISSING:
+                try:
+                    if abs(value - previous) <= deadband:
+                        continue
+                except TypeError:
+                    # Choice values and other non-numeric signals ignore the deadband
+                    pass
+            if changed is None:
+                changed = {}
+            changed[signal] = value
+            last[signal] = value
+        if changed is not None:
+            self.signals_out += len(changed)
+        return changed
+
+    @property
+    def reduction(self):
+        """Fraction of signals suppressed so far"""
+        return 1.0 - self.signals_out / self.signals_in if self.signals_in else 0.0
@@ -0,0 +1,493 @@
+# Streaming export of decoded signals to CSV, Parquet and MDF4
+#
+# An Exporter takes decoded frames one at a time (from the live queue) or a
+# column block at a time (from a capture) and buffers them per message in
+# fixed-size NumPy chunks. Each full chunk is written out and the buffer
+# reused, so memory stays bounded by chunk_rows per active message however
+# long the recording is.
+#
+# Every message gets a table with a timestamp column and one float column per
+# signal. CSV and Parquet write one file per message into a directory, e.g.
+# run1.parquet/Battery.parquet; each flushed chunk is one Parquet row group,
+# so row groups cover consecutive time ranges. MDF4 writes a single file with
+# one channel group per message.
+#
+# Frames that carry only some signals (see canutils.delta) are filled in with
+# the last known value of the others.
+#
+# With background=True full chunks are handed to a writer thread, as
+# CaptureWriter does, so the live decode loop never waits on the file.
+#
+# Capture frames are matched to messages like the reader's DecodeRouter does,
+# so extended IDs and J1939 messages from any source address are exported.
+#
+# Parquet needs pyarrow and MDF4 needs asammdf; both are only imported when
+# that format is used.
+#
+#   python -m canutils.export run1.cap system_can.dbc run1.parquet --workers 4
+
+import abc
+import argparse
+import csv
+import math
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from canutils import dbc_snapshot
+from canutils.capture import FLAG_ERROR, FLAG_EXTENDED, FLAG_REMOTE, CaptureReader, extract_raw_values
+from canutils.router import DecodeRouter
+
+DEFAULT_CHUNK_ROWS = 65536
+# Buffers start small and grow up to chunk_rows, so rarely sent messages stay cheap
+INITIAL_ROWS = 256
+# Frames read from a capture per block
+DEFAULT_BLOCK_FRAMES = 1 << 20
+# Full chunks a background writer may fall behind by before add() blocks
+MAX_PENDING_CHUNKS = 16
+
+
+def _number(value):
+    if isinstance(value, (int, float)):
+        return value
+    # Choice values decoded with decode_choices=True
+    value = getattr(value, "value", value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _MessageBuffer:
+    """Pending rows of one message, as a timestamp vector and a (signals x rows) matrix"""
+
+    def __init__(self, msg, chunk_rows):
+        self.msg = msg
+        self.names = [signal.name for signal in msg.signals]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.chunk_rows = chunk_rows
+        capacity = min(INITIAL_ROWS, chunk_rows)
+        self.timestamps = np.empty(capacity)
+        self.values = np.empty((len(self.names), capacity))
+        self.rows = 0
+        self.last = np.full(len(self.names), math.nan)
+        # Per-format writer state (file, writer, group index)
+        self.handle = None
+
+    @property
+    def capacity(self):
+        return len(self.timestamps)
+
+    def reserve(self, rows):
+        """Grow the buffer (up to chunk_rows) so it has room for rows more"""
+        needed = min(self.rows + rows, self.chunk_rows)
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        capacity = min(capacity, self.chunk_rows)
+        timestamps = np.empty(capacity)
+        values = np.empty((len(self.names), capacity))
+        timestamps[:self.rows] = self.timestamps[:self.rows]
+        values[:, :self.rows] = self.values[:, :self.rows]
+        self.timestamps, self.values = timestamps, values
+
+
+class Exporter(abc.ABC):
+    """Base class for chunked, per-message signal exporters"""
+
+    format = None
+    # Whether output is one file per message, which allows exporting
+    # different messages from separate processes
+    per_message = True
+
+    def __init__(self, path, db, chunk_rows=DEFAULT_CHUNK_ROWS, background=False):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._messages = {msg.frame_id: msg for msg in db.messages}
+        # Keyed by message name, so several raw IDs decoded by the same
+        # message (J1939 source addresses) share one table
+        self._buffers = {}
+        self._by_id = {}
+        self.rows_written = 0
+        self.skipped = 0
+        self._closed = False
+        if self.per_message:
+            os.makedirs(path, exist_ok=True)
+
+        # Only the writer thread touches the output until close() joins it
+        self._chunks = None
+        self._writer = None
+        self._writer_error = None
+        if background:
+            self._chunks = queue.Queue(MAX_PENDING_CHUNKS)
+            self._writer = threading.Thread(target=self._write_chunks, daemon=True)
+            self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update_database(self, diff):
+        """Follow a DBC reload (a canutils.dbc_diff.DbcDiff)
+
+        New messages are exported from then on. A changed message keeps the
+        columns it was first exported with, since a file cannot change
+        layout halfway; signals it gained are left out.
+        """
+        for msg in diff.removed:
+            self._messages.pop(msg.frame_id, None)
+        for msg in diff.added + [change.new for change in diff.changed]:
+            self._messages[msg.frame_id] = msg
+        for frame_id in diff.affected_ids:
+            self._by_id.pop(frame_id, None)
+
+    def _buffer(self, frame_id, msg=None):
+        buffer = self._by_id.get(frame_id)
+        if buffer is None:
+            msg = msg or self._messages.get(frame_id)
+            if msg is None:
+                return None
+            buffer = self._buffers.get(msg.name)
+            if buffer is None:
+                buffer = self._buffers[msg.name] = _MessageBuffer(msg, self.chunk_rows)
+            self._by_id[frame_id] = buffer
+        return buffer
+
+    def add(self, frame_id, timestamp, decoded, msg=None):
+        """Buffer one decoded frame; msg is looked up by frame_id if not given"""
+        buffer = self._buffer(frame_id, msg)
+        if buffer is None:
+            self.skipped += 1
+            return
+        if buffer.rows == buffer.chunk_rows:
+            self._flush(buffer)
+        elif buffer.rows == buffer.capacity:
+            buffer.reserve(1)
+        last = buffer.last
+        index = buffer.index
+        for name, value in decoded.items():
+            i = index.get(name)
+            if i is not None:
+                last[i] = _number(value)
+        row = buffer.rows
+        buffer.timestamps[row] = timestamp
+        buffer.values[:, row] = last
+        buffer.rows = row + 1
+
+    def add_message(self, msg_info):
+        """Buffer a message dict as queued by the reader or the simulator"""
+        timestamp = msg_info["timestamp"]
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp).timestamp()
+        self.add(int(msg_info["arbitration_id"], 16), timestamp, msg_info.get("decoded_data") or {})
+
+    def add_columns(self, msg, timestamps, values):
+        """Buffer a block of frames of one message: timestamps and a (signals x rows) matrix"""
+        buffer = self._buffer(msg.frame_id, msg)
+        done = 0
+        count = len(timestamps)
+        while done < count:
+            if buffer.rows == buffer.chunk_rows:
+                self._flush(buffer)
+            buffer.reserve(count - done)
+            take = min(count - done, buffer.capacity - buffer.rows)
+            buffer.timestamps[buffer.rows:buffer.rows + take] = timestamps[done:done + take]
+            buffer.values[:, buffer.rows:buffer.rows + take] = values[:, done:done + take]
+            buffer.rows += take
+            done += take
+        if count:
+            buffer.last[:] = values[:, -1]
+
+    def _flush(self, buffer):
+        if not buffer.rows:
+            return
+        timestamps = buffer.timestamps[:buffer.rows]
+        values = buffer.values[:, :buffer.rows]
+        if self._writer is None:
+            self._write_chunk(buffer, timestamps, values)
+        else:
+            # Hand the filled arrays over and continue in fresh ones
+            self._chunks.put((buffer, timestamps, values))
+            buffer.timestamps = np.empty(buffer.capacity)
+            buffer.values = np.empty((len(buffer.names), buffer.capacity))
+        self.rows_written += buffer.rows
+        buffer.rows = 0
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._chunks.get()
+            if isinstance(chunk, threading.Event):
+                chunk.set()
+            elif chunk is None:
+                return
+            elif self._writer_error is None:
+                try:
+                    self._write_chunk(*chunk)
+                except Exception as e:
+                    # Reported by the next flush() or close()
+                    self._writer_error = e
+
+    def _check_writer(self):
+        if self._writer_error is not None:
+            error, self._writer_error = self._writer_error, None
+            raise error
+
+    def flush(self):
+        """Hand every buffered row to the output and wait until it is written"""
+        for buffer in self._buffers.values():
+            self._flush(buffer)
+        if self._writer is not None:
+            done = threading.Event()
+            self._chunks.put(done)
+            done.wait()
+            self._check_writer()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            for buffer in self._buffers.values():
+                self._flush(buffer)
+        finally:
+            if self._writer is not None:
+                self._chunks.put(None)
+                self._writer.join()
+                self._writer = None
+            try:
+                self._check_writer()
+            finally:
+                self._finish()
+
+    def _file_path(self, buffer):
+        return os.path.join(self.path, f"{buffer.msg.name}.{self.format}")
+
+    @abc.abstractmethod
+    def _write_chunk(self, buffer, timestamps, values):
+        """Write one chunk of a message's rows to the output"""
+
+    def _finish(self):
+        pass
+
+
+class CsvExporter(Exporter):
+    format = "csv"
+
+    def _write_chunk(self, buffer, timestamps, values):
+        if buffer.handle is None:
+            f = open(self._file_path(buffer), "w", newline="")
+            writer = csv.writer(f)
+            writer.writerow(["timestamp"] + buffer.names)
+            buffer.handle = (f, writer)
+        writer = buffer.handle[1]
+        writer.writerows(zip(timestamps.tolist(), *values.tolist()))
+
+    def _finish(self):
+        for buffer in self._buffers.values():
+            if buffer.handle is not None:
+                buffer.handle[0].close()
+
+
+class ParquetExporter(Exporter):
+    format = "parquet"
+
+    def __init__(self, path, db, chunk_rows=DEFAULT_CHUNK_ROWS, background=False, compression="zstd"):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.compression = compression
+        super().__init__(path, db, chunk_rows, background)
+
+    def _write_chunk(self, buffer, timestamps, values):
+        pa = self._pa
+        columns = [pa.array(timestamps)] + [pa.array(column) for column in values]
+        table = pa.Table.from_arrays(columns, names=["timestamp"] + buffer.names)
+        if buffer.handle is None:
+            buffer.handle = self._pq.ParquetWriter(self._file_path(buffer), table.schema,
+                                                   compression=self.compression)
+        # One chunk per row group
+        buffer.handle.write_table(table, row_group_size=len(timestamps))
+
+    def _finish(self):
+        for buffer in self._buffers.values():
+            if buffer.handle is not None:
+                buffer.handle.close()
+
+
+class Mf4Exporter(Exporter):
+    format = "mf4"
+    per_message = False
+
+    def __init__(self, path, db, chunk_rows=DEFAULT_CHUNK_ROWS, background=False):
+        import asammdf
+        self._asammdf = asammdf
+        # asammdf keeps appended samples in a temporary file until save()
+        self._mdf = asammdf.MDF(version="4.10")
+        super().__init__(path, db, chunk_rows, background)
+
+    def _write_chunk(self, buffer, timestamps, values):
+        if buffer.handle is None:
+            signals = [
+                self._asammdf.Signal(column.copy(), timestamps.copy(), name=name, unit=signal.unit or "")
+                for name, column, signal in zip(buffer.names, values, buffer.msg.signals)
+            ]
+            self._mdf.append(signals, acq_name=buffer.msg.name, comment=hex(buffer.msg.frame_id))
+            buffer.handle = len(self._mdf.groups) - 1
+        else:
+            self._mdf.extend(buffer.handle, [(timestamps.copy(), None)] + [(column.copy(), None) for column in values])
+
+    def _finish(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._mdf.save(self.path, overwrite=True)
+        self._mdf.close()
+
+
+EXPORTERS = {
+    "csv": CsvExporter,
+    "parquet": ParquetExporter,
+    "mf4": Mf4Exporter,
+}
+
+
+def format_for_path(path):
+    """Export format implied by a path's extension, e.g. run1.parquet -> parquet"""
+    extension = os.path.splitext(path.rstrip(os.sep))[1].lower().lstrip(".")
+    extension = {"mdf": "mf4", "mf4": "mf4", "pq": "parquet"}.get(extension, extension)
+    if extension not in EXPORTERS:
+        raise ValueError(f"Unknown export format for {path}; use one of {', '.join(EXPORTERS)}")
+    return extension
+
+
+def open_exporter(path, db, fmt=None, chunk_rows=DEFAULT_CHUNK_ROWS, background=False):
+    """Exporter for a path, with the format taken from its extension unless given"""
+    return EXPORTERS[fmt or format_for_path(path)](path, db, chunk_rows=chunk_rows, background=background)
+
+
+def _decode_columns(msg, data):
+    """(signals x rows) physical values of one message from (rows, 8) payloads"""
+    values = np.empty((len(msg.signals), len(data)))
+    multiplexers = {}
+    for i, signal in enumerate(msg.signals):
+        values[i] = extract_raw_values(data, signal) * signal.scale + signal.offset
+        if signal.multiplexer_ids:
+            # Multiplexed signals are only present when their multiplexer selects them
+            mux = signal.multiplexer_signal
+            if mux not in multiplexers:
+                multiplexers[mux] = extract_raw_values(data, msg.get_signal_by_name(mux))
+            values[i][~np.isin(multiplexers[mux], signal.multiplexer_ids)] = math.nan
+    return values
+
+
+def export_capture(capture_path, db, exporter, frame_ids=None, t_start=None, t_end=None,
+                   block_frames=DEFAULT_BLOCK_FRAMES):
+    """Decode a capture (or a time window of it) into an exporter, a block at a time
+
+    Frames are decoded vectorized per ID within each block, so memory is
+    bounded by block_frames whatever the capture size. Returns the number of
+    frames exported.
+    """
+    capture = CaptureReader(capture_path)
+    router = DecodeRouter()
+    router.add_database(db)
+    # Captures are recorded in time order, so a window is a contiguous range
+    timestamps = capture.timestamps
+    start = int(np.searchsorted(timestamps, t_start)) if t_start is not None else 0
+    end = int(np.searchsorted(timestamps, t_end, side="right")) if t_end is not None else len(capture)
+
+    exported = 0
+    for block_start in range(start, end, block_frames):
+        block = capture.frames[block_start:min(block_start + block_frames, end)]
+        # Standard and extended frames with the same number are different IDs
+        flags = np.asarray(block["flags"])
+        keys = np.asarray(block["arbitration_id"], dtype=np.int64) | ((flags & FLAG_EXTENDED).astype(np.int64) << 32)
+        keys[(flags & (FLAG_REMOTE | FLAG_ERROR)) != 0] = -1
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        # Route each distinct ID once; J1939 IDs from different source
+        # addresses resolve to the same message and are exported together
+        messages = []
+        message_rows = {}
+        key_messages = np.full(len(unique_keys), -1)
+        for i, key in enumerate(unique_keys.tolist()):
+            if key < 0:
+                continue
+            route = router.route(None, key & 0xFFFFFFFF, bool(key >> 32))
+            if route is None or (frame_ids is not None and route.message.frame_id not in frame_ids):
+                continue
+            msg = route.message
+            if id(msg) not in message_rows:
+                message_rows[id(msg)] = len(messages)
+                messages.append(msg)
+            key_messages[i] = message_rows[id(msg)]
+
+        row_messages = key_messages[inverse.reshape(-1)]
+        order = np.argsort(row_messages, kind="stable")
+        bounds = np.searchsorted(row_messages[order], np.arange(len(messages) + 1))
+        for i, msg in enumerate(messages):
+            rows = order[bounds[i]:bounds[i + 1]]
+            frames = block[rows]
+            exporter.add_columns(msg, frames["timestamp"], _decode_columns(msg, frames["data"]))
+            exported += len(rows)
+    return exported
+
+
+def _export_shard(capture_path, dbc_path, path, fmt, frame_ids, kwargs):
+    db = dbc_snapshot.load_file(dbc_path)
+    with open_exporter(path, db, fmt, kwargs.pop("chunk_rows", DEFAULT_CHUNK_ROWS)) as exporter:
+        return export_capture(capture_path, db, exporter, frame_ids=frame_ids, **kwargs)
+
+
+def export_capture_file(capture_path, dbc_path, path, fmt=None, workers=1, chunk_rows=DEFAULT_CHUNK_ROWS, **kwargs):
+    """Export a capture to path, optionally sharding messages across worker processes
+
+    Each worker loads the DBC itself and memory maps the same capture, so
+    nothing large is sent between processes. Only formats that write one
+    file per message can be exported by more than one worker.
+    """
+    fmt = fmt or format_for_path(path)
+    kwargs["chunk_rows"] = chunk_rows
+    if workers <= 1:
+        return _export_shard(capture_path, dbc_path, path, fmt, None, kwargs)
+    if not EXPORTERS[fmt].per_message:
+        raise ValueError(f"{fmt} export writes a single file and can't use several workers")
+
+    frame_ids = sorted(msg.frame_id for msg in dbc_snapshot.load_file(dbc_path).messages)
+    shards = [set(frame_ids[i::workers]) for i in range(workers)]
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_export_shard, capture_path, dbc_path, path, fmt, shard, dict(kwargs))
+                   for shard in shards if shard]
+        return sum(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export decoded signals from a capture file")
+    parser.add_argument("capture", help="capture file recorded with read_can_data.py --capture")
+    parser.add_argument("dbc", help="DBC file to decode with")
+    parser.add_argument("output", help="output path; .csv and .parquet are directories with one file per message")
+    parser.add_argument("--format", choices=sorted(EXPORTERS), help="output format (default: from the output extension)")
+    parser.add_argument("--workers", type=int, default=1, help="processes to split messages across")
+    parser.add_argument("--start", type=float, help="first timestamp to export")
+    parser.add_argument("--end", type=float, help="last timestamp to export")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per message buffered before writing")
+    options = parser.parse_args()
+
+    exported = export_capture_file(
+        options.capture, options.dbc, options.output, options.format, options.workers,
+        chunk_rows=options.chunk_rows, t_start=options.start, t_end=options.end
+    )
+    print(f"Exported {exported} frames to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
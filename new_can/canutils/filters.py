@@ -0,0 +1,374 @@
+# Filter expressions for CAN traffic
+#
+# Expressions such as
+#
+#     id in 0x100..0x1FF and Battery.Voltage > 380
+#     name == "Status" or id in [0x10, 0x20, 0x300..0x30F]
+#     not (dlc < 8) and State == FAULT
+#     Motor.Torque > -50
+#
+# are parsed once and compiled into a single Python lambda. The set of
+# arbitration IDs an expression can possibly match is worked out at compile
+# time so it can be checked before decoding and pushed down to python-can as
+# kernel-level can_filters.
+
+import bisect
+import re
+
+MAX_CAN_ID = 0x1FFFFFFF
+# IDs are small enough to check with a set lookup below this many candidates
+MAX_ID_SET_SIZE = 4096
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>-?(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?))
+      | (?P<string>"[^"]*"|'[^']*')
+      | (?P<range>\.\.)
+      | (?P<op>==|!=|<=|>=|<|>)
+      | (?P<punct>[()\[\],])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "in"}
+_FIELDS = {"id": "frame_id", "name": "name", "dlc": "dlc"}
+
+
+class FilterSyntaxError(ValueError):
+    """Raised when a filter expression cannot be parsed"""
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN_RE.match(expression, pos)
+        if not match or match.end() == pos:
+            raise FilterSyntaxError(f"Unexpected character at position {pos}: {expression[pos:]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "name" and text in _KEYWORDS:
+            kind = text
+        tokens.append((kind, text))
+        pos = match.end()
+    tokens.append(("end", ""))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser producing a tuple-based syntax tree"""
+
+    def __init__(self, expression):
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def take(self, kind=None, text=None):
+        token = self.tokens[self.pos]
+        if (kind and token[0] != kind) or (text and token[1] != text):
+            expected = text or kind
+            raise FilterSyntaxError(f"Expected {expected!r} but found {token[1] or 'end of expression'!r}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        self.take("end")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek()[0] == "or":
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek()[0] == "and":
+            self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self):
+        if self.peek()[0] == "not":
+            self.take()
+            return ("not", self.parse_not())
+        if self.peek() == ("punct", "("):
+            self.take()
+            node = self.parse_or()
+            self.take("punct", ")")
+            return node
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        kind, name = self.take("name")
+        if self.peek()[0] == "in":
+            self.take()
+            return ("in", name, self.parse_id_set())
+        _, op = self.take("op")
+        return ("cmp", name, op, self.parse_value())
+
+    def parse_value(self):
+        kind, text = self.take()
+        if kind == "number":
+            return _parse_number(text)
+        if kind == "string":
+            return text[1:-1]
+        if kind == "name":
+            # Bare words on the right hand side are choice names, e.g. State == FAULT
+            return text
+        raise FilterSyntaxError(f"Expected a value but found {text or 'end of expression'!r}")
+
+    def parse_id_set(self):
+        if self.peek() != ("punct", "["):
+            return [self.parse_range()]
+        self.take()
+        ranges = [self.parse_range()]
+        while self.peek() == ("punct", ","):
+            self.take()
+            ranges.append(self.parse_range())
+        self.take("punct", "]")
+        return ranges
+
+    def parse_range(self):
+        low = self._parse_int()
+        if self.peek()[0] != "range":
+            return (low, low)
+        self.take()
+        high = self._parse_int()
+        if high < low:
+            raise FilterSyntaxError(f"Empty range {hex(low)}..{hex(high)}")
+        return (low, high)
+
+    def _parse_int(self):
+        value = _parse_number(self.take("number")[1])
+        if not isinstance(value, int):
+            raise FilterSyntaxError(f"Expected an integer but found {value}")
+        if value < 0:
+            raise FilterSyntaxError(f"Expected an ID but found {value}")
+        return value
+
+
+def _parse_number(text):
+    if text.lower().lstrip("-").startswith("0x"):
+        return int(text, 16)
+    if "." in text:
+        return float(text)
+    return int(text)
+
+
+def _normalize(ranges):
+    """Sort and merge overlapping or adjacent (low, high) ranges"""
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def _intersect(a, b):
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        low = max(a[i][0], b[j][0])
+        high = min(a[i][1], b[j][1])
+        if low <= high:
+            result.append((low, high))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _range_to_masks(low, high):
+    """Cover an ID range with as few (can_id, can_mask) pairs as possible"""
+    masks = []
+    while low <= high:
+        size = low & -low if low else MAX_CAN_ID + 1
+        while size > high - low + 1:
+            size >>= 1
+        masks.append((low, MAX_CAN_ID & ~(size - 1)))
+        low += size
+    return masks
+
+
+def _number(value):
+    """Numeric value of a decoded signal, including named choice values"""
+    if isinstance(value, (int, float)):
+        return value
+    return getattr(value, "value", None)
+
+
+class CompiledFilter:
+    """A parsed filter expression ready to be evaluated per frame"""
+
+    def __init__(self, expression, db=None):
+        self.expression = expression
+        self.uses_signals = False
+        self._db = db
+        self._constants = []
+
+        tree = _Parser(expression).parse()
+        source = "lambda frame_id, name, dlc, signals: " + self._compile(tree)
+        namespace = {"_number": _number, "_constants": self._constants}
+        self.predicate = eval(source, namespace)
+        self.source = source
+
+        # Arbitration IDs the expression can possibly match, None meaning any
+        self.id_ranges = self._id_ranges(tree)
+        self._id_set = None
+        self._range_starts = None
+        if self.id_ranges is not None:
+            if sum(high - low + 1 for low, high in self.id_ranges) <= MAX_ID_SET_SIZE:
+                self._id_set = frozenset(i for low, high in self.id_ranges for i in range(low, high + 1))
+            else:
+                self._range_starts = [low for low, _ in self.id_ranges]
+
+    def __call__(self, frame_id, name=None, dlc=None, signals=None):
+        return self.predicate(frame_id, name, dlc, signals or {})
+
+    def __repr__(self):
+        return f"CompiledFilter({self.expression!r})"
+
+    def _constant(self, value):
+        self._constants.append(value)
+        return f"_constants[{len(self._constants) - 1}]"
+
+    def _compile(self, node):
+        kind = node[0]
+        if kind in ("and", "or"):
+            return "(" + f" {kind} ".join(self._compile(child) for child in node[1]) + ")"
+        if kind == "not":
+            return f"(not {self._compile(node[1])})"
+        if kind == "in":
+            _, field, ranges = node
+            if field != "id":
+                raise FilterSyntaxError(f"'in' is only supported for id, not {field!r}")
+            checks = [f"frame_id == {low}" if low == high else f"{low} <= frame_id <= {high}"
+                      for low, high in _normalize(ranges)]
+            return "(" + " or ".join(checks) + ")"
+
+        _, field, op, value = node
+        if field in _FIELDS:
+            if field == "name" and not isinstance(value, str):
+                raise FilterSyntaxError("Message names must be compared with strings")
+            if field != "name" and isinstance(value, str):
+                raise FilterSyntaxError(f"{field} must be compared with a number")
+            if field == "dlc":
+                # Frames passed without a length match no dlc comparison
+                return f"(dlc is not None and dlc {op} {self._constant(value)})"
+            return f"({_FIELDS[field]} {op} {self._constant(value)})"
+
+        # Signal comparison, optionally qualified by message name
+        self.uses_signals = True
+        message, _, signal = field.rpartition(".")
+        guard = f"name == {self._constant(message)} and " if message else ""
+        getter = f"signals.get({self._constant(signal)})"
+        if isinstance(value, str):
+            if op not in ("==", "!="):
+                raise FilterSyntaxError(f"Choice values only support == and !=, not {op}")
+            # Like numeric comparisons, only messages that have the signal can
+            # match, which is what _id_ranges() assumes for can_filters
+            return f"({guard}(_v := {getter}) is not None and _v {op} {self._constant(value)})"
+        return f"({guard}(_v := _number({getter})) is not None and _v {op} {self._constant(value)})"
+
+    def _id_ranges(self, node):
+        kind = node[0]
+        if kind == "and":
+            result = None
+            for child in node[1]:
+                ranges = self._id_ranges(child)
+                if ranges is not None:
+                    result = ranges if result is None else _intersect(result, ranges)
+            return result
+        if kind == "or":
+            result = []
+            for child in node[1]:
+                ranges = self._id_ranges(child)
+                if ranges is None:
+                    return None
+                result.extend(ranges)
+            return _normalize(result)
+        if kind == "not":
+            return None
+        if kind == "in":
+            return _normalize(node[2])
+
+        _, field, op, value = node
+        if field == "id" and isinstance(value, int):
+            ranges = {
+                "==": [(value, value)],
+                "<": [(0, value - 1)],
+                "<=": [(0, value)],
+                ">": [(value + 1, MAX_CAN_ID)],
+                ">=": [(value, MAX_CAN_ID)],
+            }.get(op)
+            # Clipped to real IDs, as the value can be negative or too large
+            return None if ranges is None else [
+                (max(low, 0), min(high, MAX_CAN_ID)) for low, high in ranges
+                if low <= high and high >= 0 and low <= MAX_CAN_ID
+            ]
+        if self._db is None:
+            return None
+        if field == "name" and op == "==":
+            return [(msg.frame_id, msg.frame_id) for msg in self._db.messages if msg.name == value]
+        if field not in _FIELDS:
+            message, _, signal = field.rpartition(".")
+            return _normalize(
+                (msg.frame_id, msg.frame_id) for msg in self._db.messages
+                if (not message or msg.name == message) and any(sig.name == signal for sig in msg.signals)
+            )
+        return None
+
+    def match_id(self, frame_id):
+        """Cheap pre-decode check against the IDs the expression can match"""
+        if self._id_set is not None:
+            return frame_id in self._id_set
+        if self._range_starts is None:
+            return True
+        i = bisect.bisect_right(self._range_starts, frame_id) - 1
+        return i >= 0 and frame_id <= self.id_ranges[i][1]
+
+    def match_message(self, msg):
+        """Evaluate against a message dict as produced by the simulator and reader"""
+        dlc = msg.get("dlc")
+        if dlc is None and msg.get("hex") is not None:
+            dlc = len(msg["hex"]) // 2
+        return self.predicate(
+            int(msg["arbitration_id"], 16),
+            msg.get("name"),
+            dlc,
+            msg.get("decoded_data") or {}
+        )
+
+    def can_filters(self, max_filters=16):
+        """python-can can_filters that let through every frame this filter can match
+
+        Returns None when the expression does not constrain the ID. If an exact
+        cover needs more than max_filters entries a single coarser mask is used;
+        the predicate still has to be evaluated on whatever gets through.
+        """
+        if self.id_ranges is None:
+            return None
+        masks = [mask for low, high in self.id_ranges for mask in _range_to_masks(low, high)]
+        if not masks:
+            # Nothing can match, but an empty list would disable filtering
+            return [{"can_id": MAX_CAN_ID, "can_mask": MAX_CAN_ID, "extended": True}]
+        if len(masks) > max_filters:
+            low, high = self.id_ranges[0][0], self.id_ranges[-1][1]
+            mask = MAX_CAN_ID
+            while (low & mask) != (high & mask):
+                mask = (mask << 1) & MAX_CAN_ID
+            masks = [(low & mask, mask)]
+        return [{"can_id": can_id, "can_mask": can_mask} for can_id, can_mask in masks]
+
+
+def compile_filter(expression, db=None):
+    """Compile a filter expression, using db (if given) to narrow the ID set"""
+    return CompiledFilter(expression, db)
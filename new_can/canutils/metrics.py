@@ -0,0 +1,269 @@
+# Lightweight metrics: counters, gauges and latency histograms
+#
+# Metrics are off by default. Hot paths check the module level `enabled`
+# flag before doing any work, so when disabled instrumentation costs one
+# attribute lookup:
+#
+#   if metrics.enabled:
+#       start = time.perf_counter()
+#   ...
+#   if metrics.enabled:
+#       DECODE_TIME.observe(time.perf_counter() - start)
+#
+# Set CAN_METRICS=1 in the environment (or call enable()) to turn them on.
+#
+# Histograms are HDR style: values are recorded in microseconds into
+# log-linear buckets (64 sub-buckets per power of two), giving quantiles
+# within ~1.6% of the true value at a fixed memory cost and O(1) per record.
+
+import math
+import os
+import threading
+import time
+
+enabled = os.environ.get("CAN_METRICS", "") not in ("", "0")
+
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Values below this are recorded exactly
+LINEAR_LIMIT = SUB_BUCKETS * 2
+# Largest trackable value is 2**MAX_BITS microseconds (about 12 days)
+MAX_BITS = 40
+BUCKET_COUNT = LINEAR_LIMIT + (MAX_BITS - SUB_BUCKET_BITS - 1) * SUB_BUCKETS
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def _bucket_index(value):
+    if value < LINEAR_LIMIT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return LINEAR_LIMIT + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def _bucket_value(index):
+    """Midpoint of the values a bucket covers"""
+    if index < LINEAR_LIMIT:
+        return index
+    shift = (index - LINEAR_LIMIT) // SUB_BUCKETS + 1
+    low = ((index - LINEAR_LIMIT) % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+    def as_dict(self):
+        return {"type": self.kind, "value": self.value}
+
+
+class Gauge:
+    """Value that can go up and down, e.g. a queue depth"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        self.value = 0
+
+    def as_dict(self):
+        return {"type": self.kind, "value": self.value}
+
+
+class Histogram:
+    """Latency distribution in seconds, stored as HDR style buckets of microseconds"""
+
+    kind = "summary"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        micros = min(max(int(seconds * 1e6), 0), (1 << MAX_BITS) - 1)
+        with self._lock:
+            self._counts[_bucket_index(micros)] += 1
+            self.count += 1
+            self.sum += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def time(self):
+        """Context manager observing the duration of a block (when enabled)"""
+        return _Timer(self)
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Map of quantile to seconds, None when nothing was recorded"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self.count
+        if not total:
+            return {q: None for q in quantiles}
+
+        results = {}
+        targets = sorted(quantiles)
+        seen = 0
+        target = 0
+        for index, count in enumerate(counts):
+            if not count:
+                continue
+            seen += count
+            while target < len(targets) and seen >= math.ceil(targets[target] * total):
+                results[targets[target]] = _bucket_value(index) / 1e6
+                target += 1
+            if target == len(targets):
+                break
+        return results
+
+    def as_dict(self):
+        return {
+            "type": self.kind,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": {str(q): v for q, v in self.quantiles().items()},
+        }
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """Named set of metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help=""):
+        return self._get(Histogram, name, help)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def reset(self):
+        for metric in self.metrics():
+            metric.reset()
+
+    def snapshot(self):
+        """Plain dict of every metric, for JSON and the diagnostics panel"""
+        return {metric.name: dict(metric.as_dict(), help=metric.help) for metric in self.metrics()}
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+snapshot = REGISTRY.snapshot
+
+
+def _labels(labels, **extra):
+    labels = dict(labels or {}, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+def _number(value):
+    return "NaN" if value is None else repr(float(value))
+
+
+def render_prometheus(sources):
+    """Prometheus text exposition of (labels, snapshot()) pairs
+
+    Several processes can export the same metric names under different
+    labels; each name gets a single HELP/TYPE header.
+    """
+    names = {}
+    for labels, snapshot in sources:
+        for name, metric in snapshot.items():
+            names.setdefault(name, []).append((labels, metric))
+
+    lines = []
+    for name, series in sorted(names.items()):
+        first = series[0][1]
+        if first.get("help"):
+            lines.append(f"# HELP {name} {first['help']}")
+        lines.append(f"# TYPE {name} {first['type']}")
+        for labels, metric in series:
+            if metric["type"] == "summary":
+                for quantile, value in metric["quantiles"].items():
+                    lines.append(f"{name}{_labels(labels, quantile=quantile)} {_number(value)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(metric['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {metric['count']}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {_number(metric['value'])}")
+    return "\n".join(lines) + "\n"
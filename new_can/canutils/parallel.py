@@ -0,0 +1,220 @@
+# Parallel decode of capture files across a process pool
+#
+# cantools decodes one frame at a time in pure Python, so decoding a long
+# capture is CPU bound on a single core. decode_capture() spreads the work
+# over a ProcessPoolExecutor and yields the decoded frames in timestamp
+# order, either
+#
+#   split="range"  consecutive frame ranges (captures are fixed-size records,
+#                  so a range of frames is a byte range on frame boundaries)
+#   split="id"     blocks of the capture sharded by arbitration ID, balanced
+#                  by frame count, with each shard's results merged back by
+#                  timestamp
+#
+# Each worker loads the DBC (through its snapshot) once, in the pool
+# initializer, and memory maps the capture itself; only frame ranges go to
+# the workers and only decoded values come back. At most a few tasks per
+# worker are in flight, so memory stays bounded for any capture size.
+#
+#   python -m canutils.parallel run1.cap system_can.dbc --workers 8 --export run1.parquet
+
+import argparse
+import collections
+import heapq
+import json
+import operator
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from canutils import dbc_snapshot
+from canutils.capture import CaptureReader
+
+DEFAULT_CHUNK_FRAMES = 50000
+DEFAULT_BLOCK_FRAMES = 500000
+# Tasks queued per worker ahead of the one being consumed
+PREFETCH_PER_WORKER = 2
+
+SPLIT_RANGE = "range"
+SPLIT_ID = "id"
+
+_messages = None
+_decode_choices = True
+_captures = {}
+
+
+def _init_worker(dbc_path, decode_choices):
+    global _messages, _decode_choices
+    _messages = {msg.frame_id: msg for msg in dbc_snapshot.load_file(dbc_path).messages}
+    _decode_choices = decode_choices
+
+
+def _capture(path):
+    capture = _captures.get(path)
+    if capture is None:
+        capture = _captures[path] = CaptureReader(path)
+    return capture
+
+
+def _decode_frames(capture_path, start, end, frame_ids=None):
+    """Decode frames [start, end) of a capture, optionally only some IDs
+
+    Returns (timestamp, frame_id, decoded) tuples sorted by timestamp and the
+    number of frames that failed to decode.
+    """
+    frames = _capture(capture_path).frames[start:end]
+    if frame_ids is not None:
+        frames = frames[np.isin(frames["arbitration_id"], frame_ids)]
+    timestamps = frames["timestamp"].tolist()
+    ids = frames["arbitration_id"].tolist()
+    dlcs = frames["dlc"].tolist()
+    payloads = frames["data"].tobytes()
+
+    messages = _messages
+    decode_choices = _decode_choices
+    decoded = []
+    errors = 0
+    for i, frame_id in enumerate(ids):
+        msg = messages.get(frame_id)
+        if msg is None:
+            continue
+        offset = i * 8
+        try:
+            signals = msg.decode(payloads[offset:offset + dlcs[i]], decode_choices=decode_choices)
+        except Exception:
+            errors += 1
+            continue
+        decoded.append((timestamps[i], frame_id, signals))
+    decoded.sort(key=operator.itemgetter(0))
+    return decoded, errors
+
+
+def _id_shards(ids, workers):
+    """Split the IDs in a block into up to `workers` shards of similar frame counts"""
+    unique_ids, counts = np.unique(ids, return_counts=True)
+    shards = [[] for _ in range(min(workers, len(unique_ids)))]
+    loads = [(0, i) for i in range(len(shards))]
+    # Largest IDs first, each onto the least loaded shard
+    for index in np.argsort(counts)[::-1]:
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(int(unique_ids[index]))
+        heapq.heappush(loads, (load + int(counts[index]), shard))
+    return [np.array(shard, dtype=np.uint32) for shard in shards]
+
+
+class DecodeStats:
+    """Counters filled in while decode_capture() runs"""
+
+    def __init__(self):
+        self.frames = 0
+        self.decoded = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+
+def decode_capture(capture_path, dbc_path, workers=None, split=SPLIT_RANGE, decode_choices=True,
+                   chunk_frames=DEFAULT_CHUNK_FRAMES, block_frames=DEFAULT_BLOCK_FRAMES, stats=None):
+    """Yield (timestamp, frame_id, decoded) for every decodable frame of a capture, in time order
+
+    Range splitting relies on the capture being recorded in time order, as
+    captures written live are; ID splitting merges by timestamp within each
+    block. Pass a DecodeStats to collect frame and error counts.
+    """
+    workers = workers or os.cpu_count()
+    stats = stats or DecodeStats()
+    started = time.perf_counter()
+    total = len(CaptureReader(capture_path))
+    stats.frames = total
+
+    if split == SPLIT_RANGE:
+        # Each task is one chunk; results are yielded in chunk order
+        tasks = ((start, min(start + chunk_frames, total), None) for start in range(0, total, chunk_frames))
+    elif split == SPLIT_ID:
+        capture = CaptureReader(capture_path)
+
+        def id_tasks():
+            for start in range(0, total, block_frames):
+                end = min(start + block_frames, total)
+                shards = _id_shards(np.asarray(capture.arbitration_ids[start:end]), workers)
+                yield start, end, shards
+        tasks = id_tasks()
+    else:
+        raise ValueError(f"Unknown split {split!r}, expected {SPLIT_RANGE!r} or {SPLIT_ID!r}")
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(dbc_path, decode_choices)) as pool:
+        pending = collections.deque()
+
+        def submit(task):
+            start, end, shards = task
+            if shards is None:
+                pending.append([pool.submit(_decode_frames, capture_path, start, end)])
+            else:
+                pending.append([pool.submit(_decode_frames, capture_path, start, end, shard) for shard in shards])
+
+        tasks = iter(tasks)
+        for task in tasks:
+            submit(task)
+            if len(pending) >= workers * PREFETCH_PER_WORKER:
+                break
+        while pending:
+            futures = pending.popleft()
+            # Keep the pool busy while this task's results are consumed
+            for task in tasks:
+                submit(task)
+                break
+            results = []
+            for future in futures:
+                decoded, errors = future.result()
+                stats.errors += errors
+                stats.decoded += len(decoded)
+                results.append(decoded)
+            if len(results) == 1:
+                yield from results[0]
+            else:
+                yield from heapq.merge(*results, key=operator.itemgetter(0))
+    stats.seconds = time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a capture file on all cores")
+    parser.add_argument("capture", help="capture file recorded with read_can_data.py --capture")
+    parser.add_argument("dbc", help="DBC file to decode with")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--split", choices=(SPLIT_RANGE, SPLIT_ID), default=SPLIT_RANGE,
+                        help="split the capture into frame ranges or arbitration ID shards")
+    parser.add_argument("--output", help="write decoded frames as JSON lines to this file ('-' for stdout)")
+    parser.add_argument("--export", help="export decoded signals (.csv, .parquet or .mf4, see canutils.export)")
+    options = parser.parse_args()
+
+    from canutils.export import open_exporter
+
+    stats = DecodeStats()
+    frames = decode_capture(options.capture, options.dbc, options.workers, options.split,
+                            decode_choices=options.export is None, stats=stats)
+    output = None
+    if options.output:
+        output = sys.stdout if options.output == "-" else open(options.output, "w")
+    exporter = open_exporter(options.export, dbc_snapshot.load_file(options.dbc)) if options.export else None
+    try:
+        for timestamp, frame_id, decoded in frames:
+            if output:
+                output.write(json.dumps({"timestamp": timestamp, "arbitration_id": hex(frame_id),
+                                         "decoded_data": decoded}, default=str) + "\n")
+            if exporter:
+                exporter.add(frame_id, timestamp, decoded)
+    finally:
+        if exporter:
+            exporter.close()
+        if output and output is not sys.stdout:
+            output.close()
+
+    rate = stats.frames / stats.seconds if stats.seconds else 0.0
+    print(f"Decoded {stats.decoded} of {stats.frames} frames ({stats.errors} errors) "
+          f"in {stats.seconds:.2f}s, {rate:.0f} frames/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# Decode routing for several buses and DBC files
+#
+# A DecodeRouter maps (channel, arbitration ID) to the cantools message that
+# decodes it. Every loaded database is merged into one hash index, and
+# conflicting definitions of the same ID on the same channel are reported
+# when the database is added rather than showing up as bad decodes later.
+#
+# J1939 messages are indexed by PGN: priority and source address are masked
+# off, and for PDU1 PGNs (PF < 240) so is the destination address, so one
+# DBC entry matches the message from any node to any node.
+#
+# Resolved lookups are cached per (channel, ID, extended), so in the steady
+# state routing a frame costs a single dict lookup however many buses and
+# databases are loaded.
+#
+# replace_database() reloads one database in place: only routes for added,
+# removed and changed messages are swapped, and only their cached lookups are
+# dropped, so decoding of every other ID carries on untouched. The tables and
+# the cache are replaced together by a single assignment, and route() works
+# on the set it read at its start, so a lookup running during a reload can
+# never cache an old route into the new tables.
+
+import logging
+
+from canutils.dbc_diff import diff_databases
+
+logger = logging.getLogger(__name__)
+
+# Channel key used for databases that apply to every bus
+ANY_CHANNEL = None
+
+# Bounds the resolve cache; J1939 source/destination addresses make the
+# number of distinct raw IDs on a bus large but finite
+MAX_CACHED_IDS = 65536
+
+J1939_PDU2_THRESHOLD = 240
+
+
+class RouteConflictError(ValueError):
+    """Raised when two databases define the same ID differently on a channel"""
+
+    def __init__(self, conflicts):
+        super().__init__("; ".join(str(conflict) for conflict in conflicts))
+        self.conflicts = conflicts
+
+
+class RouteConflict:
+    """One ID defined by two databases on the same channel"""
+
+    def __init__(self, channel, frame_id, is_extended, existing, existing_source, new, new_source):
+        self.channel = channel
+        self.frame_id = frame_id
+        self.is_extended = is_extended
+        self.existing = existing
+        self.existing_source = existing_source
+        self.new = new
+        self.new_source = new_source
+
+    def __str__(self):
+        channel = "all channels" if self.channel is ANY_CHANNEL else self.channel
+        return (f"{hex(self.frame_id)} on {channel}: {self.existing.name} ({self.existing_source}) "
+                f"vs {self.new.name} ({self.new_source})")
+
+
+def j1939_pgn(frame_id):
+    """Parameter group number of a 29-bit J1939 identifier"""
+    pdu_format = (frame_id >> 16) & 0xFF
+    pgn = (frame_id >> 8) & 0x3FFFF
+    if pdu_format < J1939_PDU2_THRESHOLD:
+        # PDU1: the PDU specific byte is a destination address, not part of the PGN
+        pgn &= 0x3FF00
+    return pgn
+
+
+def _is_j1939(msg):
+    return getattr(msg, "protocol", None) == "j1939"
+
+
+def _same_definition(a, b):
+    if a is b:
+        return True
+    return (a.name == b.name and a.length == b.length and
+            [(s.name, s.start, s.length, s.byte_order, s.is_signed, s.scale, s.offset) for s in a.signals] ==
+            [(s.name, s.start, s.length, s.byte_order, s.is_signed, s.scale, s.offset) for s in b.signals])
+
+
+class Route:
+    """Where a frame is decoded: the cantools message and the database it came from"""
+
+    __slots__ = ("message", "source")
+
+    def __init__(self, message, source):
+        self.message = message
+        self.source = source
+
+
+class DecodeRouter:
+    """Merged decode index over any number of (channel, database) pairs"""
+
+    def __init__(self):
+        # (exact, pgns, cache), always replaced as a whole:
+        #   exact  (channel, frame_id, is_extended) -> Route for exact IDs
+        #   pgns   (channel, pgn) -> Route for J1939 messages
+        #   cache  (channel, frame_id, is_extended) -> Route or None, filled by route()
+        # The two tables are never changed once they are in use.
+        self._tables = ({}, {}, {})
+        self._sources = []
+
+    @property
+    def messages(self):
+        """Every routed message once, so the router can stand in for a database"""
+        exact, pgns, cache = self._tables
+        seen = {}
+        for route in list(exact.values()) + list(pgns.values()):
+            seen.setdefault(id(route.message), route.message)
+        return list(seen.values())
+
+    def source_messages(self, channel=ANY_CHANNEL, source=None):
+        """Messages currently routed from one (channel, source) database"""
+        exact, pgns, cache = self._tables
+        seen = {}
+        for key, route in list(exact.items()) + list(pgns.items()):
+            if key[0] == channel and route.source == source:
+                seen.setdefault(id(route.message), route.message)
+        return list(seen.values())
+
+    @property
+    def sources(self):
+        """(channel, source) pairs in the order they were added"""
+        return list(self._sources)
+
+    def add_database(self, db, channel=ANY_CHANNEL, source=None, strict=False):
+        """Index a cantools database for a channel (or all channels)
+
+        Returns the list of RouteConflicts found; the definition loaded first
+        is kept. With strict=True conflicts raise RouteConflictError and
+        nothing from db is added.
+        """
+        source = source or f"database {len(self._sources) + 1}"
+        old_exact, old_pgns, old_cache = self._tables
+        exact = {}
+        pgns = {}
+        conflicts = self._index(db.messages, channel, source, old_exact, old_pgns, exact, pgns)
+
+        if conflicts and strict:
+            raise RouteConflictError(conflicts)
+        for conflict in conflicts:
+            logger.warning(f"ID conflict, keeping the first definition: {conflict}")
+
+        # Cached misses may now resolve, so the cache starts empty
+        self._tables = ({**old_exact, **exact}, {**old_pgns, **pgns}, {})
+        self._sources.append((channel, source))
+        return conflicts
+
+    @staticmethod
+    def _key(msg, channel):
+        if _is_j1939(msg) and msg.is_extended_frame:
+            return (channel, j1939_pgn(msg.frame_id)), True
+        return (channel, msg.frame_id, msg.is_extended_frame), False
+
+    def _index(self, messages, channel, source, exact_table, pgn_table, exact, pgns):
+        """Add routes for messages to exact/pgns, skipping IDs already in the tables; returns conflicts"""
+        conflicts = []
+        for msg in messages:
+            key, is_pgn = self._key(msg, channel)
+            table, pending = (pgn_table, pgns) if is_pgn else (exact_table, exact)
+            existing = table.get(key) or pending.get(key)
+            if existing is not None:
+                if not _same_definition(existing.message, msg):
+                    conflicts.append(RouteConflict(
+                        channel, msg.frame_id, msg.is_extended_frame,
+                        existing.message, existing.source, msg, source
+                    ))
+                continue
+            pending[key] = Route(msg, source)
+        return conflicts
+
+    def replace_database(self, db, channel=ANY_CHANNEL, source=None, strict=False):
+        """Reload the database added as (channel, source), changing only what differs
+
+        Returns the DbcDiff from the routed messages to db; see apply_diff().
+        """
+        if (channel, source) not in self._sources:
+            self.add_database(db, channel, source, strict)
+            return diff_databases(None, db)
+        diff = diff_databases(self.source_messages(channel, source), db)
+        self.apply_diff(diff, channel, source, strict)
+        return diff
+
+    def apply_diff(self, diff, channel=ANY_CHANNEL, source=None, strict=False):
+        """Apply a DbcDiff of the (channel, source) database's messages
+
+        Routes of unchanged messages are kept as they are; removed messages
+        are unrouted and added or changed ones routed, all in one swap, so a
+        concurrent route() sees either the old or the new tables. Conflicts
+        with other databases are handled as in add_database().
+        """
+        if not diff:
+            return
+        outgoing = diff.removed + [change.old for change in diff.changed]
+        incoming = diff.added + [change.new for change in diff.changed]
+
+        old_exact, old_pgns, old_cache = self._tables
+        exact = dict(old_exact)
+        pgns = dict(old_pgns)
+        for msg in outgoing:
+            key, is_pgn = self._key(msg, channel)
+            table = pgns if is_pgn else exact
+            route = table.get(key)
+            if route is not None and route.message is msg:
+                del table[key]
+        added_exact = {}
+        added_pgns = {}
+        conflicts = self._index(incoming, channel, source, exact, pgns, added_exact, added_pgns)
+        if conflicts and strict:
+            raise RouteConflictError(conflicts)
+        for conflict in conflicts:
+            logger.warning(f"ID conflict, keeping the first definition: {conflict}")
+        exact.update(added_exact)
+        pgns.update(added_pgns)
+
+        # Lookups of unchanged messages stay cached. Misses are dropped, as
+        # added messages may resolve them. Lookups still running against the
+        # old tables cache into old_cache, which is discarded; dict() copies
+        # it in one step while they do.
+        outgoing_ids = {id(msg) for msg in outgoing}
+        cache = {key: route for key, route in dict(old_cache).items()
+                 if route is not None and id(route.message) not in outgoing_ids}
+        self._tables = (exact, pgns, cache)
+        if (channel, source) not in self._sources:
+            self._sources.append((channel, source))
+
+    def clear(self):
+        self._tables = ({}, {}, {})
+        self._sources.clear()
+
+    @staticmethod
+    def _resolve(exact, pgns, channel, frame_id, is_extended):
+        for key_channel in (channel, ANY_CHANNEL):
+            route = exact.get((key_channel, frame_id, is_extended))
+            if route is not None:
+                return route
+            if is_extended:
+                route = pgns.get((key_channel, j1939_pgn(frame_id)))
+                if route is not None:
+                    return route
+        return None
+
+    def route(self, channel, frame_id, is_extended=False):
+        """Route for a frame, or None if no loaded database defines it"""
+        # Resolved and cached against one set of tables, even if a reload
+        # swaps in new ones meanwhile
+        exact, pgns, cache = self._tables
+        key = (channel, frame_id, is_extended)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        route = self._resolve(exact, pgns, channel, frame_id, is_extended)
+        if len(cache) >= MAX_CACHED_IDS:
+            cache.clear()
+        cache[key] = route
+        return route
+
+    def decode(self, channel, frame_id, data, is_extended=False, decode_choices=True, scaling=True):
+        """(message, decoded signals) for a frame, or None if it is not routed"""
+        route = self.route(channel, frame_id, is_extended)
+        if route is None:
+            return None
+        return route.message, route.message.decode(data, decode_choices=decode_choices, scaling=scaling)
@@ -0,0 +1,220 @@
+# Shared-memory frame ring between processes
+#
+# A FrameRing is a fixed-size ring of frame records in a named
+# multiprocessing.shared_memory block. One process (read_can_data.py --shm)
+# writes received frames, with their decoded signal values, and any number of
+# FrameRingReaders in other processes (the GUI) map the same block and pick up
+# new records without any copying through pipes or sockets. Readers never
+# write to the block, so they don't slow the writer or each other.
+#
+# Layout: a 64 byte header (magic, capacity, max_signals, write sequence)
+# followed by `capacity` records of
+#
+#   seq u8 | timestamp f8 | arbitration_id u4 | dlc u1 | flags u1 |
+#   signal_count u2 | data 8 bytes | values f8 x max_signals
+#
+# Record n (counting from 1) lives in slot n % capacity. The writer zeroes
+# a slot's seq, fills it in, stores seq = n and then advances the header's
+# write sequence. A reader copies the slots it has not seen yet and keeps
+# only those whose seq still matches afterwards, so a record overwritten
+# while being copied is dropped rather than returned torn. Readers that
+# fall more than `capacity` records behind skip ahead and count the loss.
+#
+# Signal values are stored in the order of the message's signals in the DBC,
+# as floats, NaN meaning the signal was not sent (multiplexed out, or
+# unchanged with --changes-only).
+
+import math
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from canutils.capture import FLAG_ERROR, FLAG_EXTENDED, FLAG_REMOTE
+
+DEFAULT_NAME = "can_frames"
+DEFAULT_CAPACITY = 65536
+DEFAULT_MAX_SIGNALS = 64
+
+MAGIC = b"CANRING1"
+HEADER_SIZE = 64
+_HEADER = struct.Struct("<8sQQQ")
+WRITE_SEQ_OFFSET = 24
+_SEQ = struct.Struct("<Q")
+RECORD_HEADER_SIZE = 32
+
+
+def ring_dtype(max_signals):
+    fields = [
+        ("seq", "<u8"),
+        ("timestamp", "<f8"),
+        ("arbitration_id", "<u4"),
+        ("dlc", "u1"),
+        ("flags", "u1"),
+        ("signal_count", "<u2"),
+        ("data", "u1", (8,)),
+    ]
+    if max_signals:
+        fields.append(("values", "<f8", (max_signals,)))
+    return np.dtype(fields)
+
+
+def _value(value):
+    if isinstance(value, (int, float)):
+        return value
+    # Choice values decoded with decode_choices=True
+    value = getattr(value, "value", value)
+    return value if isinstance(value, (int, float)) else math.nan
+
+
+# Rings created by this process, which its resource tracker is responsible for
+_created = set()
+
+
+def _attach(name):
+    """Open an existing block without letting this process's resource tracker unlink it at exit"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attaching process registers the block and
+        # would remove it when it exits, pulling it out from under the others
+        shm = shared_memory.SharedMemory(name)
+        if name not in _created:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameRing:
+    """Writer side of a shared-memory frame ring; there should be one writer per ring"""
+
+    def __init__(self, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY, max_signals=DEFAULT_MAX_SIGNALS):
+        self.name = name
+        self.capacity = capacity
+        self.max_signals = max_signals
+        self.record_size = RECORD_HEADER_SIZE + 8 * max_signals
+        size = HEADER_SIZE + capacity * self.record_size
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that did not exit cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created.add(name)
+        self._buf = self._shm.buf
+        self._buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        _HEADER.pack_into(self._buf, 0, MAGIC, capacity, max_signals, 0)
+        self._seq = 0
+        # Record layouts by number of signal values
+        self._formats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, timestamp, arbitration_id, data, is_extended=False, is_remote=False, is_error=False, values=()):
+        """Append a frame and (optionally) its decoded signal values"""
+        count = min(len(values), self.max_signals)
+        record = self._formats.get(count)
+        if record is None:
+            record = self._formats[count] = struct.Struct(f"<dIBBH8s{count}d")
+        flags = (FLAG_EXTENDED if is_extended else 0) | \
+                (FLAG_REMOTE if is_remote else 0) | \
+                (FLAG_ERROR if is_error else 0)
+        seq = self._seq + 1
+        offset = HEADER_SIZE + (seq % self.capacity) * self.record_size
+        buf = self._buf
+        _SEQ.pack_into(buf, offset, 0)
+        record.pack_into(buf, offset + 8, timestamp, arbitration_id, len(data), flags, count,
+                         bytes(data[:8]), *values[:count])
+        _SEQ.pack_into(buf, offset, seq)
+        _SEQ.pack_into(buf, WRITE_SEQ_OFFSET, seq)
+        self._seq = seq
+
+    def write_message(self, message, msg=None, decoded=None):
+        """Append a python-can Message, with its signals if decoded by cantools message msg"""
+        values = [_value(decoded.get(signal.name, math.nan)) for signal in msg.signals] if decoded is not None else ()
+        self.write(message.timestamp, message.arbitration_id, message.data, message.is_extended_id,
+                   message.is_remote_frame, message.is_error_frame, values)
+
+    def close(self, unlink=True):
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+            _created.discard(self.name)
+        self._shm = None
+
+
+class FrameRingReader:
+    """Read-only view of a FrameRing in another process
+
+    Each reader keeps its own position; with from_start=False (the default)
+    it starts at the newest record instead of replaying what is still in
+    the ring.
+    """
+
+    def __init__(self, name=DEFAULT_NAME, from_start=False):
+        self.name = name
+        self._shm = _attach(name)
+        magic, self.capacity, self.max_signals, write_seq = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC:
+            self._shm.close()
+            raise ValueError(f"Shared memory block {name!r} is not a frame ring")
+        self.dtype = ring_dtype(self.max_signals)
+        self._records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self._shm.buf, offset=HEADER_SIZE)
+        self._records.flags.writeable = False
+        self._next = max(write_seq - self.capacity + 1, 1) if from_start else write_seq + 1
+        self.lost = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def write_seq(self):
+        return _SEQ.unpack_from(self._shm.buf, WRITE_SEQ_OFFSET)[0]
+
+    def pending(self):
+        """Records written since the last read"""
+        return max(self.write_seq - self._next + 1, 0)
+
+    def read(self, max_records=None):
+        """Copy out the records written since the last read, oldest first"""
+        write_seq = self.write_seq
+        if write_seq < self._next - 1:
+            # The writer restarted and the sequence began again
+            self._next = 1
+        first = self._next
+        if write_seq - first + 1 > self.capacity:
+            skipped = write_seq - self.capacity + 1 - first
+            self.lost += skipped
+            first += skipped
+        count = write_seq - first + 1
+        if max_records is not None:
+            count = min(count, max_records)
+        if count <= 0:
+            return np.zeros(0, dtype=self.dtype)
+
+        expected = np.arange(first, first + count, dtype=np.uint64)
+        slots = expected % np.uint64(self.capacity)
+        records = self._records[slots]
+        # Keep records the writer did not touch while (or before) they were copied
+        valid = (records["seq"] == expected) & (self._records["seq"][slots] == expected)
+        self.lost += int(count - np.count_nonzero(valid))
+        self._next = first + count
+        return records[valid] if not valid.all() else records
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._records = None
+        self._shm.close()
+        self._shm = None
@@ -0,0 +1,219 @@
+# Streaming per-ID statistics for CAN traffic
+#
+# Every update() is O(1): running mean/variance of the inter-arrival period
+# uses Welford's algorithm and bus load is kept as a running sum over a ring
+# of fixed-width time buckets.
+
+import threading
+from collections import deque
+
+# A frame is flagged as missing once it is this many cycle times late
+MISSING_FACTOR = 3.0
+
+
+def frame_bit_length(dlc, is_extended=False, stuffing=True):
+    """Number of bits a classic CAN data frame occupies on the wire"""
+    data_bits = 8 * dlc
+    if is_extended:
+        bits = 67 + data_bits
+        stuffable = 54 + data_bits
+    else:
+        bits = 47 + data_bits
+        stuffable = 34 + data_bits
+    if stuffing:
+        # Worst case: one stuff bit every four bits of the stuffed region
+        bits += (stuffable - 1) // 4
+    return bits
+
+
+class IdStats:
+    """Running statistics for a single arbitration ID"""
+
+    __slots__ = (
+        "frame_id", "name", "count", "first_ts", "last_ts", "last_period",
+        "mean_period", "m2", "min_period", "max_period", "dlc",
+        "expected_period", "expected_dlc", "dlc_violations", "period_violations",
+    )
+
+    def __init__(self, frame_id, name=None, expected_period=None, expected_dlc=None):
+        self.frame_id = frame_id
+        self.name = name
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.last_period = None
+        self.mean_period = 0.0
+        self.m2 = 0.0
+        self.min_period = None
+        self.max_period = None
+        self.dlc = None
+        self.expected_period = expected_period
+        self.expected_dlc = expected_dlc
+        self.dlc_violations = 0
+        self.period_violations = 0
+
+    def update(self, timestamp, dlc, tolerance):
+        self.count += 1
+        self.dlc = dlc
+        if self.expected_dlc is not None and dlc != self.expected_dlc:
+            self.dlc_violations += 1
+
+        if self.last_ts is None:
+            self.first_ts = self.last_ts = timestamp
+            return
+
+        period = timestamp - self.last_ts
+        self.last_ts = timestamp
+        self.last_period = period
+
+        # Welford's online mean/variance over the inter-arrival periods
+        n = self.count - 1
+        delta = period - self.mean_period
+        self.mean_period += delta / n
+        self.m2 += delta * (period - self.mean_period)
+
+        if self.min_period is None or period < self.min_period:
+            self.min_period = period
+        if self.max_period is None or period > self.max_period:
+            self.max_period = period
+
+        expected = self.expected_period
+        if expected and abs(period - expected) > expected * tolerance:
+            self.period_violations += 1
+
+    @property
+    def rate(self):
+        """Instantaneous rate in Hz based on the last period"""
+        if not self.last_period:
+            return 0.0
+        return 1.0 / self.last_period
+
+    @property
+    def average_rate(self):
+        """Average rate in Hz since the first frame"""
+        if self.count < 2 or self.last_ts == self.first_ts:
+            return 0.0
+        return (self.count - 1) / (self.last_ts - self.first_ts)
+
+    @property
+    def jitter(self):
+        """Standard deviation of the inter-arrival period in seconds"""
+        if self.count < 3:
+            return 0.0
+        return (self.m2 / (self.count - 2)) ** 0.5
+
+    def is_missing(self, now):
+        if not self.expected_period or self.last_ts is None:
+            return False
+        return now - self.last_ts > self.expected_period * MISSING_FACTOR
+
+    def as_dict(self, now):
+        return {
+            "arbitration_id": hex(self.frame_id),
+            "name": self.name,
+            "count": self.count,
+            "rate": self.rate,
+            "average_rate": self.average_rate,
+            "jitter": self.jitter,
+            "min_period": self.min_period,
+            "max_period": self.max_period,
+            "expected_period": self.expected_period,
+            "dlc": self.dlc,
+            "dlc_violations": self.dlc_violations,
+            "period_violations": self.period_violations,
+            "missing": self.is_missing(now),
+        }
+
+
+class StatsEngine:
+    """Tracks per-ID rate, jitter and period violations plus overall bus load"""
+
+    def __init__(self, bitrate=500000, window=1.0, buckets=10, tolerance=0.5):
+        self.bitrate = bitrate
+        self.window = window
+        self.tolerance = tolerance
+        self._bucket_width = window / buckets
+        self._lock = threading.Lock()
+        self._expected = {}
+        self.reset()
+
+    def reset(self):
+        """Forget all collected statistics"""
+        with self._lock:
+            self._ids = {}
+            self._buckets = deque()
+            self._current_bucket = None
+            self._current_bits = 0
+            self._window_bits = 0
+            self.total_frames = 0
+            self.last_ts = None
+
+    def set_database(self, db):
+        """Take expected cycle times and lengths from a cantools database"""
+        with self._lock:
+            self._expected = {}
+            for msg in db.messages if db else []:
+                cycle_time = getattr(msg, "cycle_time", None)
+                self._expected[msg.frame_id] = (
+                    msg.name,
+                    cycle_time / 1000.0 if cycle_time else None,
+                    msg.length,
+                )
+            for frame_id, stats in self._ids.items():
+                stats.name, stats.expected_period, stats.expected_dlc = \
+                    self._expected.get(frame_id, (None, None, None))
+
+    def update(self, frame_id, timestamp, dlc, is_extended=False):
+        """Account for one received frame"""
+        with self._lock:
+            stats = self._ids.get(frame_id)
+            if stats is None:
+                expected = self._expected.get(frame_id, (None, None, None))
+                stats = self._ids[frame_id] = IdStats(frame_id, *expected)
+            stats.update(timestamp, dlc, self.tolerance)
+
+            self.total_frames += 1
+            self.last_ts = timestamp
+            self._add_bits(timestamp, frame_bit_length(dlc, is_extended))
+
+    def _add_bits(self, timestamp, bits):
+        bucket = int(timestamp / self._bucket_width)
+        if bucket != self._current_bucket:
+            if self._current_bucket is not None:
+                self._buckets.append((self._current_bucket, self._current_bits))
+            self._current_bucket = bucket
+            self._current_bits = 0
+            self._expire_buckets(bucket)
+        self._current_bits += bits
+        self._window_bits += bits
+
+    def _expire_buckets(self, bucket):
+        oldest = bucket - int(round(self.window / self._bucket_width)) + 1
+        while self._buckets and self._buckets[0][0] < oldest:
+            self._window_bits -= self._buckets.popleft()[1]
+
+    def bus_load(self):
+        """Percentage of bus bandwidth used over the last window"""
+        if not self.bitrate:
+            return 0.0
+        return 100.0 * self._window_bits / (self.bitrate * self.window)
+
+    def snapshot(self, now=None):
+        """Return a JSON-serializable summary of all statistics"""
+        with self._lock:
+            if now is None:
+                now = self.last_ts or 0.0
+            if self._current_bucket is not None:
+                bucket = int(now / self._bucket_width)
+                if bucket > self._current_bucket:
+                    # Nothing received for a while, roll the window forward
+                    self._buckets.append((self._current_bucket, self._current_bits))
+                    self._current_bucket = bucket
+                    self._current_bits = 0
+                    self._expire_buckets(bucket)
+            return {
+                "bitrate": self.bitrate,
+                "bus_load": self.bus_load(),
+                "total_frames": self.total_frames,
+                "ids": {hex(frame_id): stats.as_dict(now) for frame_id, stats in self._ids.items()},
+            }
@@ -0,0 +1,1267 @@
+import asyncio
+import collections
+import csv
+import importlib.util
+import io
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+import can
+import cantools
+import numpy as np
+
+from canutils import asynclog, dbc_scan, dbc_snapshot, export, metrics, parallel, profiler, trace_index
+from canutils.aio import Busy, BusSender, WorkPool
+from canutils.capture import CaptureReader, CaptureWriter, extract_raw_values
+from canutils.filters import MAX_CAN_ID, FilterSyntaxError, compile_filter
+from canutils.delta import DeltaEncoder, parse_deadbands
+from canutils.dbc_diff import DbcReloader, DbcWatcher, diff_changes, diff_databases
+from canutils.router import ANY_CHANNEL, DecodeRouter, RouteConflictError, j1939_pgn
+from canutils.shm import FrameRing, FrameRingReader
+from canutils.stats import StatsEngine, frame_bit_length
+from canutils.trace_index import TraceIndex
+from canutils.transport import Reassembler
+from canutils.triggers import (CrossingCondition, MatchCondition, MissingCondition, SequenceCondition,
+                               TriggerEngine)
+
+TEST_DBC = '''VERSION ""
+
+NS_ :
+
+BS_:
+
+BU_: ECU
+
+BO_ 256 EngineStatus: 8 ECU
+ SG_ Rpm : 0|16@1+ (1,0) [0|65535] "rpm" Vector__XXX
+ SG_ Gear : 16|4@1+ (1,0) [0|15] "" Vector__XXX
+
+BO_ 512 Brake: 2 ECU
+ SG_ Pressure : 0|12@1+ (0.1,0) [0|409.5] "bar" Vector__XXX
+'''
+
+J1939_DBC = TEST_DBC + '''
+BO_ 2566844926 Speed: 8 ECU
+ SG_ Value : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+
+BO_ 2565537534 Request: 3 ECU
+ SG_ Pgn : 0|24@1+ (1,0) [0|16777215] "" Vector__XXX
+
+BA_DEF_ BO_ "VFrameFormat" ENUM "StandardCAN","ExtendedCAN","reserved","J1939PG";
+BA_DEF_DEF_ "VFrameFormat" "StandardCAN";
+BA_ "VFrameFormat" BO_ 2566844926 3;
+BA_ "VFrameFormat" BO_ 2565537534 3;
+'''
+
+RPM_1000_GEAR_3 = bytes((0xE8, 0x03, 0x03, 0, 0, 0, 0, 0))
+
+
+def load_dbc(text=TEST_DBC):
+    return cantools.database.load_string(text)
+
+
+def edited_dbc(*replacements):
+    text = TEST_DBC
+    for old, new in replacements:
+        text = text.replace(old, new)
+    return load_dbc(text)
+
+
+class DbcDiffTests(unittest.TestCase):
+
+    def test_same_database_has_no_changes(self):
+        diff = diff_databases(load_dbc(), load_dbc())
+        self.assertFalse(diff)
+        self.assertEqual(diff.summary(), "0 added, 0 removed, 0 changed")
+
+    def test_added_removed_and_changed(self):
+        new = edited_dbc(
+            ("BO_ 512 Brake", "BO_ 768 Brake"),
+            ("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"),
+        )
+        diff = diff_databases(load_dbc(), new)
+        self.assertEqual([msg.frame_id for msg in diff.added], [768])
+        self.assertEqual([msg.frame_id for msg in diff.removed], [512])
+        [change] = diff.changed
+        self.assertEqual(change.changed_signals, {"Rpm": ["scale"]})
+        self.assertTrue(change.affects_decoding)
+        self.assertEqual(diff.affected_ids, {256, 512, 768})
+
+    def test_descriptive_change_does_not_affect_decoding(self):
+        diff = diff_databases(load_dbc(), edited_dbc(('"rpm"', '"1/min"')))
+        [change] = diff.changed
+        self.assertEqual(change.changed_signals, {"Rpm": ["unit"]})
+        self.assertFalse(change.affects_decoding)
+        self.assertEqual(diff.affected_ids, set())
+
+    def test_signal_added(self):
+        new = edited_dbc((' SG_ Gear', ' SG_ Mode : 20|4@1+ (1,0) [0|15] "" Vector__XXX\n SG_ Gear'))
+        [change] = diff_databases(load_dbc(), new).changed
+        self.assertEqual(change.added_signals, ["Mode"])
+        self.assertEqual(change.as_dict()["frame_id"], 256)
+
+    def test_diff_changes_matches_full_diff(self):
+        old = load_dbc()
+        new = edited_dbc(("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"))
+        diff = diff_changes(old, [new.get_message_by_frame_id(256)], [(512, False)])
+        self.assertEqual([change.frame_id for change in diff.changed], [256])
+        self.assertEqual([msg.frame_id for msg in diff.removed], [512])
+        self.assertEqual(diff.added, [])
+
+    def test_watcher_notices_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.dbc")
+            with open(path, "w") as f:
+                f.write(TEST_DBC)
+            watcher = DbcWatcher([path])
+            self.assertEqual(watcher.changed(), [])
+            with open(path, "a") as f:
+                f.write("\n")
+            self.assertEqual(watcher.changed(), [path])
+            self.assertEqual(watcher.changed(), [])
+
+    def test_reloader_returns_only_changes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "test.dbc")
+        with open(path, "w") as f:
+            f.write(TEST_DBC)
+        reloader = DbcReloader([path])
+        self.addCleanup(reloader.close)
+        self.assertEqual(reloader.changes(path), ([], []))
+
+        with open(path, "w") as f:
+            f.write(TEST_DBC.replace("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"))
+        changed, removed = reloader.changes(path)
+        self.assertEqual([msg.frame_id for msg in changed], [256])
+        self.assertEqual(removed, [])
+
+        with open(path, "w") as f:
+            f.write("BO_ nonsense")
+        with self.assertRaises(Exception):
+            reloader.changes(path)
+        # The worker carries on after a file fails to load
+        with open(path, "w") as f:
+            f.write(TEST_DBC)
+        self.assertEqual([msg.frame_id for msg in reloader.changes(path)[0]], [256])
+
+        reloader.close()
+        self.assertIsNotNone(reloader._worker.poll())
+
+
+class DbcSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, "test.dbc")
+        with open(self.path, "w") as f:
+            f.write(TEST_DBC)
+
+    def test_snapshot_used_until_file_changes(self):
+        db = dbc_snapshot.load_file(self.path)
+        self.assertTrue(os.path.exists(dbc_snapshot.snapshot_path(self.path)))
+        self.assertEqual([msg.name for msg in dbc_snapshot.read_snapshot(self.path).messages],
+                         [msg.name for msg in db.messages])
+        with open(self.path, "a") as f:
+            f.write("\n")
+        self.assertIsNone(dbc_snapshot.read_snapshot(self.path))
+
+    def test_file_saved_during_parse_is_not_snapshotted_as_parsed(self):
+        parse = dbc_snapshot._parse
+
+        def parse_while_saving(dbc_path, data):
+            with open(self.path, "w") as f:
+                f.write(TEST_DBC.replace("EngineStatus", "EngineState1"))
+            return parse(dbc_path, data)
+
+        with unittest.mock.patch.object(dbc_snapshot, "_parse", parse_while_saving):
+            self.assertIsNotNone(dbc_snapshot.load_file(self.path).get_message_by_name("EngineStatus"))
+        # The snapshot holds the old file, so it must not be used for the new one
+        self.assertIsNone(dbc_snapshot.read_snapshot(self.path))
+        self.assertIsNotNone(dbc_snapshot.load_file(self.path).get_message_by_name("EngineState1"))
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        # Locks cannot be pickled
+        self.assertFalse(dbc_snapshot.write_snapshot(self.path, threading.Lock()))
+        self.assertEqual(os.listdir(self.directory), ["test.dbc"])
+
+
+class FilterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.db = load_dbc(TEST_DBC.replace(
+            'SG_ Gear : 16|4@1+ (1,0) [0|15] "" Vector__XXX',
+            'SG_ Gear : 16|4@1+ (1,0) [0|15] "" Vector__XXX\n SG_ State : 20|2@1+ (1,0) [0|3] "" Vector__XXX'
+        ) + 'VAL_ 256 State 0 "OK" 1 "FAULT" ;\n')
+
+    def frames(self):
+        """(frame_id, name, dlc, signals) for every message of the test DBC, decoded"""
+        for msg in self.db.messages:
+            data = bytes((0x01, 0x02, 0x13, 0, 0, 0, 0, 0))[:msg.length]
+            yield msg.frame_id, msg.name, msg.length, msg.decode(data)
+        # A frame no DBC message describes
+        yield 0x7FF, None, 8, {}
+
+    def test_expressions(self):
+        cases = {
+            "id in 0x100..0x1FF": [256],
+            "id == 512 or Rpm > 500": [256, 512],
+            "Brake.Pressure >= 51.3": [512],
+            "State == FAULT": [256],
+            "State != OK": [256],
+            "not (dlc < 8)": [256, 0x7FF],
+            'name == "Brake"': [512],
+        }
+        for expression, expected in cases.items():
+            message_filter = compile_filter(expression, self.db)
+            matched = [frame[0] for frame in self.frames() if message_filter.predicate(*frame)]
+            self.assertEqual(matched, expected, expression)
+
+    def test_dlc_comparison_without_dlc(self):
+        message_filter = compile_filter("dlc > 4 or id == 0x200")
+        self.assertFalse(message_filter(0x100))
+        self.assertTrue(message_filter(0x200))
+        # Simulator and error-frame dicts may leave out the dlc
+        self.assertTrue(message_filter.match_message({"arbitration_id": "0x100", "hex": "0102030405"}))
+        self.assertFalse(message_filter.match_message({"arbitration_id": "0x100", "name": "Error"}))
+
+    def test_id_checks_never_drop_matching_frames(self):
+        expressions = [
+            "State != OK", "State != FAULT", "Rpm != 0", "id != 0x200", 'name != "Brake"',
+            "EngineStatus.Gear != 3", "dlc != 8 and id < 0x300", "not Pressure > 1 and id in [0x100, 0x200]",
+        ]
+        for expression in expressions:
+            message_filter = compile_filter(expression, self.db)
+            filters = message_filter.can_filters()
+            for frame in self.frames():
+                if not message_filter.predicate(*frame):
+                    continue
+                frame_id = frame[0]
+                self.assertTrue(message_filter.match_id(frame_id), (expression, hex(frame_id)))
+                if filters is not None:
+                    self.assertTrue(any(frame_id & f["can_mask"] == f["can_id"] & f["can_mask"] for f in filters),
+                                    (expression, hex(frame_id)))
+
+    def test_can_filters(self):
+        self.assertIsNone(compile_filter("Rpm > 5").can_filters())
+        self.assertEqual(compile_filter("id in 0x100..0x1FF").can_filters(), [{"can_id": 0x100, "can_mask": 0x1FFFFF00}])
+        self.assertEqual(compile_filter("Rpm > 5", self.db).id_ranges, [(256, 256)])
+
+    def test_negative_literals(self):
+        db = load_dbc(TEST_DBC + '''
+BO_ 768 Motor: 1 ECU
+ SG_ Torque : 0|8@1- (1,0) [-128|127] "Nm" Vector__XXX
+''')
+        motor = db.get_message_by_name("Motor")
+        message_filter = compile_filter("Motor.Torque > -50", db)
+        for torque, expected in ((-60, False), (-50, False), (-49, True), (10, True)):
+            decoded = motor.decode(motor.encode({"Torque": torque}))
+            self.assertEqual(message_filter.predicate(768, "Motor", 1, decoded), expected, torque)
+        self.assertEqual(message_filter.id_ranges, [(768, 768)])
+        self.assertTrue(compile_filter("Torque <= -0.5 and Torque > -0x20", db).predicate(768, "Motor", 1, {"Torque": -20}))
+        # IDs are never negative
+        self.assertEqual(compile_filter("id > -5").id_ranges, [(0, MAX_CAN_ID)])
+        self.assertEqual(compile_filter("id == -1").id_ranges, [])
+
+    def test_syntax_errors(self):
+        for expression in ("id ==", "id in 0x200..0x100", "State < FAULT", "dlc == eight", "id = 3", "id in -1..5"):
+            with self.assertRaises(FilterSyntaxError, msg=expression):
+                compile_filter(expression)
+
+
+class DbcScanTests(unittest.TestCase):
+
+    def test_matches_cantools(self):
+        db = load_dbc()
+        scanned = dbc_scan.scan_text(TEST_DBC)
+        self.assertEqual([(msg.frame_id, msg.name, msg.length) for msg in scanned],
+                         [(msg.frame_id, msg.name, msg.length) for msg in db.messages])
+        self.assertEqual(dbc_scan.message_dict(scanned)[256], {"name": "EngineStatus", "signals": {"Rpm": 16, "Gear": 4}})
+        rpm = scanned[0].signals[0]
+        self.assertEqual((rpm.start, rpm.byte_order, rpm.is_signed), (0, "little_endian", False))
+
+    def test_lines_split_across_chunks(self):
+        data = TEST_DBC.replace("\n", "\r\n").encode()
+        expected = dbc_scan.scan_text(data)
+        for size in (1, 3, 7, 64):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(dbc_scan.scan_dbc(dbc_scan.iter_lines(chunks)), expected, size)
+
+    def test_extended_ids_and_independent_signals(self):
+        text = TEST_DBC + '''
+BO_ 2566844926 Extended: 8 ECU
+ SG_ Value : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+
+BO_ 3221225472 VECTOR__INDEPENDENT_SIG_MSG: 0 Vector__XXX
+ SG_ Orphan : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+'''
+        extended = dbc_scan.scan_text(text)[-1]
+        self.assertEqual((extended.name, extended.frame_id, extended.is_extended), ("Extended", 0x18FEF1FE, True))
+
+    def test_skips_multi_line_strings(self):
+        text = TEST_DBC + 'CM_ BO_ 256 "Engine status,\nBO_ 999 NotAMessage: 8 ECU\n";\n'
+        self.assertEqual([msg.name for msg in dbc_scan.scan_text(text)], ["EngineStatus", "Brake"])
+
+    def test_rejects_non_dbc_and_malformed_lines(self):
+        with self.assertRaises(ValueError):
+            dbc_scan.scan_text("hello\nworld\n")
+        with self.assertRaises(ValueError):
+            dbc_scan.scan_text(TEST_DBC + "BO_ nonsense\n")
+
+
+class RouterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.router = DecodeRouter()
+
+    def test_channels(self):
+        self.router.add_database(load_dbc(), "can0", "powertrain.dbc")
+        self.router.add_database(edited_dbc(("BO_ 256 EngineStatus", "BO_ 768 Body")), ANY_CHANNEL, "body.dbc")
+        self.assertEqual(self.router.route("can0", 256).source, "powertrain.dbc")
+        self.assertIsNone(self.router.route("can1", 256))
+        self.assertEqual(self.router.route("can1", 768).message.name, "Body")
+        self.assertIsNone(self.router.route("can0", 256, is_extended=True))
+        self.assertIsNone(self.router.decode("can0", 0x7FF, b""))
+        self.assertEqual(self.router.decode("can0", 256, RPM_1000_GEAR_3)[1]["Gear"], 3)
+        self.assertEqual(sorted(msg.name for msg in self.router.messages), ["Body", "Brake", "Brake", "EngineStatus"])
+        self.assertEqual(self.router.sources, [("can0", "powertrain.dbc"), (ANY_CHANNEL, "body.dbc")])
+
+    def test_j1939_routes_by_pgn(self):
+        self.assertEqual(j1939_pgn(0x18FEF1FE), 0xFEF1)
+        self.assertEqual(j1939_pgn(0x0CEA1234), 0xEA00)
+        self.router.add_database(load_dbc(J1939_DBC))
+        # Any priority and source address; for PDU1 any destination too
+        self.assertEqual(self.router.route("can0", 0x0CFEF100, is_extended=True).message.name, "Speed")
+        self.assertEqual(self.router.route("can0", 0x18EA21FE, is_extended=True).message.name, "Request")
+        self.assertIsNone(self.router.route("can0", 0x18FEF2FE, is_extended=True))
+
+    def test_conflicts(self):
+        self.router.add_database(load_dbc(), "can0", "a.dbc")
+        # The same definition again is not a conflict, nor is another channel
+        self.assertEqual(self.router.add_database(load_dbc(), "can0", "copy.dbc"), [])
+        changed = edited_dbc(("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"))
+        self.assertEqual(self.router.add_database(changed, "can1", "b.dbc"), [])
+
+        with self.assertRaises(RouteConflictError) as raised:
+            self.router.add_database(changed, "can0", "b.dbc", strict=True)
+        self.assertEqual(str(raised.exception), "0x100 on can0: EngineStatus (a.dbc) vs EngineStatus (b.dbc)")
+        self.assertNotIn(("can0", "b.dbc"), self.router.sources)
+
+        [conflict] = self.router.add_database(changed, "can0", "b.dbc")
+        self.assertEqual((conflict.frame_id, conflict.existing_source, conflict.new_source), (256, "a.dbc", "b.dbc"))
+        self.assertEqual(self.router.route("can0", 256).source, "a.dbc")
+        self.assertEqual(self.router.route("can1", 256).source, "b.dbc")
+
+
+class RouterReloadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.router = DecodeRouter()
+        self.router.add_database(load_dbc(), "can0", "test.dbc")
+
+    def test_apply_diff_swaps_changed_messages_only(self):
+        brake = self.router.route("can0", 512).message
+        new = edited_dbc(("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"))
+        diff = self.router.replace_database(new, "can0", "test.dbc")
+        self.assertEqual([change.frame_id for change in diff.changed], [256])
+        self.assertEqual(self.router.decode("can0", 256, RPM_1000_GEAR_3)[1]["Rpm"], 2000)
+        self.assertIs(self.router.route("can0", 512).message, brake)
+
+    def test_apply_diff_during_route(self):
+        # A reload lands while route() is resolving a frame: the lookup may
+        # return the old definition, but must not cache it for later frames
+        new = edited_dbc(("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"))
+        diff = diff_databases(self.router.source_messages("can0", "test.dbc"), new)
+        resolve = DecodeRouter._resolve
+
+        def resolve_during_reload(*args):
+            route = resolve(*args)
+            self.router.apply_diff(diff, "can0", "test.dbc")
+            return route
+
+        self.router._resolve = resolve_during_reload
+        old = self.router.route("can0", 256)
+        del self.router._resolve
+        self.assertEqual(old.message.decode(RPM_1000_GEAR_3)["Rpm"], 1000)
+        self.assertEqual(self.router.decode("can0", 256, RPM_1000_GEAR_3)[1]["Rpm"], 2000)
+
+    def test_added_message_resolves_after_cached_miss(self):
+        self.assertIsNone(self.router.route("can0", 768))
+        new = edited_dbc(("BO_ 512 Brake", "BO_ 768 Brake"))
+        self.router.replace_database(new, "can0", "test.dbc")
+        self.assertEqual(self.router.route("can0", 768).message.name, "Brake")
+        self.assertIsNone(self.router.route("can0", 512))
+
+
+class StatsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = StatsEngine(bitrate=500000, window=1.0)
+        self.engine.set_database(load_dbc(TEST_DBC + (
+            'BA_DEF_ BO_ "GenMsgCycleTime" INT 0 10000;\n'
+            'BA_DEF_DEF_ "GenMsgCycleTime" 0;\n'
+            'BA_ "GenMsgCycleTime" BO_ 256 100;\n'
+        )))
+
+    def test_frame_bit_length(self):
+        self.assertEqual(frame_bit_length(8, stuffing=False), 111)
+        self.assertEqual(frame_bit_length(8), 135)
+        self.assertEqual(frame_bit_length(8, is_extended=True), 160)
+
+    def test_periods_and_violations(self):
+        for timestamp, dlc in ((0.0, 8), (0.1, 8), (0.2, 4), (0.4, 8)):
+            self.engine.update(256, timestamp, dlc)
+        stats = self.engine.snapshot()["ids"]["0x100"]
+        self.assertEqual(stats["name"], "EngineStatus")
+        self.assertEqual(stats["count"], 4)
+        self.assertAlmostEqual(stats["expected_period"], 0.1)
+        self.assertAlmostEqual(stats["min_period"], 0.1)
+        self.assertAlmostEqual(stats["max_period"], 0.2)
+        self.assertAlmostEqual(stats["average_rate"], 7.5)
+        self.assertAlmostEqual(stats["rate"], 5.0)
+        self.assertAlmostEqual(stats["jitter"], 0.0577, places=4)
+        self.assertEqual(stats["dlc_violations"], 1)
+        self.assertEqual(stats["period_violations"], 1)
+        self.assertFalse(stats["missing"])
+        self.assertTrue(self.engine.snapshot(now=1.0)["ids"]["0x100"]["missing"])
+
+    def test_bus_load_window(self):
+        for i in range(10):
+            self.engine.update(512, i * 0.1, 2)
+        self.assertAlmostEqual(self.engine.bus_load(), 100.0 * 10 * frame_bit_length(2) / 500000)
+        self.assertEqual(self.engine.snapshot(now=5.0)["bus_load"], 0.0)
+        self.engine.reset()
+        self.assertEqual(self.engine.snapshot(), {"bitrate": 500000, "bus_load": 0.0, "total_frames": 0, "ids": {}})
+
+
+class CaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.cap")
+
+    def test_round_trip(self):
+        with CaptureWriter(self.path, chunk_size=3, background=True) as writer:
+            for i in range(10):
+                writer.write(i * 0.01, 0x100 + i % 2, bytes((i, 1, 2)))
+            writer.write(0.1, 0x18FEF1FE, RPM_1000_GEAR_3, is_extended=True)
+        capture = CaptureReader(self.path)
+        self.assertEqual(len(capture), 11)
+        self.assertEqual(capture.frame_dict(3), {
+            "offset": 3, "timestamp": 0.03, "arbitration_id": "0x101", "dlc": 3, "hex": "030102",
+        })
+        self.assertEqual(capture.frames["flags"][-1], 1)
+        # Appending keeps the existing frames
+        with CaptureWriter(self.path) as writer:
+            writer.write(0.2, 0x200, b"")
+        self.assertEqual(len(CaptureReader(self.path)), 12)
+
+    def test_changes_only(self):
+        with CaptureWriter(self.path, changes_only=True, refresh=0.3) as writer:
+            for i, data in enumerate((b"\x01", b"\x01", b"\x02", b"\x02", b"\x02")):
+                writer.write(i * 0.2, 0x100, data)
+        self.assertEqual(writer.skipped, 2)
+        self.assertEqual(list(CaptureReader(self.path).timestamps), [0.0, 0.4, 0.8])
+
+    def test_extract_raw_values_matches_cantools(self):
+        db = load_dbc(TEST_DBC.replace(
+            'SG_ Gear : 16|4@1+ (1,0) [0|15] "" Vector__XXX',
+            'SG_ Gear : 16|4@1+ (1,0) [0|15] "" Vector__XXX\n SG_ Temp : 39|12@0- (1,0) [-2048|2047] "" Vector__XXX'
+        ))
+        msg = db.get_message_by_name("EngineStatus")
+        payloads = [RPM_1000_GEAR_3, bytes(range(8)), bytes((0xFF,) * 8), bytes((0, 0, 0, 0, 0x81, 0x20, 0, 0))]
+        data = np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(-1, 8)
+        for signal in msg.signals:
+            expected = [msg.decode(payload, scaling=False)[signal.name] for payload in payloads]
+            self.assertEqual(list(extract_raw_values(data, signal)), expected, signal.name)
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a capture")
+        with self.assertRaises(ValueError):
+            CaptureReader(self.path)
+
+
+class TraceIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.cap")
+        self.db = load_dbc(TEST_DBC + 'VAL_ 256 Gear 0 "Park" 3 "Drive" ;\n')
+        # 0x100 alternates Park and Drive, 0x200 in between
+        with CaptureWriter(self.path) as writer:
+            for i in range(100):
+                if i % 2:
+                    writer.write(i * 0.01, 0x200, b"\x00\x00")
+                else:
+                    writer.write(i * 0.01, 0x100, bytes((0, 0, 3 if i % 4 else 0, 0, 0, 0, 0, 0)))
+        self.index = TraceIndex.build(CaptureReader(self.path), self.db, block_size=16)
+
+    def test_id_and_time_queries(self):
+        self.assertEqual(list(self.index.query(frame_id=0x200, limit=3)), [1, 3, 5])
+        self.assertEqual(list(self.index.query(frame_id=0x100, t_start=0.1, t_end=0.145)), [10, 12, 14])
+        self.assertEqual(list(self.index.query(t_start=0.5, t_end=0.52)), [50, 51, 52])
+        self.assertEqual(len(self.index.query(frame_id=0x300)), 0)
+        self.assertEqual(self.index.offset_at(0.335), 34)
+        self.assertEqual(self.index.frames([1])[0]["arbitration_id"], "0x200")
+
+    def test_choice_queries(self):
+        self.assertEqual(list(self.index.query(0x100, signal="Gear", value="Drive", limit=3)), [2, 6, 10])
+        self.assertEqual(list(self.index.query(0x100, signal="Gear", value=0, t_start=0.9)), [92, 96])
+        with self.assertRaises(KeyError):
+            self.index.query(0x100, signal="Gear", value="Reverse")
+        with self.assertRaises(ValueError):
+            self.index.query(signal="Gear", value="Drive")
+
+    def test_open_rebuilds_stale_index(self):
+        self.assertEqual(len(TraceIndex.open(self.path).ids), 2)
+        with CaptureWriter(self.path) as writer:
+            writer.write(1.0, 0x300, b"")
+        index = TraceIndex.open(self.path, self.db)
+        self.assertEqual(list(index.ids), [0x100, 0x200, 0x300])
+        self.assertEqual(list(index.query(frame_id=0x300)), [100])
+
+    def test_open_rebuilds_index_without_choice_tables(self):
+        TraceIndex.build(CaptureReader(self.path))
+        index = TraceIndex.open(self.path, self.db)
+        self.assertEqual(list(index.query(0x100, signal="Gear", value="Drive", limit=1)), [2])
+        # Only the index itself is left in the directory, no build leftovers
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.path))), ["test.cap", "test.cap.index"])
+
+    def test_open_index_is_cached(self):
+        self.addCleanup(trace_index._open_indexes.clear)
+        index = trace_index.open_index(self.path, self.db)
+        self.assertIs(trace_index.open_index(self.path, self.db), index)
+        with CaptureWriter(self.path) as writer:
+            writer.write(1.0, 0x300, b"")
+        # A growing capture keeps its index until MIN_REBUILD_INTERVAL passes
+        self.assertIs(trace_index.open_index(self.path, self.db), index)
+        with unittest.mock.patch.object(trace_index, "MIN_REBUILD_INTERVAL", 0):
+            rebuilt = trace_index.open_index(self.path, self.db)
+        self.assertEqual(list(rebuilt.query(frame_id=0x300)), [100])
+        # The old index still answers from its own files
+        self.assertEqual(list(index.query(0x100, signal="Gear", value="Drive", limit=1)), [2])
+
+    def test_open_index_builds_once(self):
+        self.addCleanup(trace_index._open_indexes.clear)
+        os.remove(os.path.join(trace_index.index_path(self.path), "meta.json"))
+        builds = []
+        build = TraceIndex.build.__func__
+
+        def counting_build(cls, *args, **kwargs):
+            builds.append(threading.get_ident())
+            return build(cls, *args, **kwargs)
+
+        with unittest.mock.patch.object(TraceIndex, "build", classmethod(counting_build)):
+            threads = [threading.Thread(target=trace_index.open_index, args=(self.path, self.db)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(builds), 1)
+
+
+class MetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.addCleanup(setattr, metrics, "enabled", metrics.enabled)
+
+    def test_histogram_quantiles(self):
+        histogram = self.registry.histogram("latency")
+        self.assertEqual(histogram.quantiles(), {q: None for q in metrics.QUANTILES})
+        # 1us to 100ms in 1us steps
+        for micros in range(1, 100001):
+            histogram.observe(micros / 1e6)
+        for quantile, value in histogram.quantiles().items():
+            self.assertAlmostEqual(value, quantile * 0.1, delta=quantile * 0.1 * 0.016)
+        self.assertEqual((histogram.count, histogram.min, histogram.max), (100000, 1e-6, 0.1))
+
+    def test_timer_only_records_when_enabled(self):
+        histogram = self.registry.histogram("block")
+        metrics.disable()
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.count, 0)
+        metrics.enable()
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.count, 1)
+
+    def test_registry(self):
+        frames = self.registry.counter("frames", "Frames received")
+        self.assertIs(self.registry.counter("frames"), frames)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("frames")
+        frames.inc(3)
+        self.registry.gauge("depth").set(7)
+        self.assertEqual(self.registry.snapshot(), {
+            "frames": {"type": "counter", "value": 3, "help": "Frames received"},
+            "depth": {"type": "gauge", "value": 7, "help": ""},
+        })
+        self.registry.reset()
+        self.assertEqual(frames.value, 0)
+
+    def test_render_prometheus(self):
+        self.registry.counter("frames", "Frames received").inc(2)
+        self.registry.histogram("latency").observe(0.0001)
+        other = {"frames": {"type": "counter", "value": 5, "help": "Frames received"}}
+        text = metrics.render_prometheus([({"process": "reader"}, self.registry.snapshot()),
+                                          ({"process": "gui"}, other)])
+        lines = text.splitlines()
+        self.assertEqual(lines[:4], [
+            "# HELP frames Frames received",
+            "# TYPE frames counter",
+            'frames{process="reader"} 2.0',
+            'frames{process="gui"} 5.0',
+        ])
+        self.assertIn('latency{process="reader",quantile="0.5"} 0.0001', lines)
+        self.assertIn('latency_count{process="reader"} 1', lines)
+
+
+class AsyncLogTests(unittest.TestCase):
+
+    def logger(self, handler):
+        logger = logging.getLogger(f"canutils.tests.{self.id()}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def messages(self, log_queue):
+        return [log_queue.get_nowait().getMessage() for _ in range(log_queue.qsize())]
+
+    def test_repeats_are_summarised(self):
+        handler = asynclog.RateLimitedQueueHandler(queue.Queue(), interval=60)
+        logger = self.logger(handler)
+        for frame_id in (0x100, 0x100, 0x100, 0x200):
+            logger.error("Error decoding %s", hex(frame_id), extra={"rate_key": hex(frame_id)})
+        for _ in range(3):
+            logger.info("Reloaded", extra={"rate_key": False})
+        handler.flush_suppressed(force=True)
+        messages = self.messages(handler.queue)
+        self.assertEqual(messages[:5], ["Error decoding 0x100", "Error decoding 0x200"] + ["Reloaded"] * 3)
+        self.assertEqual(len(messages), 6)
+        self.assertRegex(messages[5], r"^2 more errors for 0x100 in the last [\d.]+s: Error decoding 0x100$")
+
+    def test_full_queue_drops(self):
+        handler = asynclog.RateLimitedQueueHandler(queue.Queue(1), interval=0)
+        logger = self.logger(handler)
+        for i in range(3):
+            logger.warning("Frame %d", i)
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(self.messages(handler.queue), ["Frame 0"])
+
+    def test_setup_logging(self):
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        stream = io.StringIO()
+        asynclog.setup_logging(stream=stream, fmt="%(levelname)s %(message)s")
+        self.addCleanup(asynclog.shutdown)
+        logging.getLogger("canutils.tests").warning("Bus off")
+        asynclog.shutdown()
+        self.assertEqual(stream.getvalue(), "WARNING Bus off\n")
+
+
+class TransportTests(unittest.TestCase):
+
+    PAYLOAD = bytes(range(20))
+
+    def isotp_frames(self, payload=PAYLOAD):
+        frames = [bytes((0x10 | len(payload) >> 8, len(payload) & 0xFF)) + payload[:6]]
+        for seq, start in enumerate(range(6, len(payload), 7), 1):
+            frames.append(bytes((0x20 | seq & 0x0F,)) + payload[start:start + 7])
+        return frames
+
+    def test_isotp(self):
+        reassembler = Reassembler(isotp_ids=[0x7E8])
+        self.assertTrue(reassembler.handles(0x7E8))
+        self.assertFalse(reassembler.handles(0x7E0))
+        single = reassembler.feed("can0", 0x7E8, bytes((0x03, 0x41, 0x0C, 0x1A, 0x55)), 0.0)
+        self.assertEqual(single.data, bytes((0x41, 0x0C, 0x1A)))
+
+        results = [reassembler.feed("can0", 0x7E8, frame, i * 0.01) for i, frame in enumerate(self.isotp_frames())]
+        self.assertEqual(results[:-1], [None, None])
+        self.assertEqual((results[-1].protocol, results[-1].frame_id, results[-1].data), ("isotp", 0x7E8, self.PAYLOAD))
+        self.assertEqual((reassembler.completed, reassembler.active_sessions), (2, 0))
+
+    def test_isotp_errors_and_timeouts(self):
+        reassembler = Reassembler(isotp_ids=[0x7E8], max_sessions=1, timeout=1.0)
+        first, second, third = self.isotp_frames()
+        reassembler.feed("can0", 0x7E8, first, 0.0)
+        self.assertIsNone(reassembler.feed("can0", 0x7E8, third, 0.1))
+        self.assertEqual((reassembler.errors, reassembler.active_sessions), (1, 0))
+
+        reassembler.feed("can0", 0x7E8, first, 1.0)
+        self.assertIsNone(reassembler.feed("can0", 0x7E8, second, 2.5))
+        self.assertEqual(reassembler.timeouts, 1)
+
+        # A full session table gives way to the newest session
+        reassembler.feed("can0", 0x7E8, first, 3.0)
+        reassembler.feed("can1", 0x7E8, first, 3.1)
+        self.assertEqual((reassembler.evicted, reassembler.active_sessions), (1, 1))
+        reassembler.expire(5.0)
+        self.assertEqual((reassembler.timeouts, reassembler.active_sessions), (2, 0))
+
+    def test_j1939_bam(self):
+        reassembler = Reassembler(j1939=True)
+        payload = bytes(range(10, 20))
+        # TP.CM BAM from 0xF9 to everyone announcing 10 bytes of PGN 0xFECA in 2 packets
+        announce = bytes((32, 10, 0, 2, 0xFF, 0xCA, 0xFE, 0x00))
+        self.assertTrue(reassembler.handles(0x1CECFFF9, is_extended=True))
+        self.assertFalse(reassembler.handles(0x1CECFFF9))
+        self.assertIsNone(reassembler.feed("can0", 0x1CECFFF9, announce, 0.0, is_extended=True))
+        self.assertIsNone(reassembler.feed("can0", 0x1CEBFFF9, b"\x01" + payload[:7], 0.05, is_extended=True))
+        result = reassembler.feed("can0", 0x1CEBFFF9, b"\x02" + payload[7:] + b"\xFF" * 4, 0.1, is_extended=True)
+        self.assertEqual((result.protocol, result.source, result.target), ("j1939", 0xF9, 0xFF))
+        self.assertEqual((result.pgn, result.frame_id, result.data), (0xFECA, 0x1CFECAF9, payload))
+
+
+class DeltaTests(unittest.TestCase):
+
+    def test_parse_deadbands(self):
+        self.assertEqual(parse_deadbands(["Voltage=0.5", " Battery.Voltage = 2"]), {"Voltage": 0.5, "Battery.Voltage": 2.0})
+        self.assertEqual(parse_deadbands(None), {})
+        for spec in ("Voltage", "=1", "Voltage=-1", "Voltage=high"):
+            with self.assertRaises(ValueError, msg=spec):
+                parse_deadbands([spec])
+
+    def test_only_changes_are_passed_on(self):
+        encoder = DeltaEncoder()
+        frame = {"Rpm": 1000, "Gear": 3}
+        self.assertEqual(encoder.changes(256, frame), frame)
+        self.assertIsNone(encoder.changes(256, dict(frame)))
+        self.assertEqual(encoder.changes(256, {"Rpm": 1010, "Gear": 3}), {"Rpm": 1010})
+        self.assertEqual(encoder.last_values(256), {"Rpm": 1010, "Gear": 3})
+        self.assertAlmostEqual(encoder.reduction, 0.5)
+        encoder.forget([256])
+        self.assertIsNone(encoder.last_values(256))
+        self.assertEqual(encoder.changes(256, frame), frame)
+
+    def test_deadbands(self):
+        encoder = DeltaEncoder({"Voltage": 0.5, "Battery.Voltage": 2, "State": 1})
+        encoder.changes(1, {"Voltage": 400.0, "State": "OK"}, "Battery")
+        encoder.changes(2, {"Voltage": 12.0}, "Aux")
+        self.assertIsNone(encoder.changes(1, {"Voltage": 401.5, "State": "OK"}, "Battery"))
+        self.assertEqual(encoder.changes(2, {"Voltage": 12.6}, "Aux"), {"Voltage": 12.6})
+        # Drift is measured from the last value sent, not the last one seen
+        self.assertEqual(encoder.changes(1, {"Voltage": 402.5, "State": "OK"}, "Battery"), {"Voltage": 402.5})
+        # Non-numeric values ignore the deadband
+        self.assertEqual(encoder.changes(1, {"Voltage": 402.5, "State": "FAULT"}, "Battery"), {"State": "FAULT"})
+
+    def test_refresh(self):
+        encoder = DeltaEncoder(refresh=1.0)
+        frame = {"Rpm": 1000, "Gear": 3}
+        encoder.changes(256, frame, timestamp=0.0)
+        self.assertIsNone(encoder.changes(256, frame, timestamp=0.5))
+        self.assertEqual(encoder.changes(256, frame, timestamp=1.0), frame)
+        self.assertIsNone(encoder.changes(256, frame, timestamp=1.5))
+
+
+class ExportTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.dbc_path = os.path.join(self.directory, "test.dbc")
+        with open(self.dbc_path, "w") as f:
+            f.write(TEST_DBC)
+        self.db = load_dbc()
+
+    def read_csv(self, path):
+        with open(path, newline="") as f:
+            return [[float(value) for value in row] for row in list(csv.reader(f))[1:]]
+
+    def write_capture(self):
+        path = os.path.join(self.directory, "run1.cap")
+        with CaptureWriter(path) as writer:
+            for i in range(50):
+                writer.write(i * 0.01, 0x100, bytes((i, 0, i % 16, 0, 0, 0, 0, 0)))
+                writer.write(i * 0.01 + 0.005, 0x200, bytes((i, 0)))
+                writer.write(i * 0.01 + 0.006, 0x7FF, b"")
+        return path
+
+    def test_format_for_path(self):
+        self.assertEqual(export.format_for_path("out/run1.parquet/"), "parquet")
+        self.assertEqual(export.format_for_path("run1.MDF"), "mf4")
+        with self.assertRaises(ValueError):
+            export.format_for_path("run1.xlsx")
+
+    def test_csv_fills_in_missing_signals(self):
+        path = os.path.join(self.directory, "live.csv")
+        with export.open_exporter(path, self.db, chunk_rows=2) as exporter:
+            exporter.add(256, 0.0, {"Rpm": 1000, "Gear": 3})
+            exporter.add(256, 0.1, {"Rpm": 1100})
+            exporter.add_message({"timestamp": 0.2, "arbitration_id": "0x100", "decoded_data": {"Gear": 4}})
+            exporter.add(0x7FF, 0.3, {})
+        self.assertEqual((exporter.rows_written, exporter.skipped), (3, 1))
+        self.assertEqual(self.read_csv(os.path.join(path, "EngineStatus.csv")),
+                         [[0.0, 1000, 3], [0.1, 1100, 3], [0.2, 1100, 4]])
+
+    def test_export_capture_matches_cantools(self):
+        capture_path = self.write_capture()
+        path = os.path.join(self.directory, "run1.csv")
+        with export.open_exporter(path, self.db, chunk_rows=16) as exporter:
+            exported = export.export_capture(capture_path, self.db, exporter, t_start=0.0975, t_end=0.1925, block_frames=32)
+        self.assertEqual(exported, 19)
+        brake = self.db.get_message_by_name("Brake")
+        self.assertEqual(self.read_csv(os.path.join(path, "Brake.csv")),
+                         [[i * 0.01 + 0.005, brake.decode(bytes((i, 0)))["Pressure"]] for i in range(10, 19)])
+        self.assertEqual(len(self.read_csv(os.path.join(path, "EngineStatus.csv"))), 10)
+
+    def test_export_capture_routes_extended_and_j1939_ids(self):
+        db = load_dbc(J1939_DBC)
+        path = os.path.join(self.directory, "j1939.cap")
+        with CaptureWriter(path) as writer:
+            writer.write(0.0, 0x18FEF1FE, bytes((1,)), is_extended=True)
+            # Same PGN from another priority and source address
+            writer.write(0.1, 0x0CFEF100, bytes((2,)), is_extended=True)
+            writer.write(0.2, 0x100, RPM_1000_GEAR_3)
+            # Neither an extended 0x100 nor a remote frame is EngineStatus
+            writer.write(0.3, 0x100, RPM_1000_GEAR_3, is_extended=True)
+            writer.write(0.4, 0x100, b"", is_remote=True)
+            writer.write(0.5, 0x18FEF1FE, bytes((3,)), is_extended=True)
+        output = os.path.join(self.directory, "j1939.csv")
+        with export.open_exporter(output, db) as exporter:
+            self.assertEqual(export.export_capture(path, db, exporter), 4)
+        self.assertEqual(self.read_csv(os.path.join(output, "Speed.csv")), [[0.0, 1], [0.1, 2], [0.5, 3]])
+        self.assertEqual(self.read_csv(os.path.join(output, "EngineStatus.csv")), [[0.2, 1000, 3]])
+
+    def test_background_writer(self):
+        path = os.path.join(self.directory, "live.csv")
+        writers = set()
+        write_chunk = export.CsvExporter._write_chunk
+
+        def recording_write_chunk(exporter, *args):
+            writers.add(threading.get_ident())
+            write_chunk(exporter, *args)
+
+        with unittest.mock.patch.object(export.CsvExporter, "_write_chunk", recording_write_chunk):
+            with export.open_exporter(path, self.db, chunk_rows=2, background=True) as exporter:
+                for i in range(5):
+                    exporter.add(0x200, i * 0.1, {"Pressure": i})
+                exporter.flush()
+                # flush() returns once the writer thread has taken every chunk
+                self.assertEqual(exporter._chunks.qsize(), 0)
+                self.assertEqual(len(writers), 1)
+        self.assertNotIn(threading.get_ident(), writers)
+        self.assertEqual([row[1] for row in self.read_csv(os.path.join(path, "Brake.csv"))], [0, 1, 2, 3, 4])
+
+        def failing_write_chunk(exporter, *args):
+            raise OSError("disk full")
+
+        with unittest.mock.patch.object(export.CsvExporter, "_write_chunk", failing_write_chunk):
+            exporter = export.open_exporter(path, self.db, chunk_rows=2, background=True)
+            exporter.add(0x200, 0.0, {"Pressure": 1})
+            with self.assertRaises(OSError):
+                exporter.close()
+
+    def test_exporters_must_write_chunks(self):
+        with self.assertRaises(TypeError):
+            export.Exporter(os.path.join(self.directory, "out"), self.db)
+
+    def test_workers_split_messages(self):
+        capture_path = self.write_capture()
+        path = os.path.join(self.directory, "run1.csv")
+        self.assertEqual(export.export_capture_file(capture_path, self.dbc_path, path, workers=2), 100)
+        self.assertEqual(sorted(os.listdir(path)), ["Brake.csv", "EngineStatus.csv"])
+        with self.assertRaises(ValueError):
+            export.export_capture_file(capture_path, self.dbc_path, os.path.join(self.directory, "run1.mf4"), workers=2)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_row_group_per_chunk(self):
+        import pyarrow.parquet
+        path = os.path.join(self.directory, "run1.parquet")
+        with export.open_exporter(path, self.db, chunk_rows=16) as exporter:
+            export.export_capture(self.write_capture(), self.db, exporter)
+        parquet = pyarrow.parquet.ParquetFile(os.path.join(path, "Brake.parquet"))
+        self.assertEqual((parquet.metadata.num_rows, parquet.num_row_groups), (50, 4))
+
+
+class ParallelDecodeTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dbc_path = os.path.join(directory.name, "test.dbc")
+        with open(self.dbc_path, "w") as f:
+            f.write(TEST_DBC)
+        self.capture_path = os.path.join(directory.name, "run1.cap")
+        with CaptureWriter(self.capture_path) as writer:
+            for i in range(300):
+                writer.write(i * 0.01, 0x100, bytes((i % 256, 0, i % 16, 0, 0, 0, 0, 0)))
+                if i % 3 == 0:
+                    writer.write(i * 0.01 + 0.001, 0x200, bytes((i % 256, 1)))
+            # Too short for EngineStatus
+            writer.write(3.0, 0x100, b"\x01")
+
+    def expected(self):
+        db = load_dbc()
+        capture = CaptureReader(self.capture_path)
+        return [(float(frame["timestamp"]), int(frame["arbitration_id"]),
+                 db.get_message_by_frame_id(int(frame["arbitration_id"])).decode(bytes(frame["data"][:frame["dlc"]])))
+                for frame in capture.frames[:-1]]
+
+    def test_splits_match_sequential_decode(self):
+        expected = self.expected()
+        for split in (parallel.SPLIT_RANGE, parallel.SPLIT_ID):
+            stats = parallel.DecodeStats()
+            decoded = list(parallel.decode_capture(self.capture_path, self.dbc_path, workers=2, split=split,
+                                                   chunk_frames=64, block_frames=128, stats=stats))
+            self.assertEqual(decoded, expected, split)
+            self.assertEqual((stats.frames, stats.decoded, stats.errors), (401, 400, 1), split)
+
+    def test_id_shards_are_balanced(self):
+        ids = np.array([1] * 6 + [2] * 3 + [3] * 2 + [4] * 1)
+        shards = parallel._id_shards(ids, 2)
+        self.assertEqual(sorted(sorted(shard.tolist()) for shard in shards), [[1], [2, 3, 4]])
+        self.assertEqual(len(parallel._id_shards(np.array([7, 7]), 4)), 1)
+
+    def test_unknown_split(self):
+        with self.assertRaises(ValueError):
+            next(parallel.decode_capture(self.capture_path, self.dbc_path, workers=1, split="signal"))
+
+
+class TriggerTests(unittest.TestCase):
+
+    def test_conditions(self):
+        match = MatchCondition("id == 0x123")
+        self.assertTrue(match.check(0x123, None, 8, {}, 0.0))
+        self.assertFalse(match.check(0x124, None, 8, {}, 0.0))
+
+        crossing = CrossingCondition("Voltage > 400")
+        results = [crossing.check(1, None, 8, {"Voltage": v}, 0.0) for v in (410, 390, 405, 420, 380, 401)]
+        self.assertEqual(results, [False, False, True, False, False, True])
+
+        sequence = SequenceCondition('name == "Crank"', "id == 0x7E8", 0.05)
+        self.assertFalse(sequence.check(0x7E8, None, 8, {}, 0.0))
+        sequence.check(0x10, "Crank", 8, {}, 1.0)
+        self.assertFalse(sequence.check(0x7E8, None, 8, {}, 1.1))
+        sequence.check(0x10, "Crank", 8, {}, 2.0)
+        self.assertTrue(sequence.check(0x7E8, None, 8, {}, 2.04))
+
+    def test_missing_condition_learns_cycle_time(self):
+        missing = MissingCondition(0x100, factor=3.0)
+        for timestamp in (0.0, 0.1, 0.2):
+            missing.check(0x100, None, 8, {}, timestamp)
+        self.assertAlmostEqual(missing.cycle_time, 0.1)
+        self.assertFalse(missing.poll(0.45))
+        self.assertTrue(missing.poll(0.55))
+        # Fires once, then re-arms when the ID comes back
+        self.assertFalse(missing.check(0x200, None, 8, {}, 0.6))
+        missing.check(0x100, None, 8, {}, 0.7)
+        self.assertTrue(missing.check(0x200, None, 8, {}, 1.2))
+
+    def test_engine_writes_windows_around_triggers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "triggered.cap")
+        engine = TriggerEngine(CaptureWriter(path), [MatchCondition("id == 0x7E8")], pre_frames=2, post_frames=3)
+        frame_ids = [0x100] * 5 + [0x7E8] + [0x100] * 5 + [0x7E8] + [0x100] * 5
+        for i, frame_id in enumerate(frame_ids):
+            engine.record(can.Message(timestamp=float(i), arbitration_id=frame_id, data=b"", is_extended_id=False))
+            engine.evaluate(frame_id, None, 0, {}, float(i))
+        # Events stay buffered in one open file until the engine closes
+        self.assertFalse(engine._events.closed)
+        engine.close()
+        engine.close()
+        self.assertEqual(engine.fired, 2)
+        self.assertEqual(list(CaptureReader(path).timestamps), [4, 5, 6, 7, 8, 10, 11, 12, 13, 14])
+        with open(path + ".triggers") as f:
+            self.assertEqual([json.loads(line)["timestamp"] for line in f], [5.0, 11.0])
+
+
+class FrameRingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f"can_frames_test_{os.getpid()}"
+        self.ring = FrameRing(self.name, capacity=8, max_signals=4)
+        self.addCleanup(self.ring.close)
+
+    def reader(self, **kwargs):
+        reader = FrameRingReader(self.name, **kwargs)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_write_and_read(self):
+        self.ring.write(0.5, 0x99, b"\x01")
+        reader = self.reader()
+        self.assertEqual(len(reader.read()), 0)
+        self.ring.write(1.0, 0x18FEF1FE, bytes(range(8)), is_extended=True, values=(1.5, 2.0))
+        self.ring.write(1.1, 0x100, b"\xAA\xBB")
+        self.assertEqual(reader.pending(), 2)
+        records = reader.read()
+        self.assertEqual(records["arbitration_id"].tolist(), [0x18FEF1FE, 0x100])
+        self.assertEqual(records["flags"].tolist(), [1, 0])
+        self.assertEqual(records[0]["values"][:records[0]["signal_count"]].tolist(), [1.5, 2.0])
+        self.assertEqual(bytes(records[1]["data"][:records[1]["dlc"]]), b"\xAA\xBB")
+        self.assertEqual(len(reader.read()), 0)
+        self.assertEqual(len(self.reader(from_start=True).read()), 3)
+
+    def test_write_message_values(self):
+        msg = load_dbc(TEST_DBC + 'VAL_ 256 Gear 3 "Drive" ;\n').get_message_by_name("EngineStatus")
+        reader = self.reader()
+        message = can.Message(timestamp=2.0, arbitration_id=256, data=RPM_1000_GEAR_3, is_extended_id=False)
+        self.ring.write_message(message, msg, msg.decode(RPM_1000_GEAR_3))
+        self.ring.write_message(message, msg, {"Rpm": 1200})
+        first, second = reader.read()["values"][:, :2].tolist()
+        self.assertEqual(first, [1000.0, 3.0])
+        self.assertEqual(second[0], 1200.0)
+        self.assertTrue(np.isnan(second[1]))
+
+    def test_reader_falling_behind_counts_lost_records(self):
+        reader = self.reader()
+        for i in range(20):
+            self.ring.write(float(i), 0x100, b"")
+        self.assertEqual(reader.read(max_records=3)["timestamp"].tolist(), [12.0, 13.0, 14.0])
+        self.assertEqual(reader.lost, 12)
+        self.assertEqual(reader.read()["timestamp"].tolist(), [15.0, 16.0, 17.0, 18.0, 19.0])
+
+    def test_rejects_other_blocks(self):
+        self.ring._buf[:8] = b"NOT RING"
+        with self.assertRaises(ValueError):
+            FrameRingReader(self.name)
+
+
+class WorkPoolTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_run_and_shed_load(self):
+        pool = WorkPool(workers=1, max_pending=2)
+        self.addCleanup(pool.shutdown)
+        self.assertEqual(await pool.run(sum, [1, 2, 3]), 6)
+
+        release = threading.Event()
+        first = asyncio.ensure_future(pool.run(release.wait))
+        second = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0)
+        with self.assertRaises(Busy):
+            await pool.run(sum, [])
+        # Skippable work only starts when a worker is idle
+        self.assertFalse(pool.background(sum, []))
+        release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual((pool.pending, pool.rejected), (0, 1))
+        self.assertTrue(pool.background(sum, []))
+
+
+class BusSenderTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.channel = f"canutils-tests-{self.id()}"
+        self.receiver = can.interface.Bus(self.channel, interface="virtual")
+        self.addCleanup(self.receiver.shutdown)
+        self.opened = []
+
+    def open_bus(self):
+        if not self.opened:
+            self.opened.append(None)
+            raise OSError("Network is down")
+        bus = can.interface.Bus(self.channel, interface="virtual")
+        self.addCleanup(bus.shutdown)
+        self.opened.append(bus)
+        return bus
+
+    async def test_frames_go_out_in_order(self):
+        sender = BusSender(open_bus=self.open_bus)
+        self.addCleanup(sender.close)
+        # Opening the bus failed for the first frame only
+        with self.assertRaises(OSError):
+            await sender.send(can.Message(arbitration_id=0x100, is_extended_id=False))
+        await asyncio.gather(*(sender.send(can.Message(arbitration_id=i, is_extended_id=False)) for i in range(10)))
+        received = [self.receiver.recv(1).arbitration_id for _ in range(10)]
+        self.assertEqual(received, list(range(10)))
+        self.assertEqual((sender.sent, sender.errors, len(self.opened)), (10, 1, 2))
+
+    async def test_full_queue(self):
+        sender = BusSender(can.interface.Bus(self.channel, interface="virtual"), max_queue=1)
+        self.addCleanup(sender.bus.shutdown)
+        self.addCleanup(sender.close)
+        first = asyncio.ensure_future(sender.send(can.Message(arbitration_id=1, is_extended_id=False)))
+        await asyncio.sleep(0)
+        # The first frame has been taken off the queue by the sender task
+        second = asyncio.ensure_future(sender.send(can.Message(arbitration_id=2, is_extended_id=False)))
+        await asyncio.sleep(0)
+        with self.assertRaises(Busy):
+            await sender.send(can.Message(arbitration_id=3, is_extended_id=False))
+        await asyncio.gather(first, second)
+        self.assertEqual((sender.sent, sender.rejected), (2, 1))
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class ProfilerTests(unittest.TestCase):
+
+    def test_samples_busy_threads_only(self):
+        stop = threading.Event()
+        busy = threading.Thread(target=_busy_loop, args=(stop,), name="busy")
+        idle = threading.Thread(target=stop.wait, name="idle")
+        busy.start()
+        idle.start()
+        sampler = profiler.SamplingProfiler(interval=0.001)
+        sampler.start()
+        time.sleep(0.2)
+        result = sampler.stop()
+        stop.set()
+        busy.join()
+        idle.join()
+        self.assertGreater(result.samples, 0)
+        threads = {stack[0] for stack in result.stacks}
+        self.assertIn("busy", threads)
+        self.assertNotIn("idle", threads)
+        self.assertTrue(any(entry["function"].startswith("_busy_loop (tests.py")
+                            for entry in result.top(5)))
+
+    def test_result_output(self):
+        result = profiler.ProfileResult(
+            collections.Counter({("main", "run", "decode"): 3, ("main", "run"): 1}), 4, 1.0, 0.005)
+        self.assertEqual(result.collapsed(), ["main;run;decode 3", "main;run 1"])
+        self.assertEqual(result.top(), [
+            {"function": "decode", "self": 3, "total": 3, "self_percent": 75.0, "total_percent": 75.0},
+            {"function": "run", "self": 1, "total": 4, "self_percent": 25.0, "total_percent": 100.0},
+        ])
+        with tempfile.TemporaryDirectory() as directory:
+            collapsed_path, report_path = result.write(os.path.join(directory, "out", "gui"))
+            with open(collapsed_path) as f:
+                self.assertEqual(f.read(), "main;run;decode 3\nmain;run 1\n")
+            with open(report_path) as f:
+                self.assertTrue(f.read().startswith("4 samples over 1.0s every 5.0ms\n"))
+
+    def test_profile_for(self):
+        done = threading.Event()
+        results = []
+
+        def finished(result):
+            results.append(result)
+            done.set()
+
+        with tempfile.TemporaryDirectory() as directory:
+            prefix = os.path.join(directory, "reader")
+            self.assertTrue(profiler.profile_for(0.05, prefix, callback=finished))
+            self.assertFalse(profiler.start())
+            self.assertTrue(done.wait(5))
+            self.assertFalse(profiler.is_running())
+            self.assertIs(profiler.last_result(), results[0])
+            self.assertEqual(results[0].paths, (prefix + ".collapsed", prefix + ".txt"))
+            self.assertTrue(os.path.exists(prefix + ".txt"))
+
+
+class ReaderScriptTests(unittest.TestCase):
+    """read_can_data.py sets itself up at import, so it is run as a process"""
+
+    SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "read_can_data.py")
+
+    # Runs the reader with a thread that sends frames on its virtual bus,
+    # which only reaches buses in the same process
+    FEEDER = """
+import os, runpy, sys, threading, time
+import can
+from can.interfaces import virtual
+
+def feed(count):
+    bus = can.interface.Bus("vcan0", interface="virtual")
+    while len(virtual.channels["vcan0"]) < 2:
+        time.sleep(0.01)
+    for i in range(count):
+        bus.send(can.Message(arbitration_id=0x100, data=bytes((i, 0, 3, 0, 0, 0, 0, 0)), is_extended_id=False))
+    print("sent", flush=True)
+
+threading.Thread(target=feed, args=(int(sys.argv[1]),), daemon=True).start()
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.dbc_path = os.path.join(self.directory, "test.dbc")
+        with open(self.dbc_path, "w") as f:
+            f.write(TEST_DBC)
+
+    def start(self, *args):
+        # In a session of its own, so its --reload worker is killed with it
+        reader = subprocess.Popen(
+            [sys.executable, *args], cwd=self.directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, start_new_session=True
+        )
+        self.addCleanup(reader.stdout.close)
+        return reader
+
+    def test_reader_starts_without_a_backend(self):
+        reader = self.start(self.SCRIPT, "-b", "virtual", "-d", self.dbc_path, "-f", "id == 0x100", "-x", "-r")
+        try:
+            # Settings and statistics requests to the missing backend fail meanwhile
+            with self.assertRaises(subprocess.TimeoutExpired):
+                reader.wait(2.5)
+        finally:
+            os.killpg(reader.pid, signal.SIGKILL)
+            output = reader.communicate()[0]
+        self.assertNotIn("Traceback", output)
+
+    def test_capture_is_complete_after_ctrl_c(self):
+        capture_path = os.path.join(self.directory, "run1.cap")
+        reader = self.start("-c", self.FEEDER, "10", self.SCRIPT, "-s", "-b", "virtual", "-d", self.dbc_path,
+                            "-c", capture_path)
+        try:
+            for line in reader.stdout:
+                if line.strip() == "sent":
+                    break
+            # Give the reader a moment to take the frames off its bus
+            time.sleep(0.5)
+            reader.send_signal(signal.SIGINT)
+            reader.wait(10)
+        finally:
+            if reader.poll() is None:
+                os.killpg(reader.pid, signal.SIGKILL)
+        # Ten frames fill only part of a chunk, which is written at exit
+        frames = CaptureReader(capture_path).frames
+        self.assertEqual([int(frame["data"][0]) for frame in frames], list(range(10)))
+
+    def test_changed_dbc_is_reloaded(self):
+        reader = self.start(self.SCRIPT, "-s", "-b", "virtual", "-d", self.dbc_path, "-r")
+        # Never left waiting on a reader that hangs
+        watchdog = threading.Timer(20, os.killpg, (reader.pid, signal.SIGKILL))
+        watchdog.start()
+        self.addCleanup(watchdog.cancel)
+        try:
+            # The watcher takes its baseline once the reader is set up
+            time.sleep(2)
+            with open(self.dbc_path, "w") as f:
+                f.write(TEST_DBC.replace("SG_ Rpm : 0|16@1+ (1,0)", "SG_ Rpm : 0|16@1+ (2,0)"))
+            output = []
+            for line in reader.stdout:
+                output.append(line)
+                if "Reloaded" in line:
+                    break
+            reader.send_signal(signal.SIGINT)
+            output.append(reader.communicate(timeout=10)[0])
+        finally:
+            if reader.poll() is None:
+                os.killpg(reader.pid, signal.SIGKILL)
+        output = "".join(output)
+        self.assertIn("0 added, 0 removed, 1 changed", output)
+        self.assertNotIn("Traceback", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,272 @@
+# Search index over capture files
+#
+# The index lives in a directory next to the capture and is made of plain
+# .npy arrays that are memory mapped on load:
+#
+#   ids.npy        unique arbitration IDs
+#   id_bounds.npy  start of each ID's run in offsets.npy/times.npy (CSR)
+#   offsets.npy    frame offsets grouped by ID, ascending within each ID
+#   times.npy      timestamps in the same order as offsets.npy
+#   time_skip.npy  every block_size-th capture timestamp, for time -> offset
+#
+# Signals with DBC choices (enums) also get an inverted index from raw value
+# to frame offsets, stored as one .npz per (ID, signal).
+#
+# An index is built in a temporary directory and renamed into place, so a
+# reader never sees a half-written one. Servers should use open_index(),
+# which keeps indexes open between queries and rebuilds each one under a
+# lock; a capture that is still being recorded is re-indexed at most every
+# MIN_REBUILD_INTERVAL seconds.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from canutils.capture import FRAME_DTYPE, HEADER_SIZE, CaptureReader, extract_raw_values
+
+INDEX_VERSION = 1
+DEFAULT_BLOCK_SIZE = 4096
+MIN_REBUILD_INTERVAL = 10.0
+
+
+def index_path(capture_path):
+    return capture_path + ".index"
+
+
+def _choice_file(frame_id, signal_name):
+    return f"choice_{frame_id:x}_{signal_name}.npz"
+
+
+class TraceIndex:
+    """ID, time and choice-value index over one capture file"""
+
+    def __init__(self, capture, path):
+        self.capture = capture
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.block_size = self.meta["block_size"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.ids = np.asarray(load("ids.npy"))
+        self.id_bounds = np.asarray(load("id_bounds.npy"))
+        self.offsets = load("offsets.npy")
+        self.times = load("times.npy")
+        self.time_skip = np.asarray(load("time_skip.npy"))
+        self._id_rows = {int(frame_id): row for row, frame_id in enumerate(self.ids)}
+        self._choices = {(c["id"], c["signal"]): c for c in self.meta["choices"]}
+        # Opened now, so a rebuild swapped in later can't mix into this index
+        self._choice_tables = {key: np.load(os.path.join(path, _choice_file(*key))) for key in self._choices}
+
+    @classmethod
+    def open(cls, capture_path, db=None, rebuild=False):
+        """Load the index for a capture, building it first if missing or stale"""
+        capture = CaptureReader(capture_path)
+        path = index_path(capture_path)
+        meta_path = os.path.join(path, "meta.json")
+        if not rebuild and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("version") == INDEX_VERSION and meta.get("frames") == len(capture):
+                index = cls(capture, path)
+                if not index.lacks_choices(db):
+                    return index
+        return cls.build(capture, db)
+
+    @classmethod
+    def build(cls, capture, db=None, block_size=DEFAULT_BLOCK_SIZE):
+        """Build and save the index for a capture"""
+        path = index_path(capture.path)
+        build_path = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path) or None)
+        try:
+            cls._write(capture, db, block_size, build_path)
+        except BaseException:
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise
+        if os.path.exists(path):
+            # Directories can't be replaced in one step: move the old index
+            # aside first. Indexes already open keep their files.
+            old_path = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path) or None)
+            os.replace(path, old_path)
+            os.replace(build_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.replace(build_path, path)
+        return cls(capture, path)
+
+    @staticmethod
+    def _write(capture, db, block_size, path):
+        ids = np.asarray(capture.arbitration_ids)
+        timestamps = np.asarray(capture.timestamps)
+
+        # A stable sort keeps each ID's offsets in capture (and so time) order
+        order = np.argsort(ids, kind="stable")
+        unique_ids, starts = np.unique(ids[order], return_index=True)
+        bounds = np.append(starts, len(order)).astype(np.int64)
+
+        np.save(os.path.join(path, "ids.npy"), unique_ids)
+        np.save(os.path.join(path, "id_bounds.npy"), bounds)
+        np.save(os.path.join(path, "offsets.npy"), order.astype(np.int64))
+        np.save(os.path.join(path, "times.npy"), timestamps[order])
+        np.save(os.path.join(path, "time_skip.npy"), np.array(timestamps[::block_size]))
+
+        choices = []
+        rows = {int(frame_id): row for row, frame_id in enumerate(unique_ids)}
+        for msg in db.messages if db else []:
+            row = rows.get(msg.frame_id)
+            if row is None:
+                continue
+            offsets = order[bounds[row]:bounds[row + 1]]
+            data = np.asarray(capture.frames["data"][offsets])
+            for signal in msg.signals:
+                if not signal.choices:
+                    continue
+                raw = extract_raw_values(data, signal)
+                value_order = np.argsort(raw, kind="stable")
+                values, value_starts = np.unique(raw[value_order], return_index=True)
+                np.savez(
+                    os.path.join(path, _choice_file(msg.frame_id, signal.name)),
+                    values=values,
+                    bounds=np.append(value_starts, len(value_order)),
+                    offsets=offsets[value_order]
+                )
+                choices.append({
+                    "id": msg.frame_id,
+                    "signal": signal.name,
+                    "message": msg.name,
+                    "names": {str(name): int(value) for value, name in signal.choices.items()},
+                })
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "frames": len(capture),
+                "block_size": block_size,
+                "choices": choices,
+            }, f)
+
+    def lacks_choices(self, db):
+        """Whether db has enum signals in the capture that this index has no table for"""
+        for msg in db.messages if db else []:
+            if msg.frame_id not in self._id_rows:
+                continue
+            for signal in msg.signals:
+                if signal.choices and (msg.frame_id, signal.name) not in self._choices:
+                    return True
+        return False
+
+    def offset_at(self, timestamp, side="left"):
+        """First capture offset at (or, with side='right', after) a timestamp
+
+        Assumes the capture is in time order, which it is when recorded live.
+        """
+        block = int(np.searchsorted(self.time_skip, timestamp, side=side))
+        # The answer lies in the block before the first skip entry past timestamp
+        start = max(block - 1, 0) * self.block_size
+        end = min(block * self.block_size + 1, len(self.capture))
+        window = self.capture.timestamps[start:end]
+        return start + int(np.searchsorted(window, timestamp, side=side))
+
+    def id_offsets(self, frame_id):
+        """Offsets of all frames with an arbitration ID"""
+        row = self._id_rows.get(frame_id)
+        if row is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.offsets[self.id_bounds[row]:self.id_bounds[row + 1]]
+
+    def _choice_table(self, frame_id, signal_name):
+        table = self._choice_tables.get((frame_id, signal_name))
+        if table is None:
+            raise KeyError(f"No choice index for {hex(frame_id)} {signal_name}")
+        return table
+
+    def choice_offsets(self, frame_id, signal_name, value):
+        """Offsets of frames where an enum signal has a value (raw int or choice name)"""
+        if isinstance(value, str):
+            names = self._choices.get((frame_id, signal_name), {}).get("names", {})
+            if value not in names:
+                raise KeyError(f"{signal_name} has no choice named {value!r}")
+            value = names[value]
+        table = self._choice_table(frame_id, signal_name)
+        values = table["values"]
+        i = int(np.searchsorted(values, value))
+        if i == len(values) or values[i] != value:
+            return np.zeros(0, dtype=np.int64)
+        return table["offsets"][table["bounds"][i]:table["bounds"][i + 1]]
+
+    def query(self, frame_id=None, t_start=None, t_end=None, signal=None, value=None, limit=None):
+        """Sorted capture offsets matching all of the given constraints"""
+        if signal is not None:
+            if frame_id is None:
+                raise ValueError("Signal queries need an arbitration ID")
+            offsets = self.choice_offsets(frame_id, signal, value)
+            if t_start is not None or t_end is not None:
+                low = self.offset_at(t_start) if t_start is not None else 0
+                high = self.offset_at(t_end, "right") if t_end is not None else len(self.capture)
+                offsets = offsets[np.searchsorted(offsets, low):np.searchsorted(offsets, high)]
+        elif frame_id is not None:
+            row = self._id_rows.get(frame_id)
+            if row is None:
+                return np.zeros(0, dtype=np.int64)
+            start, end = self.id_bounds[row], self.id_bounds[row + 1]
+            times = self.times[start:end]
+            first = np.searchsorted(times, t_start) if t_start is not None else 0
+            last = np.searchsorted(times, t_end, side="right") if t_end is not None else len(times)
+            offsets = self.offsets[start + first:start + last]
+        else:
+            low = self.offset_at(t_start) if t_start is not None else 0
+            high = self.offset_at(t_end, "right") if t_end is not None else len(self.capture)
+            offsets = np.arange(low, high, dtype=np.int64)
+
+        if limit is not None:
+            offsets = offsets[:limit]
+        return np.asarray(offsets)
+
+    def frames(self, offsets):
+        """Frame dicts for a set of offsets"""
+        return [self.capture.frame_dict(offset) for offset in offsets]
+
+
+class _OpenIndex:
+    __slots__ = ("lock", "index", "opened")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.opened = 0.0
+
+
+_open_indexes = {}
+_open_indexes_lock = threading.Lock()
+
+
+def _frame_count(capture_path):
+    return (os.path.getsize(capture_path) - HEADER_SIZE) // FRAME_DTYPE.itemsize
+
+
+def open_index(capture_path, db=None):
+    """TraceIndex for a capture, kept open across calls
+
+    Concurrent calls for one capture wait for a single rebuild instead of
+    each starting their own. While a capture grows, queries are answered
+    from the index as it was for up to MIN_REBUILD_INTERVAL seconds.
+    """
+    capture_path = os.path.abspath(capture_path)
+    with _open_indexes_lock:
+        entry = _open_indexes.setdefault(capture_path, _OpenIndex())
+    with entry.lock:
+        index = entry.index
+        if index is not None and not index.lacks_choices(db):
+            if _frame_count(capture_path) == len(index.capture) or \
+                    time.monotonic() - entry.opened < MIN_REBUILD_INTERVAL:
+                return index
+        entry.index = TraceIndex.open(capture_path, db)
+        entry.opened = time.monotonic()
+        return entry.index
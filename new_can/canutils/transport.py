@@ -0,0 +1,263 @@
+# Reassembly of multi-frame transport protocol messages
+#
+# Diagnostic (ISO-TP, ISO 15765-2) and large J1939 (TP.CM/TP.DT, BAM and
+# RTS/CTS) payloads are split over several CAN frames. A Reassembler is fed
+# every received frame; frames that belong to a transport session are
+# consumed, and once a session completes its payload is returned as a
+# Reassembled message for the caller to put into the normal message stream.
+#
+# Sessions are keyed by (channel, source, target): for ISO-TP the CAN ID
+# identifies the sender/receiver pair, for J1939 it is the source and
+# destination addresses. The session table is bounded, sessions expire after
+# a timeout without frames, and payload buffers come from a preallocated
+# pool so reassembly itself does not allocate per frame.
+
+from canutils.router import j1939_pgn
+
+ISOTP_MAX_SIZE = 4095
+J1939_MAX_SIZE = 1785
+
+DEFAULT_MAX_SESSIONS = 256
+# ISO-TP N_Cr and J1939 T1 are 1000ms and 750ms; one timeout covers both
+DEFAULT_TIMEOUT = 1.0
+
+ISOTP_SINGLE = 0x0
+ISOTP_FIRST = 0x1
+ISOTP_CONSECUTIVE = 0x2
+ISOTP_FLOW_CONTROL = 0x3
+
+J1939_PGN_TP_CM = 0xEC00
+J1939_PGN_TP_DT = 0xEB00
+J1939_RTS = 16
+J1939_CTS = 17
+J1939_EOM_ACK = 19
+J1939_BAM = 32
+J1939_ABORT = 255
+
+PROTOCOL_ISOTP = "isotp"
+PROTOCOL_J1939 = "j1939"
+
+
+class Reassembled:
+    """A complete transport protocol payload"""
+
+    __slots__ = ("protocol", "channel", "source", "target", "frame_id", "pgn", "data", "timestamp")
+
+    def __init__(self, protocol, channel, source, target, frame_id, pgn, data, timestamp):
+        self.protocol = protocol
+        self.channel = channel
+        self.source = source
+        self.target = target
+        # ISO-TP: the CAN ID the payload arrived on. J1939: an ID for the
+        # transported PGN from the source, suitable for routing and decoding.
+        self.frame_id = frame_id
+        self.pgn = pgn
+        self.data = data
+        self.timestamp = timestamp
+
+
+class _Session:
+    __slots__ = ("key", "protocol", "buffer", "size", "received", "next_seq", "packets",
+                 "pgn", "frame_id", "started", "last_time")
+
+    def __init__(self, max_size):
+        self.buffer = bytearray(max_size)
+        self.key = None
+
+
+class Reassembler:
+    """Streaming ISO-TP and J1939 TP reassembly with a bounded session table"""
+
+    def __init__(self, isotp_ids=(), j1939=False, max_sessions=DEFAULT_MAX_SESSIONS, timeout=DEFAULT_TIMEOUT):
+        self.isotp_ids = frozenset(isotp_ids)
+        self.j1939 = j1939
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self._sessions = {}
+        self._free = {
+            PROTOCOL_ISOTP: [_Session(ISOTP_MAX_SIZE) for _ in range(max_sessions)] if self.isotp_ids else [],
+            PROTOCOL_J1939: [_Session(J1939_MAX_SIZE) for _ in range(max_sessions)] if j1939 else [],
+        }
+        self.completed = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.evicted = 0
+
+    def handles(self, frame_id, is_extended=False):
+        """Whether a frame belongs to a transport protocol this reassembler follows"""
+        if frame_id in self.isotp_ids:
+            return True
+        if self.j1939 and is_extended:
+            return (frame_id >> 8) & 0x3FF00 in (J1939_PGN_TP_CM, J1939_PGN_TP_DT)
+        return False
+
+    @property
+    def active_sessions(self):
+        return len(self._sessions)
+
+    def feed(self, channel, frame_id, data, timestamp, is_extended=False):
+        """Consume one transport frame, returning a Reassembled once a payload completes"""
+        if frame_id in self.isotp_ids:
+            return self._feed_isotp(channel, frame_id, data, timestamp)
+        if self.j1939 and is_extended:
+            pgn = j1939_pgn(frame_id)
+            if pgn == J1939_PGN_TP_CM:
+                return self._feed_j1939_cm(channel, frame_id, data, timestamp)
+            if pgn == J1939_PGN_TP_DT:
+                return self._feed_j1939_dt(channel, frame_id, data, timestamp)
+        return None
+
+    def expire(self, now):
+        """Drop sessions that have seen no frame for longer than the timeout"""
+        for key, session in list(self._sessions.items()):
+            if now - session.last_time > self.timeout:
+                self._release(key)
+                self.timeouts += 1
+
+    def _open(self, key, protocol, size, timestamp):
+        if key in self._sessions:
+            # A new first frame restarts the session
+            self._release(key)
+            self.errors += 1
+        free = self._free[protocol]
+        if not free:
+            oldest = min(
+                (k for k, s in self._sessions.items() if s.protocol == protocol),
+                key=lambda k: self._sessions[k].last_time
+            )
+            self._release(oldest)
+            self.evicted += 1
+        session = free.pop()
+        session.key = key
+        session.protocol = protocol
+        session.size = size
+        session.received = 0
+        session.next_seq = 1
+        session.packets = 0
+        session.pgn = None
+        session.frame_id = None
+        session.started = timestamp
+        session.last_time = timestamp
+        self._sessions[key] = session
+        return session
+
+    def _release(self, key):
+        session = self._sessions.pop(key)
+        session.key = None
+        self._free[session.protocol].append(session)
+
+    def _active(self, key, timestamp):
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        if timestamp - session.last_time > self.timeout:
+            self._release(key)
+            self.timeouts += 1
+            return None
+        session.last_time = timestamp
+        return session
+
+    def _append(self, session, data, start):
+        count = min(len(data) - start, session.size - session.received)
+        session.buffer[session.received:session.received + count] = data[start:start + count]
+        session.received += count
+        return session.received >= session.size
+
+    def _complete(self, session, channel, source, target):
+        payload = bytes(session.buffer[:session.size])
+        result = Reassembled(session.protocol, channel, source, target, session.frame_id,
+                             session.pgn, payload, session.last_time)
+        self._release(session.key)
+        self.completed += 1
+        return result
+
+    def _feed_isotp(self, channel, frame_id, data, timestamp):
+        if not data:
+            return None
+        frame_type = data[0] >> 4
+        key = (channel, frame_id, None)
+
+        if frame_type == ISOTP_SINGLE:
+            size = data[0] & 0x0F
+            if not 0 < size <= len(data) - 1:
+                self.errors += 1
+                return None
+            self.completed += 1
+            return Reassembled(PROTOCOL_ISOTP, channel, frame_id, None, frame_id, None,
+                               bytes(data[1:1 + size]), timestamp)
+
+        if frame_type == ISOTP_FIRST:
+            size = ((data[0] & 0x0F) << 8) | data[1]
+            if size < 8:
+                self.errors += 1
+                return None
+            session = self._open(key, PROTOCOL_ISOTP, size, timestamp)
+            session.frame_id = frame_id
+            self._append(session, data, 2)
+            return None
+
+        if frame_type == ISOTP_CONSECUTIVE:
+            session = self._active(key, timestamp)
+            if session is None:
+                return None
+            if data[0] & 0x0F != session.next_seq:
+                self._release(key)
+                self.errors += 1
+                return None
+            session.next_seq = (session.next_seq + 1) & 0x0F
+            if self._append(session, data, 1):
+                return self._complete(session, channel, frame_id, None)
+            return None
+
+        # Flow control frames only pace the sender
+        return None
+
+    def _feed_j1939_cm(self, channel, frame_id, data, timestamp):
+        if len(data) < 8:
+            self.errors += 1
+            return None
+        control = data[0]
+        source = frame_id & 0xFF
+        target = (frame_id >> 8) & 0xFF
+        key = (channel, source, target)
+
+        if control in (J1939_BAM, J1939_RTS):
+            size = data[1] | (data[2] << 8)
+            if not 9 <= size <= J1939_MAX_SIZE:
+                self.errors += 1
+                return None
+            session = self._open(key, PROTOCOL_J1939, size, timestamp)
+            session.packets = data[3]
+            session.pgn = data[5] | (data[6] << 8) | (data[7] << 16)
+            # Rebuild an ID for the transported PGN so it routes like a single frame
+            priority = (frame_id >> 26) & 0x7
+            pgn = session.pgn
+            if (pgn >> 8) & 0xFF < 240:
+                pgn |= target
+            session.frame_id = (priority << 26) | (pgn << 8) | source
+        elif control == J1939_ABORT:
+            # Sent by either side, so the session may be keyed the other way round
+            for abort_key in (key, (channel, target, source)):
+                if abort_key in self._sessions:
+                    self._release(abort_key)
+                    self.errors += 1
+        # CTS and EOM acknowledgements only pace the sender
+        return None
+
+    def _feed_j1939_dt(self, channel, frame_id, data, timestamp):
+        if not data:
+            return None
+        source = frame_id & 0xFF
+        target = (frame_id >> 8) & 0xFF
+        key = (channel, source, target)
+        session = self._active(key, timestamp)
+        if session is None:
+            return None
+        if data[0] != session.next_seq:
+            self._release(key)
+            self.errors += 1
+            return None
+        session.next_seq += 1
+        if self._append(session, data, 1):
+            return self._complete(session, channel, source, target)
+        return None
@@ -0,0 +1,200 @@
+# Triggered (conditional) capture
+#
+# A TriggerEngine sits in the ingest path in front of a CaptureWriter. Every
+# received frame goes into a ring buffer of the last pre_frames frames;
+# nothing is written until a trigger condition fires. Then the ring buffer is
+# written out, followed by the next post_frames frames, so the capture holds
+# only the windows around interesting events. A trigger firing again inside
+# the post-trigger window extends it.
+#
+# Conditions use the filter expression language (canutils.filters):
+#
+#   MatchCondition("id == 0x123")                        the frame is seen
+#   CrossingCondition("Battery.Voltage > 400")           the expression becomes true
+#   SequenceCondition("State == CRANK", "id == 0x7E8", 0.05)
+#                                                        A then B within 50ms
+#   MissingCondition(0x100, 3.0)                         0x100 absent for > 3 cycle times
+#
+# Each firing is appended to <capture>.triggers as a JSON line. The file is
+# opened at the first firing and kept open until close().
+
+import collections
+import json
+import logging
+
+from canutils.filters import compile_filter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRE_FRAMES = 1000
+DEFAULT_POST_FRAMES = 1000
+# Weight of the newest period in the learned cycle time of MissingCondition
+PERIOD_SMOOTHING = 0.1
+
+
+class MatchCondition:
+    """Fires on every frame matching an expression"""
+
+    def __init__(self, expression, db=None):
+        self.filter = compile_filter(expression, db)
+
+    def __str__(self):
+        return self.filter.expression
+
+    def check(self, frame_id, name, dlc, signals, timestamp):
+        return self.filter.match_id(frame_id) and self.filter.predicate(frame_id, name, dlc, signals)
+
+    def poll(self, now):
+        return False
+
+
+class CrossingCondition(MatchCondition):
+    """Fires when an expression goes from false to true, tracked per ID"""
+
+    def __init__(self, expression, db=None):
+        super().__init__(expression, db)
+        self._state = {}
+
+    def __str__(self):
+        return f"rises: {self.filter.expression}"
+
+    def check(self, frame_id, name, dlc, signals, timestamp):
+        if not self.filter.match_id(frame_id):
+            return False
+        matched = self.filter.predicate(frame_id, name, dlc, signals)
+        # The first frame of an ID only sets the state, so a value that is
+        # already over the threshold at startup is not a crossing
+        previous = self._state.get(frame_id, matched)
+        self._state[frame_id] = matched
+        return matched and not previous
+
+
+class SequenceCondition:
+    """Fires when a frame matching `second` follows one matching `first` within `within` seconds"""
+
+    def __init__(self, first, second, within, db=None):
+        self.first = compile_filter(first, db)
+        self.second = compile_filter(second, db)
+        self.within = within
+        self._first_seen = None
+
+    def __str__(self):
+        return f"{self.first.expression} then {self.second.expression} within {self.within * 1000:g}ms"
+
+    def check(self, frame_id, name, dlc, signals, timestamp):
+        if self._first_seen is not None and self.second.match_id(frame_id) and \
+                self.second.predicate(frame_id, name, dlc, signals):
+            if timestamp - self._first_seen <= self.within:
+                self._first_seen = None
+                return True
+        if self.first.match_id(frame_id) and self.first.predicate(frame_id, name, dlc, signals):
+            self._first_seen = timestamp
+        return False
+
+    def poll(self, now):
+        return False
+
+
+class MissingCondition:
+    """Fires once when an ID has not been seen for more than factor x its cycle time
+
+    The cycle time comes from the DBC (GenMsgCycleTime) when available and is
+    otherwise learned from the frames seen. The condition re-arms once the ID
+    is seen again.
+    """
+
+    def __init__(self, frame_id, factor=3.0, db=None, cycle_time=None):
+        self.frame_id = frame_id
+        self.factor = factor
+        self.cycle_time = cycle_time
+        self._learn = cycle_time is None
+        if self._learn and db is not None:
+            for msg in db.messages:
+                if msg.frame_id == frame_id and getattr(msg, "cycle_time", None):
+                    self.cycle_time = msg.cycle_time / 1000.0
+                    self._learn = False
+                    break
+        self._last_seen = None
+        self._fired = False
+
+    def __str__(self):
+        return f"{hex(self.frame_id)} missing for > {self.factor:g}x its cycle time"
+
+    def check(self, frame_id, name, dlc, signals, timestamp):
+        if frame_id == self.frame_id:
+            if self._learn and self._last_seen is not None:
+                period = timestamp - self._last_seen
+                if self.cycle_time is None:
+                    self.cycle_time = period
+                else:
+                    self.cycle_time += PERIOD_SMOOTHING * (period - self.cycle_time)
+            self._last_seen = timestamp
+            self._fired = False
+            return False
+        return self.poll(timestamp)
+
+    def poll(self, now):
+        if self._fired or self._last_seen is None or not self.cycle_time:
+            return False
+        if now - self._last_seen > self.factor * self.cycle_time:
+            self._fired = True
+            return True
+        return False
+
+
+class TriggerEngine:
+    """Writes only the frames around trigger events to a capture"""
+
+    def __init__(self, writer, conditions, pre_frames=DEFAULT_PRE_FRAMES, post_frames=DEFAULT_POST_FRAMES):
+        self.writer = writer
+        self.conditions = list(conditions)
+        self.post_frames = post_frames
+        self._pre = collections.deque(maxlen=pre_frames)
+        self._post_remaining = 0
+        self.fired = 0
+        self.frames_written = 0
+        self.events_path = writer.path + ".triggers"
+        self._events = None
+
+    @property
+    def triggered(self):
+        """Whether frames are currently being written (inside a post-trigger window)"""
+        return self._post_remaining > 0
+
+    def record(self, message):
+        """Take a received python-can Message into the ring buffer or the open window"""
+        if self._post_remaining:
+            self.writer.write_message(message)
+            self.frames_written += 1
+            self._post_remaining -= 1
+        else:
+            self._pre.append(message)
+
+    def evaluate(self, frame_id, name, dlc, signals, timestamp):
+        """Check every condition against a (decoded) frame; call after record()"""
+        for condition in self.conditions:
+            if condition.check(frame_id, name, dlc, signals, timestamp):
+                self._fire(condition, timestamp)
+
+    def poll(self, now):
+        """Check time based conditions when no frames arrive"""
+        for condition in self.conditions:
+            if condition.poll(now):
+                self._fire(condition, now)
+
+    def _fire(self, condition, timestamp):
+        self.fired += 1
+        logger.info("Trigger fired at %.6f: %s", timestamp, condition, extra={"rate_key": str(condition)})
+        if self._events is None:
+            self._events = open(self.events_path, "a")
+        self._events.write(json.dumps({"timestamp": timestamp, "condition": str(condition)}) + "\n")
+        while self._pre:
+            self.writer.write_message(self._pre.popleft())
+            self.frames_written += 1
+        self._post_remaining = self.post_frames
+
+    def close(self):
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+        self.writer.close()
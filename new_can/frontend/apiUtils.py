@@ -1,73 +1,216 @@
 import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
 import aiohttp
-import requests
-BASE_URL="http://localhost:8000"
+
+logger = logging.getLogger(__name__)
+
+# The backend mounts its API under api/
+BASE_URL="http://localhost:8000/api"
 #can change url for this app
 
+# GET responses under these paths are cached until the next mutating request.
+# /view/can/<file> is not one of them: it also selects the file on the server.
+CACHED_PATHS = ("/view/dbc",)
+# Only these methods are retried, so a failed transmit is never sent twice
+IDEMPOTENT_METHODS = ("GET", "PUT", "DELETE")
+
+
+class ApiError(Exception):
+    """Raised when the backend answers with an error status"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class ApiClient:
+    """Backend client running on its own event loop thread
+
+    Requests share one pooled aiohttp session and return
+    concurrent.futures.Future objects, so they can be started from Tk
+    callbacks without blocking the UI. Use call_on_tk to get the result back
+    on the Tk thread.
+    """
+
+    def __init__(self, base_url=BASE_URL, timeout=5.0, retries=3, backoff=0.2,
+                 cache_ttl=30.0, max_connections=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_ttl = cache_ttl
+        self.max_connections = max_connections
+        self._cache = {}
+        # Bumped by every mutating request; GETs that overlap one aren't cached
+        self._cache_generation = 0
+        self._session = None
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _get_session(self):
+        # aiohttp sessions must be created on the loop that uses them
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def request(self, method, path, json=None, data=None, transform=None):
+        """Start a request and return a Future for its (transformed) JSON body"""
+        return asyncio.run_coroutine_threadsafe(
+            self._request(method.upper(), path, json, data, transform),
+            self._loop
+        )
+
+    def get(self, path, transform=None):
+        return self.request("GET", path, transform=transform)
+
+    def post(self, path, json=None, data=None, transform=None):
+        return self.request("POST", path, json=json, data=data, transform=transform)
+
+    def put(self, path, json=None, transform=None):
+        return self.request("PUT", path, json=json, transform=transform)
+
+    def upload(self, path, file_path, method="POST"):
+        """Upload a file as the multipart 'data' field"""
+        with open(file_path, "rb") as f:
+            contents = f.read()
+        form = aiohttp.FormData()
+        form.add_field("data", contents, filename=os.path.basename(file_path))
+        return self.request(method, path, data=form)
+
+    async def _request(self, method, path, json, data, transform):
+        if method == "GET":
+            return await self._get(path, transform)
+        # Any change on the server may make cached responses stale, whether
+        # or not the request succeeds
+        self._invalidate()
+        try:
+            body = await self._send(method, path, json, data)
+        finally:
+            self._invalidate()
+        return transform(body) if transform else body
+
+    async def _get(self, path, transform):
+        cacheable = path.startswith(CACHED_PATHS)
+        if cacheable:
+            cached = self._cache.get(path)
+            if cached and cached[0] > time.monotonic():
+                return transform(cached[1]) if transform else cached[1]
+        generation = self._cache_generation
+        body = await self._send("GET", path, None, None)
+        if cacheable and generation == self._cache_generation:
+            self._cache[path] = (time.monotonic() + self.cache_ttl, body)
+        return transform(body) if transform else body
+
+    async def _send(self, method, path, json, data):
+        session = await self._get_session()
+        attempts = self.retries + 1 if method in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            try:
+                async with session.request(method, self.base_url + path, json=json, data=data) as response:
+                    try:
+                        body = await response.json(content_type=None)
+                    except ValueError:
+                        body = await response.text()
+                    if response.status >= 500 and attempt < attempts - 1:
+                        raise aiohttp.ClientResponseError(response.request_info, (), status=response.status)
+                    if response.status >= 400:
+                        message = body.get("response") if isinstance(body, dict) else body
+                        raise ApiError(response.status, message)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == attempts - 1:
+                    raise
+                # Exponential backoff with jitter so clients don't retry in lockstep
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        return body
+
+    def _invalidate(self):
+        self._cache_generation += 1
+        self._cache.clear()
+
+    def invalidate_cache(self):
+        """Drop all cached responses"""
+        self._loop.call_soon_threadsafe(self._invalidate)
+
+    def close(self):
+        """Close the session and stop the event loop thread"""
+        async def shutdown():
+            if self._session is not None:
+                await self._session.close()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=self.timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=self.timeout)
+
+
+def call_on_tk(root, future, callback, error_callback=None, poll_interval=50):
+    """Run callback(result) on the Tk thread once a Future completes
+
+    Tk is not thread-safe, so the future is polled with root.after rather
+    than calling back from the event loop thread.
+    """
+    def poll():
+        if not future.done():
+            root.after(poll_interval, poll)
+            return
+        error = future.exception()
+        if error is None:
+            callback(future.result())
+        elif error_callback:
+            error_callback(error)
+        else:
+            logger.error("API request failed: %s", error)
+    root.after(0, poll)
+
+
+_client = None
+
+def get_client():
+    """Shared client used by the module-level helpers"""
+    global _client
+    if _client is None:
+        _client = ApiClient()
+    return _client
+
+
 def flattenCanMessageObject(messages):
     return [{"frameID":frame_id, **attributes} for frame_id, attributes in messages.items()]
 
-async def uploadFile(file):
-    try:
-        with open (file_path, "rb") as file:
-            response=requests.post(f"{BASE_URL}/upload/db", files={"data": file})
-        return response.text
-    except excpetion as e:
-        print("Failed to upload, "e)
-        return None
-async def getPreview():
-    try:
-        response=requests.get(f"{BASE_URL}/view/dbc")
-        json_data=response.json()
-        return json_data.get("response", [])
-    except Exception as e:
-        print("fetching files failed", e)  
-        return None
+def uploadFile(file_path):
+    return get_client().upload("/upload/dbc", file_path)
+
+def getPreview():
+    return get_client().get("/view/dbc", transform=lambda body: body.get("response", []))
+
 def view_files(filename):
-    try:
-        response = requests.get(f"{BASE_URL}/view/can/{filename}")
-        canMessages=requests.json()
-        return can_messages.get("response", [])
-    except Exception as e:
-        print("Fetching file failed",e)
-        return None
-    
+    return get_client().get(f"/view/can/{filename}", transform=lambda body: body.get("response", []))
+
 def view_can_messages(filename):
-    try:
-        response=requests.get(f"{BASE_URL}/view/can/{filename}")
-        json_data=response.json()
-        return flatten_can_message(json_data.get("response", []))
-    except Exception as e:
-        print("Fetching CAN messages failed", e)
-        return None
-    
+    return get_client().get(
+        f"/view/can/{filename}",
+        transform=lambda body: flattenCanMessageObject(body.get("response", {}))
+    )
+
 def transmit_can_messages(frame_id, name, file, signals):
-    try:
-        response=requests.post(f"{BASE_URL}/transmit", json={
-            "frame_id": frame_id,
-            "name": name,
-            "file": file,
-            "signals": signals
-        })
-        return response.text
-    
-    except Exception as e:
-        print("transmitting CAN message failed retarf", e)
-        return None
+    return get_client().post("/transmit", json={
+        "frame_id": frame_id,
+        "name": name,
+        "file": file,
+        "signals": signals
+    })
 
 def change_settings(settings):
-    try:
-        response=requests.put("http://localhost:8000/change_can_settings");
-        json_data=response.json()
-        print(json_data)
-        return json_data
-    except Exception as e:
-        print("failed to change settings, ", e)
-        return None
+    return get_client().put("/change_can_settings", json=settings)
+
 def get_settings():
-    try:
-        response=requests.get(f"{BASE_URL}/get_can_settings")
-        return response.json()  
-    except Exception as e:
-        print("failed to fetch settings ", e)
-        return None
\ No newline at end of file
+    return get_client().get("/get_can_settings")
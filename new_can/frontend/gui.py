@@ -1,12 +1,14 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import requests
 import json
 
+from apiUtils import ApiClient, call_on_tk
+
 import matplotlib.ply as plt
 import pandas as pd
 
-API_BASE_URL = '127.0.0.01'
+API_BASE_URL = 'http://127.0.0.1:8000'
+api_client = ApiClient(API_BASE_URL)
 
 #idk not done
 
@@ -17,13 +19,12 @@ class CanMonitorApp:
 
     
 def fetch_can_data():
-    try:
-        response = requests.get(f"{API_BASE_URL}/can_data")
-        response.raise_for_status()  
-        data = response.json()
-        update_treeview(data)
-    except requests.exceptions.RequestException as e:
-        messagebox.showerror("Error", f"Failed to fetch data: {e}")
+    call_on_tk(
+        root,
+        api_client.get("/can_data"),
+        update_treeview,
+        lambda e: messagebox.showerror("Error", f"Failed to fetch data: {e}")
+    )
 
 def update_treeview(data):
     tree.delete(*tree.get_children())
@@ -34,14 +35,12 @@ def send_can_message():
     can_id = id_entry.get()
     can_data = data_entry.get()
 
-    try:
-        response = requests.post(
-            f"{API_BASE_URL}/send_can_message", json={"id": can_id, "data": can_data}
-        )
-        response.raise_for_status()
-        messagebox.showinfo("Success", "CAN message sent successfully.")
-    except requests.exceptions.RequestException as e:
-        messagebox.showerror("Error", f"Failed to send message: {e}")
+    call_on_tk(
+        root,
+        api_client.post("/send_can_message", json={"id": can_id, "data": can_data}),
+        lambda response: messagebox.showinfo("Success", "CAN message sent successfully."),
+        lambda e: messagebox.showerror("Error", f"Failed to send message: {e}")
+    )
 
 
 tree = ttk.Treeview(root, columns=("ID", "Data"), show="headings")
@@ -2,22 +2,40 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import json
 import os
+import sys
+import atexit
+import tempfile
 import threading
 import queue
 import time
+import math
 import random
-import cantools
 from datetime import datetime
 import logging
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='can_app.log'
-)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from canutils import dbc_snapshot
+from canutils.stats import StatsEngine
+from canutils.filters import compile_filter, FilterSyntaxError
+from canutils import metrics
+from canutils import profiler
+from canutils.delta import DeltaEncoder
+from canutils.dbc_diff import diff_databases
+from canutils.asynclog import setup_logging
+
+# Set up logging; records are written by a listener thread and repeats are rate limited
+setup_logging(level=logging.INFO, filename='can_app.log')
 logger = logging.getLogger(__name__)
 
+SIMULATED_FRAMES = metrics.counter("can_simulated_frames_total", "Frames generated by the offline simulator")
+ENCODE_TIME = metrics.histogram("can_encode_seconds", "Time to encode one simulated frame")
+SEND_TIME = metrics.histogram("can_send_seconds", "Time to validate, encode and queue a sent frame")
+QUEUE_WAIT = metrics.histogram("can_queue_wait_seconds", "Time frames spend queued before the UI takes them")
+QUEUE_DEPTH = metrics.gauge("can_queue_depth", "Frames waiting for the UI at the last update")
+RENDER_TIME = metrics.histogram("can_gui_render_seconds", "Time spent in one UI update")
+RING_LOST = metrics.gauge("can_ring_lost_frames", "Frames the GUI missed because the shared-memory ring wrapped")
+MESSAGES_PER_TICK = metrics.gauge("can_gui_messages_per_tick", "Messages handled by the last UI update")
+
 class OfflineCANSimulator:
     """Simulates CAN bus activity without actual CAN hardware"""
     
@@ -28,23 +46,108 @@ class OfflineCANSimulator:
         self.simulation_thread = None
         self.db_path = db_path
         self.messages = {}
+        self.stats = StatsEngine()
+        self.filter_expression = None
+        self.message_filter = None
+        # Set by set_changes_only(); queued messages then carry only changed signals
+        self.delta = None
         self.load_db(db_path)
         
     def load_db(self, db_path):
         """Load a DBC file"""
+        db = self.read_db(db_path)
+        if db is None:
+            return False
+        self.use_db(db, db_path)
+        return True
+        
+    def read_db(self, db_path):
+        """Parse a DBC file without touching the simulator; None if it cannot be loaded"""
         if not db_path or not os.path.exists(db_path):
             logger.warning(f"DBC file not found: {db_path}")
-            return False
+            return None
         
         try:
-            self.db = cantools.database.load_file(db_path)
-            self.messages = {msg.frame_id: msg for msg in self.db.messages}
-            logger.info(f"Loaded DBC file: {db_path} with {len(self.messages)} messages")
-            return True
+            return dbc_snapshot.load_file(db_path)
         except Exception as e:
             logger.error(f"Error loading DBC file: {e}")
-            return False
+            return None
+            
+    def use_db(self, db, db_path):
+        """Switch to a database returned by read_db()"""
+        self.db = db
+        self.db_path = db_path
+        self.messages = {msg.frame_id: msg for msg in db.messages}
+        self.stats.reset()
+        self.stats.set_database(db)
+        if self.delta:
+            self.delta.reset()
+        if self.filter_expression:
+            # Recompile so the ID set is narrowed with the new database
+            self.message_filter = compile_filter(self.filter_expression, db)
+        logger.info(f"Loaded DBC file: {db_path} with {len(self.messages)} messages")
             
+    def reload_db(self, db=None):
+        """Reload the current DBC file, swapping in only the messages that changed
+
+        Unlike load_db() statistics and unchanged messages' state are kept,
+        so a running simulation carries on. db is the file already parsed by
+        read_db(), if the caller did that itself. Returns the DbcDiff, or
+        None if the file could not be loaded.
+        """
+        if not self.db:
+            return None
+        if db is None:
+            db = self.read_db(self.db_path)
+            if db is None:
+                return None
+        diff = diff_databases(self.db, db)
+        if diff:
+            messages = dict(self.messages)
+            for msg in diff.removed:
+                messages.pop(msg.frame_id, None)
+            for msg in diff.added + [change.new for change in diff.changed]:
+                messages[msg.frame_id] = msg
+            # One assignment each, so the simulation thread never sees a half-updated map
+            self.messages = messages
+            self.db = db
+            self.stats.set_database(db)
+            if self.delta:
+                self.delta.forget(diff.affected_ids)
+            if self.filter_expression:
+                self.message_filter = compile_filter(self.filter_expression, db)
+        logger.info(f"Reloaded DBC file: {self.db_path} ({diff.summary()})")
+        return diff
+            
+    def set_filter(self, expression):
+        """Only queue messages matching a filter expression (None or empty to clear)
+
+        Raises FilterSyntaxError if the expression is invalid.
+        """
+        if not expression:
+            self.filter_expression = None
+            self.message_filter = None
+            return
+        self.message_filter = compile_filter(expression, self.db)
+        self.filter_expression = expression
+        logger.info(f"Applied message filter: {expression}")
+        
+    def set_changes_only(self, enabled, deadbands=None):
+        """Queue only the signals that changed since their last queued value
+
+        deadbands maps "Signal" or "Message.Signal" to the smallest change passed on.
+        """
+        self.delta = DeltaEncoder(deadbands) if enabled else None
+        
+    def _accepts(self, msg, encoded_data, signals):
+        """Check a message against the active filter"""
+        message_filter = self.message_filter
+        if message_filter is None:
+            return True
+        if not message_filter.match_id(msg.frame_id):
+            return False
+        return message_filter.predicate(msg.frame_id, msg.name, len(encoded_data), signals)
+        
     def start_simulation(self, frequency=10):
         """Start simulating CAN messages"""
         if self.running or not self.db:
@@ -78,8 +181,10 @@ class OfflineCANSimulator:
                 time.sleep(sleep_time)
                 continue
                 
-            frame_id = random.choice(list(self.messages.keys()))
-            msg = self.messages[frame_id]
+            # A DBC reload replaces the map; use one version of it throughout
+            messages = self.messages
+            frame_id = random.choice(list(messages.keys()))
+            msg = messages[frame_id]
             
             # Generate random values for signals
             data = {}
@@ -107,11 +212,17 @@ class OfflineCANSimulator:
             
             try:
                 # Encode the message
+                if metrics.enabled:
+                    start = time.perf_counter()
                 encoded_data = msg.encode(data)
+                if metrics.enabled:
+                    ENCODE_TIME.observe(time.perf_counter() - start)
+                    SIMULATED_FRAMES.inc()
+                now = time.time()
                 
                 # Create a simulated message
                 message = {
-                    "timestamp": str(datetime.now()),
+                    "timestamp": str(datetime.fromtimestamp(now)),
                     "name": msg.name,
                     "sender": msg.senders[0] if msg.senders else "Unknown",
                     "arbitration_id": hex(msg.frame_id),
@@ -123,18 +234,38 @@ class OfflineCANSimulator:
                 }
                 
                 # Add to queue
-                self.message_queue.put(message)
+                self.stats.update(msg.frame_id, now, len(encoded_data), msg.is_extended_frame)
+                if self._accepts(msg, encoded_data, data):
+                    if self.delta:
+                        # Frames where nothing changed are not queued at all
+                        message["decoded_data"] = self.delta.changes(msg.frame_id, data, msg.name, now)
+                        if message["decoded_data"] is None:
+                            time.sleep(sleep_time)
+                            continue
+                    self.queue_message(message)
                 
             except Exception as e:
-                logger.error(f"Error simulating message {msg.name}: {e}")
+                logger.error("Error simulating message %s: %s", msg.name, e, extra={"rate_key": hex(msg.frame_id)})
             
             time.sleep(sleep_time)
     
+    def queue_message(self, message):
+        """Queue a message for the UI, stamped so its queue wait can be measured"""
+        self.message_queue.put((time.perf_counter(), message))
+        
     def get_messages(self):
         """Get all queued messages and clear the queue"""
         messages = []
+        if metrics.enabled:
+            QUEUE_DEPTH.set(self.message_queue.qsize())
+            now = time.perf_counter()
+            while not self.message_queue.empty():
+                queued_at, message = self.message_queue.get()
+                QUEUE_WAIT.observe(now - queued_at)
+                messages.append(message)
+            return messages
         while not self.message_queue.empty():
-            messages.append(self.message_queue.get())
+            messages.append(self.message_queue.get()[1])
         return messages
         
     def send_message(self, frame_id, signals):
@@ -144,6 +275,7 @@ class OfflineCANSimulator:
             return False
             
         msg = self.messages[frame_id]
+        start = time.perf_counter()
         
         try:
             # Validate signals
@@ -167,10 +299,11 @@ class OfflineCANSimulator:
             
             # Encode the message
             encoded_data = msg.encode(signals)
+            now = time.time()
             
             # Create a simulated message (as if we received it)
             message = {
-                "timestamp": str(datetime.now()),
+                "timestamp": str(datetime.fromtimestamp(now)),
                 "name": msg.name,
                 "sender": msg.senders[0] if msg.senders else "Unknown",
                 "arbitration_id": hex(msg.frame_id),
@@ -182,7 +315,14 @@ class OfflineCANSimulator:
             }
             
             # Add to queue as if we received it
-            self.message_queue.put(message)
+            self.stats.update(msg.frame_id, now, len(encoded_data), msg.is_extended_frame)
+            if self._accepts(msg, encoded_data, signals):
+                if self.delta:
+                    # Sent frames are always shown in full, but still update the last-known values
+                    self.delta.changes(msg.frame_id, signals, msg.name, now)
+                self.queue_message(message)
+            if metrics.enabled:
+                SEND_TIME.observe(time.perf_counter() - start)
             logger.info(f"Sent message: {msg.name} with {len(signals)} signals")
             return True
             
@@ -190,6 +330,70 @@ class OfflineCANSimulator:
             logger.error(f"Error sending message: {e}")
             return False
 
+class SharedMemorySource:
+    """Frames decoded by read_can_data.py --shm, taken from its shared-memory ring
+
+    The reader process does the decoding, so the Tk thread only turns the
+    new ring records into message dicts. Signals are mapped by position
+    using the simulator's DBC, which must be the one the reader decodes with.
+    """
+    
+    # Ring records turned into messages per UI tick; the rest wait for the next tick
+    MAX_PER_TICK = 5000
+    
+    def __init__(self, simulator, name=None):
+        # numpy is only loaded once the shared-memory source is chosen
+        from canutils.shm import FrameRingReader, DEFAULT_NAME
+        self.simulator = simulator
+        self.reader = FrameRingReader(name or DEFAULT_NAME)
+        
+    def get_messages(self):
+        """Messages written to the ring since the last call"""
+        records = self.reader.read(self.MAX_PER_TICK)
+        if not len(records):
+            return []
+        if metrics.enabled:
+            RING_LOST.set(self.reader.lost)
+        
+        messages = []
+        has_values = "values" in records.dtype.names
+        values = records["values"].tolist() if has_values else None
+        datas = records["data"].tolist()
+        known = self.simulator.messages
+        for i, (timestamp, frame_id, dlc, count) in enumerate(zip(
+            records["timestamp"].tolist(), records["arbitration_id"].tolist(),
+            records["dlc"].tolist(), records["signal_count"].tolist()
+        )):
+            msg = known.get(frame_id)
+            data = bytes(datas[i][:dlc])
+            decoded = {}
+            if msg is not None and has_values:
+                for signal, value in zip(msg.signals[:count], values[i]):
+                    # NaN marks a signal that was not sent in this frame
+                    if value != value:
+                        continue
+                    if value.is_integer():
+                        value = int(value)
+                        if signal.choices and value in signal.choices:
+                            value = str(signal.choices[value])
+                    decoded[signal.name] = value
+            messages.append({
+                "timestamp": str(datetime.fromtimestamp(timestamp)),
+                "name": msg.name if msg else "Unknown",
+                "sender": msg.senders[0] if msg and msg.senders else "Unknown",
+                "arbitration_id": hex(frame_id),
+                "dlc": dlc,
+                "hex": data.hex(),
+                "bin_data": ''.join(format(byte, '08b') for byte in data),
+                "dec": int.from_bytes(data, byteorder='big', signed=False),
+                "decoded_data": decoded
+            })
+        return messages
+        
+    def close(self):
+        self.reader.close()
+
+
 class DbcFileManager:
     """Manages DBC files locally"""
     
@@ -214,7 +418,7 @@ class DbcFileManager:
             
         try:
             # Validate it's a proper DBC file by loading it
-            db = cantools.database.load_file(file_path)
+            db = dbc_snapshot.load_file(file_path, use_snapshot=False)
             
             # Copy to our directory
             filename = os.path.basename(file_path)
@@ -223,6 +427,8 @@ class DbcFileManager:
             with open(file_path, 'rb') as src, open(dest_path, 'wb') as dest:
                 dest.write(src.read())
                 
+            # Store the parsed database so later loads skip the parse
+            dbc_snapshot.write_snapshot(dest_path, db)
             return True
         except Exception as e:
             logger.error(f"Error adding DBC file: {e}")
@@ -242,7 +448,7 @@ class DbcFileManager:
             return {}
             
         try:
-            db = cantools.database.load_file(path)
+            db = dbc_snapshot.load_file(path)
             can_message_dict = {}
             
             for msg in db.messages:
@@ -265,11 +471,22 @@ class DbcFileManager:
             return {}
 
 class SettingsManager:
-    """Manages application settings"""
+    """Manages application settings
     
-    def __init__(self, settings_file="app_settings.json"):
+    Changes are kept in memory and written behind on a background timer (or
+    at exit), so callers on the Tk thread never wait on disk I/O.
+    """
+    
+    def __init__(self, settings_file="app_settings.json", flush_delay=1.0):
         self.settings_file = settings_file
+        self.flush_delay = flush_delay
         self.settings = self._load_settings()
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer = None
+        atexit.register(self.flush)
         
     def _load_settings(self):
         """Load settings from file"""
@@ -292,33 +509,92 @@ class SettingsManager:
         }
         
     def save_settings(self):
-        """Save settings to file"""
-        try:
-            with open(self.settings_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"Error saving settings: {e}")
-            return False
-            
+        """Save settings to file atomically"""
+        with self._write_lock:
+            with self._lock:
+                data = json.dumps(self.settings)
+                self._dirty = False
+                
+            # Write to a temporary file and rename it over the old one so a
+            # crash mid-write never leaves a truncated settings file
+            try:
+                directory = os.path.dirname(os.path.abspath(self.settings_file))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.settings_file)
+                except BaseException:
+                    # Don't leave the half-written file behind
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+                return True
+            except Exception as e:
+                logger.error(f"Error saving settings: {e}")
+                with self._lock:
+                    self._dirty = True
+                return False
+                
+    def flush(self):
+        """Write pending changes now"""
+        with self._lock:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return True
+        return self.save_settings()
+        
+    def _on_flush_timer(self):
+        with self._lock:
+            self._flush_timer = None
+        self.flush()
+        
+    def _schedule_flush(self):
+        """Batch changes into a single write after flush_delay seconds"""
+        with self._lock:
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_delay, self._on_flush_timer)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+                
+    def add_listener(self, key, callback):
+        """Call callback(value) whenever a setting changes"""
+        self._listeners.setdefault(key, []).append(callback)
+        
+    def _notify(self, key, value):
+        for callback in self._listeners.get(key, []):
+            try:
+                callback(value)
+            except Exception as e:
+                logger.error(f"Error in settings listener for {key}: {e}")
+                
     def get_setting(self, key, default=None):
         """Get a setting value"""
         return self.settings.get(key, default)
         
     def set_setting(self, key, value):
         """Set a setting value"""
-        self.settings[key] = value
-        return self.save_settings()
+        with self._lock:
+            self.settings[key] = value
+        self._schedule_flush()
+        self._notify(key, value)
+        return True
         
     def add_recent_dbc_file(self, file_path):
         """Add a DBC file to recent files list"""
-        recent = self.settings.get("recent_dbc_files", [])
+        recent = list(self.settings.get("recent_dbc_files", []))
         if file_path in recent:
             recent.remove(file_path)
         recent.insert(0, file_path)
         # Keep only the 5 most recent
-        self.settings["recent_dbc_files"] = recent[:5]
-        return self.save_settings()
+        return self.set_setting("recent_dbc_files", recent[:5])
 
 class CANApp:
     """Main application class"""
@@ -332,21 +608,29 @@ class CANApp:
         self.settings_manager = SettingsManager()
         self.dbc_manager = DbcFileManager()
         self.simulator = OfflineCANSimulator()
+        # Bumped by every DBC load so results of superseded ones are dropped
+        self._dbc_load_generation = 0
+        self.simulator.set_changes_only(
+            self.settings_manager.get_setting("changes_only", False),
+            self.settings_manager.get_setting("signal_deadbands")
+        )
         
-        # Load last used DBC file if available
+        # Setup UI
+        self._create_menu()
+        self._create_layout()
+        
+        # Load last used DBC file in the background so the window shows immediately
         last_dbc = self.settings_manager.get_setting("selected_dbc_file")
         if last_dbc:
             dbc_path = self.dbc_manager.get_dbc_path(last_dbc)
             if dbc_path:
-                self.simulator.load_db(dbc_path)
-        
-        # Setup UI
-        self._create_menu()
-        self._create_layout()
+                self._start_dbc_load(dbc_path)
         
         # Start the UI update timer
         self.update_timer_id = None
         self._schedule_ui_update()
+        self.stats_timer_id = None
+        self._schedule_stats_update()
         
         # Apply window size from settings
         window_size = self.settings_manager.get_setting("window_size", {"width": 1024, "height": 768})
@@ -376,11 +660,16 @@ class CANApp:
         # File menu
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Open DBC File", command=self._open_dbc_file)
+        file_menu.add_command(label="Reload DBC File", command=self._reload_dbc_file)
+        file_menu.add_command(label="Search Capture...", command=self._show_capture_search)
+        file_menu.add_command(label="Start Export...", command=self._start_export)
+        file_menu.add_command(label="Stop Export", command=self._stop_export)
         
         # Recent files submenu
         self.recent_menu = tk.Menu(file_menu, tearoff=0)
         file_menu.add_cascade(label="Recent Files", menu=self.recent_menu)
         self._update_recent_files_menu()
+        self.settings_manager.add_listener("recent_dbc_files", lambda value: self._update_recent_files_menu())
         
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
@@ -391,11 +680,20 @@ class CANApp:
         sim_menu.add_command(label="Start Simulation", command=self._start_simulation)
         sim_menu.add_command(label="Stop Simulation", command=self._stop_simulation)
         sim_menu.add_separator()
+        sim_menu.add_command(label="Attach to Reader", command=self._attach_reader)
+        sim_menu.add_command(label="Detach from Reader", command=self._detach_reader)
+        sim_menu.add_separator()
+        self.changes_only_var = tk.BooleanVar(value=self.settings_manager.get_setting("changes_only", False))
+        sim_menu.add_checkbutton(label="Changes Only", variable=self.changes_only_var, command=self._toggle_changes_only)
+        sim_menu.add_separator()
         sim_menu.add_command(label="Send Custom Message", command=self._show_send_dialog)
         menubar.add_cascade(label="Simulation", menu=sim_menu)
         
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
+        self.profiling_var = tk.BooleanVar(value=False)
+        help_menu.add_checkbutton(label="Profiling", variable=self.profiling_var, command=self._toggle_profiling)
+        help_menu.add_separator()
         help_menu.add_command(label="About", command=self._show_about)
         menubar.add_cascade(label="Help", menu=help_menu)
         
@@ -425,11 +723,10 @@ class CANApp:
         else:
             messagebox.showerror("File Not Found", f"The file {file_path} no longer exists.")
             # Remove from recent files
-            recent = self.settings_manager.get_setting("recent_dbc_files", [])
+            recent = list(self.settings_manager.get_setting("recent_dbc_files", []))
             if file_path in recent:
                 recent.remove(file_path)
                 self.settings_manager.set_setting("recent_dbc_files", recent)
-                self._update_recent_files_menu()
                 
     def _create_layout(self):
         """Create the main UI layout"""
@@ -461,6 +758,18 @@ class CANApp:
         messages_frame = ttk.Frame(notebook, padding="5")
         notebook.add(messages_frame, text="Messages")
         
+        # Filter bar
+        filter_frame = ttk.Frame(messages_frame)
+        filter_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var)
+        filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        filter_entry.bind("<Return>", lambda event: self._apply_filter())
+        ttk.Button(filter_frame, text="Apply", command=self._apply_filter).pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="Clear", command=self._clear_filter).pack(side=tk.LEFT)
+        
         # Create messages table
         columns = ("Time", "ID", "Name", "Data (Hex)", "DLC")
         self.messages_tree = ttk.Treeview(messages_frame, columns=columns, show="headings")
@@ -506,13 +815,111 @@ class CANApp:
         signal_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.signals_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
+        # Statistics tab
+        stats_frame = ttk.Frame(notebook, padding="5")
+        notebook.add(stats_frame, text="Statistics")
+        
+        self.bus_load_label = ttk.Label(stats_frame, text="Bus Load: 0.0%")
+        self.bus_load_label.pack(side=tk.TOP, anchor=tk.W, pady=(0, 5))
+        
+        # Create statistics table
+        stats_columns = ("ID", "Name", "Count", "Rate (Hz)", "Avg Rate (Hz)", "Jitter (ms)",
+                         "Min Period (ms)", "Max Period (ms)", "Cycle (ms)", "DLC Errors",
+                         "Period Errors", "Status")
+        self.stats_tree = ttk.Treeview(stats_frame, columns=stats_columns, show="headings")
+        
+        # Configure columns
+        for col in stats_columns:
+            self.stats_tree.heading(col, text=col)
+            self.stats_tree.column(col, width=80)
+        self.stats_tree.column("Name", width=150)
+        
+        # Add scrollbar
+        stats_scrollbar = ttk.Scrollbar(stats_frame, orient=tk.VERTICAL, command=self.stats_tree.yview)
+        self.stats_tree.configure(yscrollcommand=stats_scrollbar.set)
+        
+        # Pack widgets
+        stats_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.stats_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Plot tab
+        self.plot_frame = ttk.Frame(notebook, padding="5")
+        notebook.add(self.plot_frame, text="Plot")
+        
+        plot_controls = ttk.Frame(self.plot_frame)
+        plot_controls.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 5))
+        
+        ttk.Label(plot_controls, text="Signal:").pack(anchor=tk.W)
+        self.plot_signal_var = tk.StringVar()
+        self.plot_signal_combo = ttk.Combobox(
+            plot_controls,
+            textvariable=self.plot_signal_var,
+            state="readonly",
+            postcommand=lambda: self.plot_signal_combo.config(values=sorted(self.signal_values))
+        )
+        self.plot_signal_combo.pack(fill=tk.X)
+        ttk.Button(plot_controls, text="Add", command=self._add_plot_signal).pack(fill=tk.X, pady=2)
+        
+        ttk.Label(plot_controls, text="Plotted signals:").pack(anchor=tk.W, pady=(10, 0))
+        self.plot_signals_list = tk.Listbox(plot_controls, height=10)
+        self.plot_signals_list.pack(fill=tk.BOTH, expand=True)
+        ttk.Button(plot_controls, text="Remove", command=self._remove_plot_signal).pack(fill=tk.X, pady=2)
+        ttk.Button(plot_controls, text="Clear History", command=self._clear_plot_history).pack(fill=tk.X, pady=2)
+        
+        ttk.Label(plot_controls, text="Window (s):").pack(anchor=tk.W, pady=(10, 0))
+        self.plot_window_var = tk.StringVar(value="60")
+        ttk.Spinbox(
+            plot_controls,
+            from_=1,
+            to=600,
+            textvariable=self.plot_window_var,
+            command=self._on_plot_window_change,
+            width=8
+        ).pack(fill=tk.X)
+        
+        # Diagnostics tab
+        diagnostics_frame = ttk.Frame(notebook, padding="5")
+        notebook.add(diagnostics_frame, text="Diagnostics")
+        
+        diagnostics_controls = ttk.Frame(diagnostics_frame)
+        diagnostics_controls.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        self.metrics_enabled_var = tk.BooleanVar(value=metrics.enabled)
+        ttk.Checkbutton(
+            diagnostics_controls,
+            text="Collect metrics",
+            variable=self.metrics_enabled_var,
+            command=self._toggle_metrics
+        ).pack(side=tk.LEFT)
+        ttk.Button(diagnostics_controls, text="Reset", command=self._reset_metrics).pack(side=tk.LEFT, padx=5)
+        
+        diagnostics_columns = ("Metric", "Count / Value", "p50 (ms)", "p99 (ms)", "p99.9 (ms)", "Max (ms)")
+        self.diagnostics_tree = ttk.Treeview(diagnostics_frame, columns=diagnostics_columns, show="headings")
+        for col in diagnostics_columns:
+            self.diagnostics_tree.heading(col, text=col)
+            self.diagnostics_tree.column(col, width=90)
+        self.diagnostics_tree.column("Metric", width=220)
+        self.diagnostics_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # matplotlib is slow to import, so the plot is only created when first needed
+        self.signal_plotter = None
+        self.notebook = notebook
+        notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        
         # Status bar
         self.status_bar = ttk.Label(main_frame, text="Ready", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
+        # Shown while a DBC file is loading
+        self.progress_bar = ttk.Progressbar(main_frame, mode="indeterminate", length=150)
+        
         # Instance variables for tracking
         self.message_count = 0
         self.signal_values = {}  # Track latest signal values
+        self.message_signals = {}  # Latest value of every signal, per message name
+        self.signal_items = {}  # Signals tree row per "Message.Signal"
+        self.latest_messages = {}  # Latest message per arbitration ID
+        self.exporter = None  # Streams received messages to disk while set
+        self.ring_source = None  # Shared-memory link to read_can_data.py while attached
         self.message_details_window = None  # Details popup
         
     def _schedule_ui_update(self):
@@ -520,10 +927,93 @@ class CANApp:
         self._update_ui()
         self.update_timer_id = self.root.after(100, self._schedule_ui_update)  # Update 10 times per second
         
+    def _schedule_stats_update(self):
+        """Schedule periodic statistics updates"""
+        self._update_stats_view()
+        if metrics.enabled:
+            self._update_diagnostics_view()
+        self.stats_timer_id = self.root.after(1000, self._schedule_stats_update)  # Update once per second
+        
+    def _update_stats_view(self):
+        """Update the statistics view from the simulator's stats engine"""
+        snapshot = self.simulator.stats.snapshot(now=time.time())
+        self.bus_load_label.config(text=f"Bus Load: {snapshot['bus_load']:.1f}%")
+        
+        # Drop rows for IDs that are no longer tracked (e.g. after loading a new DBC)
+        for item in self.stats_tree.get_children():
+            if item not in snapshot["ids"]:
+                self.stats_tree.delete(item)
+                
+        def ms(seconds):
+            return f"{seconds * 1000:.2f}" if seconds is not None else "-"
+        
+        for frame_id, stats in snapshot["ids"].items():
+            if stats["missing"]:
+                status = "MISSING"
+            elif stats["dlc_violations"] or stats["period_violations"]:
+                status = "VIOLATION"
+            else:
+                status = "OK"
+                
+            values = (
+                frame_id,
+                stats["name"] or "",
+                stats["count"],
+                f"{stats['rate']:.1f}",
+                f"{stats['average_rate']:.1f}",
+                ms(stats["jitter"]),
+                ms(stats["min_period"]),
+                ms(stats["max_period"]),
+                ms(stats["expected_period"]),
+                stats["dlc_violations"],
+                stats["period_violations"],
+                status
+            )
+            
+            # Rows are keyed by arbitration ID so they can be updated in place
+            if self.stats_tree.exists(frame_id):
+                self.stats_tree.item(frame_id, values=values)
+            else:
+                self.stats_tree.insert("", tk.END, iid=frame_id, values=values)
+        
+    def _update_diagnostics_view(self):
+        """Update the diagnostics view from the metrics registry"""
+        def ms(seconds):
+            return f"{seconds * 1000:.3f}" if seconds is not None else "-"
+        
+        for name, metric in sorted(metrics.snapshot().items()):
+            if metric["type"] == "summary":
+                quantiles = metric["quantiles"]
+                values = (name, metric["count"], ms(quantiles["0.5"]), ms(quantiles["0.99"]),
+                          ms(quantiles["0.999"]), ms(metric["max"]))
+            else:
+                values = (name, metric["value"], "", "", "", "")
+                
+            if self.diagnostics_tree.exists(name):
+                self.diagnostics_tree.item(name, values=values)
+            else:
+                self.diagnostics_tree.insert("", tk.END, iid=name, values=values)
+                
+    def _toggle_metrics(self):
+        """Turn metric collection on or off from the diagnostics tab"""
+        if self.metrics_enabled_var.get():
+            metrics.enable()
+        else:
+            metrics.disable()
+            
+    def _reset_metrics(self):
+        """Clear all collected metrics"""
+        metrics.REGISTRY.reset()
+        self._update_diagnostics_view()
+        
     def _update_ui(self):
         """Update UI with new messages"""
+        start = time.perf_counter() if metrics.enabled else None
+        
         # Get new messages
         new_messages = self.simulator.get_messages()
+        if self.ring_source:
+            new_messages.extend(self.ring_source.get_messages())
         if not new_messages:
             return
             
@@ -531,6 +1021,9 @@ class CANApp:
         self.message_count += len(new_messages)
         self.msg_counter_label.config(text=f"Messages: {self.message_count}")
         
+        plotter = self.signal_plotter
+        changed_signals = set()
+        
         # Update messages table
         for msg in new_messages:
             # Format timestamp
@@ -551,6 +1044,9 @@ class CANApp:
             
             # Store the full message data in the item
             self.messages_tree.item(item_id, tags=(json.dumps(msg),))
+            self.latest_messages[msg["arbitration_id"]] = msg
+            if self.exporter:
+                self.exporter.add_message(msg)
             
             # Limit the number of messages shown (keep 1000 most recent)
             if self.messages_tree.get_children():
@@ -558,28 +1054,47 @@ class CANApp:
                 if len(children) > 1000:
                     self.messages_tree.delete(children[-1])
                     
-            # Update signal values
+            # Update signal values; with changes only, decoded_data holds just the
+            # signals that changed and the rest keep their last value
             if "decoded_data" in msg:
                 msg_name = msg["name"]
+                msg_time = None
+                self.message_signals.setdefault(msg_name, {}).update(msg["decoded_data"])
                 for signal_name, value in msg["decoded_data"].items():
                     key = f"{msg_name}.{signal_name}"
                     self.signal_values[key] = value
+                    changed_signals.add(key)
+                    
+                    # Record plotted signals with the frame's own timestamp
+                    if plotter and key in plotter.buffers and isinstance(value, (int, float)):
+                        if msg_time is None:
+                            msg_time = datetime.fromisoformat(msg["timestamp"]).timestamp()
+                        plotter.append(key, msg_time, value)
                     
         # Update signals view if needed
-        self._update_signals_view()
+        self._update_signals_view(changed_signals)
+        
+        # Only redraw the plot while it is visible
+        if plotter and self.notebook.select() == str(self.plot_frame):
+            plotter.refresh()
         
         # Update details window if open
         if self.message_details_window and hasattr(self, "current_message_id"):
             self._refresh_message_details()
             
-    def _update_signals_view(self):
-        """Update the signals view with latest values"""
-        # Clear existing items
-        for item in self.signals_tree.get_children():
-            self.signals_tree.delete(item)
+        if start is not None:
+            RENDER_TIME.observe(time.perf_counter() - start)
+            MESSAGES_PER_TICK.set(len(new_messages))
             
-        # Add current signals
-        for key, value in self.signal_values.items():
+    def _update_signals_view(self, changed_signals):
+        """Update the rows of signals whose value changed"""
+        for key in changed_signals:
+            value = self.signal_values[key]
+            item_id = self.signal_items.get(key)
+            if item_id is not None:
+                self.signals_tree.set(item_id, "Value", value)
+                continue
+                
             msg_name, signal_name = key.split(".", 1)
             
             # Get signal info if available
@@ -589,23 +1104,91 @@ class CANApp:
             
             # Find the message and signal in the DB
             if self.simulator.db:
-                for msg in self.simulator.db.messages:
-                    if msg.name == msg_name:
-                        for sig in msg.signals:
-                            if sig.name == signal_name:
-                                min_val = sig.minimum if sig.minimum is not None else "0"
-                                max_val = sig.maximum if sig.maximum is not None else str(2 ** sig.length - 1)
-                                units = sig.unit or ""
-                                break
-                        break
+                try:
+                    msg = self.simulator.db.get_message_by_name(msg_name)
+                    sig = msg.get_signal_by_name(signal_name)
+                    min_val = sig.minimum if sig.minimum is not None else "0"
+                    max_val = sig.maximum if sig.maximum is not None else str(2 ** sig.length - 1)
+                    units = sig.unit or ""
+                except KeyError:
+                    pass
             
             # Insert into tree
-            self.signals_tree.insert(
+            self.signal_items[key] = self.signals_tree.insert(
                 "",
                 tk.END,
                 values=(msg_name, signal_name, value, min_val, max_val, units)
             )
             
+    def _toggle_changes_only(self):
+        """Switch the simulator between full frames and changed signals only"""
+        enabled = self.changes_only_var.get()
+        self.settings_manager.set_setting("changes_only", enabled)
+        self.simulator.set_changes_only(enabled, self.settings_manager.get_setting("signal_deadbands"))
+        self.status_bar.config(text="Showing changed signals only" if enabled else "Showing all signals")
+        
+    def _apply_filter(self):
+        """Compile the filter expression and apply it to incoming messages"""
+        expression = self.filter_var.get().strip()
+        try:
+            self.simulator.set_filter(expression)
+        except FilterSyntaxError as e:
+            messagebox.showerror("Invalid Filter", str(e))
+            return
+        self.status_bar.config(text=f"Filter: {expression}" if expression else "Filter cleared")
+        
+    def _clear_filter(self):
+        """Remove the active message filter"""
+        self.filter_var.set("")
+        self._apply_filter()
+        
+    def _get_signal_plotter(self):
+        """Create the plot on first use"""
+        if self.signal_plotter is None:
+            from signalPlot import SignalPlotter
+            
+            self.signal_plotter = SignalPlotter(self.plot_frame)
+            self.signal_plotter.widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            self._on_plot_window_change()
+        return self.signal_plotter
+        
+    def _on_tab_changed(self, event):
+        """Create the plot when its tab is first shown"""
+        if self.notebook.select() == str(self.plot_frame):
+            self._get_signal_plotter()
+            
+    def _add_plot_signal(self):
+        """Add the selected signal to the plot"""
+        key = self.plot_signal_var.get()
+        plotter = self._get_signal_plotter()
+        if not key or key in plotter.buffers:
+            return
+        plotter.add_signal(key)
+        self.plot_signals_list.insert(tk.END, key)
+        
+    def _remove_plot_signal(self):
+        """Remove the selected signal from the plot"""
+        selection = self.plot_signals_list.curselection()
+        if not selection:
+            return
+        key = self.plot_signals_list.get(selection[0])
+        self.plot_signals_list.delete(selection[0])
+        self._get_signal_plotter().remove_signal(key)
+        
+    def _clear_plot_history(self):
+        """Drop all recorded plot samples"""
+        if self.signal_plotter:
+            self.signal_plotter.clear()
+        
+    def _on_plot_window_change(self):
+        """Apply a new plot time window"""
+        if not self.signal_plotter:
+            return
+        try:
+            self.signal_plotter.set_window(float(self.plot_window_var.get()))
+        except ValueError:
+            pass
+            
     def _on_message_select(self, event):
         """Handle message selection in the tree"""
         selection = self.messages_tree.selection()
@@ -702,18 +1285,8 @@ class CANApp:
             return
             
         # Find latest message with this ID
-        latest_msg = None
-        for item_id in self.messages_tree.get_children()[:100]:  # Check recent messages
-            tags = self.messages_tree.item(item_id, "tags")
-            if tags:
-                try:
-                    msg = json.loads(tags[0])
-                    if msg["arbitration_id"] == self.current_message_id:
-                        latest_msg = msg
-                        break
-                except:
-                    pass
-                    
+        latest_msg = self.latest_messages.get(self.current_message_id)
+        
         if not latest_msg or "decoded_data" not in latest_msg:
             return
             
@@ -721,7 +1294,8 @@ class CANApp:
         for item in self.details_signals_tree.get_children():
             self.details_signals_tree.delete(item)
             
-        for signal_name, value in latest_msg["decoded_data"].items():
+        # Latest value of every signal, not just those in the last (delta) frame
+        for signal_name, value in self.message_signals.get(latest_msg["name"], latest_msg["decoded_data"]).items():
             self.details_signals_tree.insert(
                 "",
                 tk.END,
@@ -732,6 +1306,138 @@ class CANApp:
                 )
             )
             
+    def _start_export(self):
+        """Stream received messages to a CSV, Parquet or MDF4 export"""
+        if not self.simulator.db:
+            messagebox.showwarning("No DBC File", "Please load a DBC file first.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            title="Export Signals",
+            filetypes=[("Parquet", "*.parquet"), ("CSV", "*.csv"), ("MDF4", "*.mf4")],
+            defaultextension=".parquet"
+        )
+        if not file_path:
+            return
+        self._stop_export()
+        # Exporters need numpy, so they are only loaded once an export starts
+        from canutils.export import open_exporter
+        try:
+            self.exporter = open_exporter(file_path, self.simulator.db, background=True)
+        except (ValueError, ImportError) as e:
+            messagebox.showerror("Export Error", f"Cannot export to {os.path.basename(file_path)}: {e}")
+            return
+        self.status_bar.config(text=f"Exporting to {file_path}")
+        
+    def _stop_export(self):
+        """Write out buffered rows and close the current export"""
+        if not self.exporter:
+            return
+        exporter, self.exporter = self.exporter, None
+        try:
+            exporter.close()
+            self.status_bar.config(text=f"Exported {exporter.rows_written} rows to {exporter.path}")
+        except Exception as e:
+            logger.error(f"Error finishing export: {e}")
+            messagebox.showerror("Export Error", str(e))
+        
+    def _show_capture_search(self):
+        """Open a capture file and show the search dialog"""
+        file_path = filedialog.askopenfilename(
+            title="Open Capture File",
+            filetypes=[("Capture Files", "*.cap"), ("All Files", "*.*")]
+        )
+        if not file_path:
+            return
+            
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Search Capture: {os.path.basename(file_path)}")
+        dialog.geometry("700x500")
+        dialog.transient(self.root)
+        
+        # Query fields
+        query_frame = ttk.LabelFrame(dialog, text="Query", padding="5")
+        query_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        fields = {}
+        for row, (label, key) in enumerate([
+            ("ID (hex):", "id"),
+            ("From (s):", "t_start"),
+            ("To (s):", "t_end"),
+            ("Signal:", "signal"),
+            ("Value:", "value")
+        ]):
+            ttk.Label(query_frame, text=label).grid(row=row // 3, column=(row % 3) * 2, sticky=tk.W, padx=5, pady=2)
+            fields[key] = ttk.Entry(query_frame, width=15)
+            fields[key].grid(row=row // 3, column=(row % 3) * 2 + 1, sticky=tk.W, padx=5, pady=2)
+            
+        search_button = ttk.Button(query_frame, text="Search", state=tk.DISABLED)
+        search_button.grid(row=1, column=5, sticky=tk.E, padx=5, pady=2)
+        
+        # Results table
+        columns = ("Offset", "Time", "ID", "DLC", "Data (Hex)")
+        results_tree = ttk.Treeview(dialog, columns=columns, show="headings")
+        for col in columns:
+            results_tree.heading(col, text=col)
+        results_tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        
+        result_label = ttk.Label(dialog, text="Indexing capture...")
+        result_label.pack(fill=tk.X, padx=10, pady=5)
+        
+        state = {}
+        
+        def build_index():
+            # Building an index over a large capture can take a while
+            try:
+                from canutils.trace_index import TraceIndex
+                
+                state["index"] = TraceIndex.open(file_path, self.simulator.db)
+            except Exception as e:
+                state["error"] = e
+                
+        def wait_for_index():
+            if not dialog.winfo_exists():
+                return
+            if "error" in state:
+                result_label.config(text=f"Error indexing capture: {state['error']}")
+            elif "index" in state:
+                result_label.config(text=f"{len(state['index'].capture)} frames indexed")
+                search_button.config(state=tk.NORMAL)
+            else:
+                dialog.after(100, wait_for_index)
+                
+        def search():
+            try:
+                frame_id = fields["id"].get().strip()
+                value = fields["value"].get().strip()
+                query = {
+                    "frame_id": int(frame_id, 16) if frame_id else None,
+                    "t_start": float(fields["t_start"].get()) if fields["t_start"].get().strip() else None,
+                    "t_end": float(fields["t_end"].get()) if fields["t_end"].get().strip() else None,
+                    "signal": fields["signal"].get().strip() or None,
+                    "value": int(value) if value.lstrip("-").isdigit() else value or None
+                }
+                start = time.perf_counter()
+                offsets = state["index"].query(limit=1000, **query)
+                elapsed = (time.perf_counter() - start) * 1000
+            except (ValueError, KeyError) as e:
+                messagebox.showerror("Invalid Query", str(e), parent=dialog)
+                return
+                
+            results_tree.delete(*results_tree.get_children())
+            for frame in state["index"].frames(offsets):
+                results_tree.insert("", tk.END, values=(
+                    frame["offset"],
+                    str(datetime.fromtimestamp(frame["timestamp"])),
+                    frame["arbitration_id"],
+                    frame["dlc"],
+                    frame["hex"]
+                ))
+            result_label.config(text=f"{len(offsets)} frames shown ({elapsed:.1f} ms)")
+            
+        search_button.config(command=search)
+        threading.Thread(target=build_index, daemon=True).start()
+        wait_for_index()
+        
     def _open_dbc_file(self):
         """Open a DBC file dialog"""
         file_path = filedialog.askopenfilename(
@@ -745,4 +1451,242 @@ class CANApp:
     def _load_dbc_file(self, file_path):
         """Load a DBC file and update the application"""
         # Add to recent files
-        self.settings_manager.add_recent_file(file_path
\ No newline at end of file
+        self.settings_manager.add_recent_dbc_file(file_path)
+        
+        # Copy into the DBC library and load it without blocking the UI
+        self._start_dbc_load(file_path, copy_to_library=True)
+        
+    def _reload_dbc_file(self):
+        """Pick up edits to the loaded DBC file without restarting the simulation"""
+        if not self.simulator.db:
+            messagebox.showwarning("No DBC File", "Please load a DBC file first.")
+            return
+        db_path = self.simulator.db_path
+        filename = os.path.basename(db_path)
+        self.status_bar.config(text=f"Reloading {filename}...")
+        result = {}
+        
+        def reload():
+            result["db"] = self.simulator.read_db(db_path)
+            
+        thread = threading.Thread(target=reload, daemon=True)
+        thread.start()
+        self._wait_for_dbc_reload(thread, filename, result, self._dbc_load_generation)
+        
+    def _wait_for_dbc_reload(self, thread, filename, result, generation):
+        """Poll the reload thread, then drop cached rows of the messages that changed"""
+        if generation != self._dbc_load_generation:
+            # Another file was loaded meanwhile; this one is no longer current
+            return
+        if thread.is_alive():
+            self.root.after(50, lambda: self._wait_for_dbc_reload(thread, filename, result, generation))
+            return
+            
+        db = result.get("db")
+        diff = self.simulator.reload_db(db) if db is not None else None
+        if diff is None:
+            self.status_bar.config(text=f"Failed to reload {filename}")
+            messagebox.showerror("Error", f"Failed to reload DBC file: {filename}")
+            return
+            
+        # Signal rows carry ranges and units from the old definition
+        stale = {msg.name for msg in diff.removed} | {change.old.name for change in diff.changed}
+        for key in [key for key in self.signal_items if key.split(".", 1)[0] in stale]:
+            self.signals_tree.delete(self.signal_items.pop(key))
+            self.signal_values.pop(key, None)
+        for name in stale:
+            self.message_signals.pop(name, None)
+        self.dbc_label.config(text=f"DBC: {filename} ({len(self.simulator.messages)} messages)")
+        self.status_bar.config(text=f"Reloaded {filename}: {diff.summary()}")
+        
+    def _start_dbc_load(self, file_path, copy_to_library=False):
+        """Parse a DBC file on a worker thread; the simulator switches to it once done"""
+        filename = os.path.basename(file_path)
+        self.status_bar.config(text=f"Loading {filename}...")
+        self.progress_bar.pack(side=tk.BOTTOM, anchor=tk.E, pady=(2, 0))
+        self.progress_bar.start(10)
+        
+        # Only the most recent load is applied, whichever finishes last
+        self._dbc_load_generation += 1
+        result = {}
+        
+        def load():
+            path = file_path
+            if copy_to_library:
+                if not self.dbc_manager.add_dbc_file(file_path):
+                    return
+                path = self.dbc_manager.get_dbc_path(filename)
+            result["path"] = path
+            result["db"] = self.simulator.read_db(path)
+            
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        self._wait_for_dbc_load(thread, filename, result, self._dbc_load_generation)
+        
+    def _wait_for_dbc_load(self, thread, filename, result, generation):
+        """Poll the DBC loading thread and update the UI once it finishes"""
+        if generation != self._dbc_load_generation:
+            # Superseded by a later load, which owns the progress bar
+            logger.info(f"Discarding superseded load of {filename}")
+            return
+        if thread.is_alive():
+            self.root.after(50, lambda: self._wait_for_dbc_load(thread, filename, result, generation))
+            return
+            
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        
+        if result.get("db") is not None:
+            self.simulator.use_db(result["db"], result["path"])
+            self.settings_manager.set_setting("selected_dbc_file", filename)
+            self.dbc_label.config(text=f"DBC: {filename} ({len(self.simulator.messages)} messages)")
+            self.status_bar.config(text=f"Loaded {filename}")
+        else:
+            self.status_bar.config(text=f"Failed to load {filename}")
+            messagebox.showerror("Error", f"Failed to load DBC file: {filename}")
+            
+    def _start_simulation(self):
+        """Start the CAN simulation"""
+        if not self.simulator.db:
+            messagebox.showwarning("No DBC File", "Please load a DBC file first.")
+            return
+            
+        frequency = self.settings_manager.get_setting("simulation_frequency", 10)
+        if self.simulator.start_simulation(frequency):
+            self.sim_status_label.config(text=f"Simulation: Running ({frequency}Hz)")
+            self.status_bar.config(text="Simulation started")
+            
+    def _stop_simulation(self):
+        """Stop the CAN simulation"""
+        self.simulator.stop_simulation()
+        self.sim_status_label.config(text="Simulation: Stopped")
+        self.status_bar.config(text="Simulation stopped")
+        
+    def _attach_reader(self):
+        """Show frames from a read_can_data.py --shm process running on this machine"""
+        if self.ring_source:
+            return
+        if not self.simulator.db:
+            messagebox.showwarning("No DBC File", "Please load the DBC file the reader decodes with first.")
+            return
+        try:
+            self.ring_source = SharedMemorySource(self.simulator)
+        except (FileNotFoundError, ValueError) as e:
+            messagebox.showerror("Attach Error", f"No reader to attach to. Start read_can_data.py with --shm first.\n\n{e}")
+            return
+        self.status_bar.config(text=f"Attached to reader ({self.ring_source.reader.name})")
+        
+    def _detach_reader(self):
+        """Stop showing frames from the reader process"""
+        if not self.ring_source:
+            return
+        self.ring_source.close()
+        self.ring_source = None
+        self.status_bar.config(text="Detached from reader")
+        
+    def _show_send_dialog(self):
+        """Show a dialog for sending a custom CAN message"""
+        if not self.simulator.db:
+            messagebox.showwarning("No DBC File", "Please load a DBC file first.")
+            return
+            
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Send Custom Message")
+        dialog.geometry("400x400")
+        dialog.transient(self.root)
+        
+        main_frame = ttk.Frame(dialog, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Message selection
+        ttk.Label(main_frame, text="Message:").pack(anchor=tk.W)
+        messages_by_name = {msg.name: msg for msg in self.simulator.messages.values()}
+        message_var = tk.StringVar()
+        message_combo = ttk.Combobox(
+            main_frame,
+            textvariable=message_var,
+            values=sorted(messages_by_name),
+            state="readonly"
+        )
+        message_combo.pack(fill=tk.X, pady=(0, 10))
+        
+        # Signal entries are rebuilt whenever a message is chosen
+        signals_frame = ttk.LabelFrame(main_frame, text="Signals", padding="5")
+        signals_frame.pack(fill=tk.BOTH, expand=True)
+        signal_entries = {}
+        
+        def on_message_selected(event):
+            for child in signals_frame.winfo_children():
+                child.destroy()
+            signal_entries.clear()
+            
+            msg = messages_by_name[message_var.get()]
+            for row, signal in enumerate(msg.signals):
+                ttk.Label(signals_frame, text=f"{signal.name}:").grid(row=row, column=0, sticky=tk.W, padx=5, pady=2)
+                entry = ttk.Entry(signals_frame, width=15)
+                entry.insert(0, "0")
+                entry.grid(row=row, column=1, sticky=tk.W, padx=5, pady=2)
+                signal_entries[signal.name] = entry
+                
+        message_combo.bind("<<ComboboxSelected>>", on_message_selected)
+        
+        def send():
+            if not message_var.get():
+                messagebox.showwarning("No Message", "Please select a message.", parent=dialog)
+                return
+                
+            msg = messages_by_name[message_var.get()]
+            try:
+                signals = {name: int(entry.get()) for name, entry in signal_entries.items()}
+            except ValueError:
+                messagebox.showerror("Invalid Value", "Signal values must be integers.", parent=dialog)
+                return
+                
+            if self.simulator.send_message(msg.frame_id, signals):
+                self.status_bar.config(text=f"Sent message {msg.name}")
+                dialog.destroy()
+            else:
+                messagebox.showerror("Error", f"Failed to send {msg.name}. See can_app.log for details.", parent=dialog)
+                
+        ttk.Button(main_frame, text="Send", command=send).pack(pady=(10, 0))
+        
+    def _toggle_profiling(self):
+        """Start or stop sampling every thread, writing a flamegraph and report on stop"""
+        if self.profiling_var.get():
+            if not profiler.start():
+                # Someone else's profile is running; leave it to them to stop
+                self.profiling_var.set(False)
+                self.status_bar.config(text="Profiling is already running elsewhere in this process")
+                return
+            self.status_bar.config(text="Profiling... select Help > Profiling again to stop")
+            return
+            
+        result = profiler.stop(profiler.output_prefix("profiles", "gui"))
+        if result is None:
+            return
+        collapsed_path, report_path = result.paths
+        self.status_bar.config(text=f"Profile written to {report_path}")
+        messagebox.showinfo(
+            "Profile",
+            f"Flamegraph stacks: {collapsed_path}\nReport: {report_path}\n\n{result.report(10)}"
+        )
+        
+    def _show_about(self):
+        """Show the about dialog"""
+        messagebox.showinfo(
+            "About",
+            "Offline CAN Bus Monitor\n\nSimulates and monitors CAN bus traffic using DBC files."
+        )
+
+
+def main():
+    root = tk.Tk()
+    app = CANApp(root)
+    root.mainloop()
+    app.settings_manager.flush()
+    if app.exporter:
+        app.exporter.close()
+
+
+if __name__ == "__main__":
+    main()
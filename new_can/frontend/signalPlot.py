@@ -0,0 +1,234 @@
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+# 10 minutes at 1 kHz; the most samples kept per signal
+DEFAULT_CAPACITY = 600000
+# Samples allocated for a new signal; the buffer doubles as it fills
+INITIAL_SIZE = 1024
+
+
+class SignalRingBuffer:
+    """Bounded (t, value) history for one signal
+
+    Every sample is written twice, at i and i + size, so the most recent
+    samples are always a contiguous slice and reading never copies. The
+    arrays start small and grow up to capacity, so slow signals don't cost
+    the memory of a full 10 minutes at 1 kHz.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._size = min(INITIAL_SIZE, capacity)
+        self._t = np.zeros(2 * self._size, dtype=np.float64)
+        self._v = np.zeros(2 * self._size, dtype=np.float64)
+        self._head = 0
+        self.count = 0
+
+    def _reserve(self, n):
+        # Until the buffer reaches capacity it never wraps, so the samples
+        # are in order at the start of each half
+        needed = min(self.count + n, self.capacity)
+        if needed <= self._size:
+            return
+        size = min(max(needed, 2 * self._size), self.capacity)
+        t, v = self.data()
+        self._t = np.zeros(2 * size, dtype=np.float64)
+        self._v = np.zeros(2 * size, dtype=np.float64)
+        self._t[:self.count] = self._t[size:size + self.count] = t
+        self._v[:self.count] = self._v[size:size + self.count] = v
+        self._size = size
+        self._head = self.count
+
+    def append(self, t, value):
+        if self.count == self._size:
+            self._reserve(1)
+        head = self._head
+        self._t[head] = self._t[head + self._size] = t
+        self._v[head] = self._v[head + self._size] = value
+        self._head = (head + 1) % self._size
+        if self.count < self._size:
+            self.count += 1
+
+    def extend(self, ts, values):
+        ts = np.asarray(ts, dtype=np.float64)[-self.capacity:]
+        values = np.asarray(values, dtype=np.float64)[-self.capacity:]
+        n = len(ts)
+        if not n:
+            return
+        self._reserve(n)
+        idx = (self._head + np.arange(n)) % self._size
+        self._t[idx] = self._t[idx + self._size] = ts
+        self._v[idx] = self._v[idx + self._size] = values
+        self._head = (self._head + n) % self._size
+        self.count = min(self.count + n, self._size)
+
+    def data(self):
+        """Return (t, value) views ordered oldest to newest"""
+        end = self._head + self._size
+        start = end - self.count
+        return self._t[start:end], self._v[start:end]
+
+    def window(self, t_start):
+        """Return (t, value) views of all samples newer than t_start"""
+        t, v = self.data()
+        first = np.searchsorted(t, t_start)
+        return t[first:], v[first:]
+
+    def last_time(self):
+        if not self.count:
+            return None
+        return self._t[self._head + self._size - 1]
+
+
+def minmax_decimate(t, v, t_start, t_end, n_bins):
+    """Reduce a time series to the min and max sample of each pixel column
+
+    The returned series has at most 2 * n_bins points and keeps every peak
+    that would be visible at that resolution.
+    """
+    if len(t) <= 2 * n_bins:
+        return t, v
+
+    edges = np.linspace(t_start, t_end, n_bins + 1)
+    starts = np.searchsorted(t, edges[:-1])
+    # reduceat needs strictly usable indices, so drop empty columns
+    nonempty = np.diff(np.append(starts, len(t))) > 0
+    starts = starts[nonempty]
+    starts = starts[starts < len(t)]
+    if not len(starts):
+        return t[:0], v[:0]
+
+    bounds = np.append(starts, len(t))
+    mins = np.minimum.reduceat(v, starts)
+    maxs = np.maximum.reduceat(v, starts)
+
+    # Place the min and max at the start and end of each column so the
+    # envelope is drawn as a vertical stroke
+    out_t = np.empty(2 * len(starts))
+    out_v = np.empty(2 * len(starts))
+    out_t[0::2] = t[starts]
+    out_t[1::2] = t[bounds[1:] - 1]
+    out_v[0::2] = mins
+    out_v[1::2] = maxs
+    return out_t, out_v
+
+
+class SignalPlotter:
+    """Embedded matplotlib plot of live signal values with blitted redraws"""
+
+    def __init__(self, master, window=60.0, capacity=DEFAULT_CAPACITY):
+        self.window = window
+        self.capacity = capacity
+        self.buffers = {}
+        self.lines = {}
+
+        self.figure = Figure(figsize=(6, 4), dpi=100)
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_xlabel("Time (s)")
+        self.ax.grid(True)
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.widget = self.canvas.get_tk_widget()
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+        self._background = None
+        self._t0 = None
+        self._rescale = True
+        self._needs_full_redraw = True
+
+    def add_signal(self, key):
+        """Start recording and plotting a signal"""
+        if key in self.buffers:
+            return
+        self.buffers[key] = SignalRingBuffer(self.capacity)
+        # Animated artists are left out of normal draws and blitted instead
+        (line,) = self.ax.plot([], [], label=key, animated=True)
+        self.lines[key] = line
+        self.ax.legend(loc="upper left", fontsize="small")
+        self._rescale = True
+        self._needs_full_redraw = True
+
+    def remove_signal(self, key):
+        """Stop recording and plotting a signal"""
+        if key not in self.buffers:
+            return
+        del self.buffers[key]
+        self.lines.pop(key).remove()
+        if self.lines:
+            self.ax.legend(loc="upper left", fontsize="small")
+        elif self.ax.get_legend():
+            self.ax.get_legend().remove()
+        self._rescale = True
+        self._needs_full_redraw = True
+
+    def set_window(self, seconds):
+        """Change the visible time span"""
+        self.window = float(seconds)
+        self._rescale = True
+        self._needs_full_redraw = True
+
+    def append(self, key, t, value):
+        """Record a sample if the signal is being plotted"""
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return
+        if self._t0 is None:
+            self._t0 = t
+        buffer.append(t - self._t0, value)
+
+    def clear(self):
+        """Drop all recorded samples"""
+        for key in self.buffers:
+            self.buffers[key] = SignalRingBuffer(self.capacity)
+        self._t0 = None
+        self._rescale = True
+        self._needs_full_redraw = True
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+    def refresh(self):
+        """Redraw the plot, blitting only the lines when the axes are unchanged"""
+        latest = [b.last_time() for b in self.buffers.values() if b.count]
+        if not latest:
+            return
+        t_end = max(latest)
+        t_start = t_end - self.window
+        n_bins = max(int(self.ax.bbox.width), 1)
+
+        y_min, y_max = None, None
+        for key, buffer in self.buffers.items():
+            t, v = buffer.window(t_start)
+            t, v = minmax_decimate(t, v, t_start, t_end, n_bins)
+            self.lines[key].set_data(t, v)
+            if len(v):
+                y_min = v.min() if y_min is None else min(y_min, v.min())
+                y_max = v.max() if y_max is None else max(y_max, v.max())
+
+        # The time axis is advanced in steps of a tenth of the window so most
+        # ticks leave the axes untouched and only blit the lines
+        x_lo, x_hi = self.ax.get_xlim()
+        if self._rescale or t_end > x_hi or t_end < x_lo:
+            self.ax.set_xlim(t_start, t_end + self.window * 0.1)
+            self._needs_full_redraw = True
+
+        if y_min is not None:
+            y_lo, y_hi = self.ax.get_ylim()
+            if self._rescale or y_min < y_lo or y_max > y_hi:
+                margin = (y_max - y_min) * 0.1 or 1.0
+                self.ax.set_ylim(y_min - margin, y_max + margin)
+                self._needs_full_redraw = True
+        self._rescale = False
+
+        if self._needs_full_redraw or self._background is None:
+            self._needs_full_redraw = False
+            self.canvas.draw()
+            return
+
+        self.canvas.restore_region(self._background)
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
@@ -0,0 +1,296 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+import apiUtils
+import p
+import signalPlot
+
+
+class SettingsManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.settings_file = os.path.join(self.directory, "app_settings.json")
+
+    def test_save_and_load(self):
+        manager = p.SettingsManager(self.settings_file)
+        manager.set_setting("simulation_frequency", 25)
+        self.assertTrue(manager.flush())
+        with open(self.settings_file) as f:
+            self.assertEqual(json.load(f)["simulation_frequency"], 25)
+        self.assertEqual(p.SettingsManager(self.settings_file).get_setting("simulation_frequency"), 25)
+        self.assertEqual(os.listdir(self.directory), ["app_settings.json"])
+
+    def test_failed_save_leaves_no_temporary_file(self):
+        manager = p.SettingsManager(self.settings_file)
+        # A directory in the way makes the final rename fail
+        os.mkdir(self.settings_file)
+        self.assertFalse(manager.save_settings())
+        self.assertEqual(os.listdir(self.directory), ["app_settings.json"])
+
+
+class DbcLoadTests(unittest.TestCase):
+
+    def setUp(self):
+        # Just the parts of CANApp the load callbacks use; no Tk window
+        self.app = SimpleNamespace(
+            _dbc_load_generation=0,
+            root=mock.Mock(),
+            progress_bar=mock.Mock(),
+            status_bar=mock.Mock(),
+            dbc_label=mock.Mock(),
+            settings_manager=mock.Mock(),
+            simulator=mock.Mock(messages={}),
+        )
+
+    def finished_thread(self):
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+        return thread
+
+    def test_superseded_load_is_ignored(self):
+        old = {"db": "old db", "path": "old.dbc"}
+        new = {"db": "new db", "path": "new.dbc"}
+        self.app._dbc_load_generation = 2
+        # The newer load finishes first, the older one after it
+        p.CANApp._wait_for_dbc_load(self.app, self.finished_thread(), "new.dbc", new, 2)
+        p.CANApp._wait_for_dbc_load(self.app, self.finished_thread(), "old.dbc", old, 1)
+        self.app.simulator.use_db.assert_called_once_with("new db", "new.dbc")
+        self.app.settings_manager.set_setting.assert_called_once_with("selected_dbc_file", "new.dbc")
+
+    def test_superseded_load_stops_polling(self):
+        thread = mock.Mock(is_alive=mock.Mock(return_value=True))
+        self.app._dbc_load_generation = 2
+        p.CANApp._wait_for_dbc_load(self.app, thread, "old.dbc", {}, 1)
+        self.app.root.after.assert_not_called()
+        self.app.progress_bar.stop.assert_not_called()
+
+    def test_reload_after_newer_load_is_ignored(self):
+        self.app._dbc_load_generation = 2
+        p.CANApp._wait_for_dbc_reload(self.app, self.finished_thread(), "old.dbc", {"db": "old db"}, 1)
+        self.app.simulator.reload_db.assert_not_called()
+
+
+class ProfilingToggleTests(unittest.TestCase):
+
+    def test_profiler_already_running_is_reported(self):
+        app = SimpleNamespace(profiling_var=mock.Mock(), status_bar=mock.Mock())
+        app.profiling_var.get.return_value = True
+        with mock.patch.object(p.profiler, "start", return_value=False), \
+                mock.patch.object(p.profiler, "stop") as stop:
+            p.CANApp._toggle_profiling(app)
+        app.profiling_var.set.assert_called_once_with(False)
+        self.assertIn("already running", app.status_bar.config.call_args.kwargs["text"])
+        stop.assert_not_called()
+
+
+class SignalRingBufferTests(unittest.TestCase):
+
+    def test_wrap_around_keeps_newest_samples_in_order(self):
+        buffer = signalPlot.SignalRingBuffer(capacity=5)
+        for i in range(12):
+            buffer.append(float(i), i * 10.0)
+        t, v = buffer.data()
+        self.assertEqual(list(t), [7, 8, 9, 10, 11])
+        self.assertEqual(list(v), [70, 80, 90, 100, 110])
+        self.assertEqual(buffer.last_time(), 11)
+
+        buffer.extend([12, 13, 14], [120, 130, 140])
+        self.assertEqual(list(buffer.data()[0]), [10, 11, 12, 13, 14])
+        # More samples than fit keeps only the newest
+        buffer.extend(range(20, 28), range(8))
+        self.assertEqual(list(buffer.data()[0]), [23, 24, 25, 26, 27])
+
+    def test_window_is_a_view_of_the_doubled_arrays(self):
+        buffer = signalPlot.SignalRingBuffer(capacity=4)
+        buffer.extend([0, 1, 2, 3, 4, 5], [0, 1, 2, 3, 4, 5])
+        # The newest samples straddle the end of the ring but are still one slice
+        t, v = buffer.window(2.5)
+        self.assertEqual(list(t), [3, 4, 5])
+        self.assertEqual(list(v), [3, 4, 5])
+        self.assertTrue(np.shares_memory(t, buffer._t))
+        self.assertEqual(len(buffer.window(10)[0]), 0)
+
+    def test_buffer_grows_only_as_samples_arrive(self):
+        buffer = signalPlot.SignalRingBuffer(capacity=10 * signalPlot.INITIAL_SIZE)
+        self.assertEqual(len(buffer._t), 2 * signalPlot.INITIAL_SIZE)
+        n = 3 * signalPlot.INITIAL_SIZE + 5
+        for i in range(n):
+            buffer.append(float(i), float(i))
+        self.assertEqual(len(buffer._t), 2 * 4 * signalPlot.INITIAL_SIZE)
+        self.assertEqual(list(buffer.data()[0]), list(range(n)))
+        buffer.extend(np.arange(n, 20 * signalPlot.INITIAL_SIZE), np.zeros(20 * signalPlot.INITIAL_SIZE - n))
+        self.assertEqual(buffer.count, buffer.capacity)
+        self.assertEqual(buffer.data()[0][0], 10 * signalPlot.INITIAL_SIZE)
+
+
+class MinmaxDecimateTests(unittest.TestCase):
+
+    def test_extremes_are_kept(self):
+        t = np.arange(1000, dtype=np.float64)
+        v = np.zeros(1000)
+        v[123] = 50.0
+        v[777] = -20.0
+        out_t, out_v = signalPlot.minmax_decimate(t, v, 0, 1000, 10)
+        self.assertLessEqual(len(out_t), 20)
+        self.assertEqual(out_v.max(), 50.0)
+        self.assertEqual(out_v.min(), -20.0)
+        # Each column gives a (start, end) pair in time order
+        self.assertTrue(np.all(np.diff(out_t) >= 0))
+
+    def test_uneven_columns(self):
+        # 7 samples per column doesn't divide evenly into the samples
+        t = np.linspace(0, 1, 52, endpoint=False)
+        v = np.arange(52, dtype=np.float64)
+        out_t, out_v = signalPlot.minmax_decimate(t, v, 0, 1, 7)
+        self.assertEqual(len(out_v), 14)
+        self.assertEqual(out_v[0], 0)
+        self.assertEqual(out_v[-1], 51)
+        self.assertEqual(list(out_v[0::2]), sorted(out_v[0::2]))
+
+    def test_short_and_empty_input(self):
+        t = np.arange(5, dtype=np.float64)
+        out_t, out_v = signalPlot.minmax_decimate(t, t, 0, 5, 10)
+        self.assertIs(out_t, t)
+        empty = np.zeros(0)
+        self.assertEqual(len(signalPlot.minmax_decimate(empty, empty, 0, 1, 10)[0]), 0)
+
+
+class _Backend(BaseHTTPRequestHandler):
+    """Answers each request with the next scripted status for its path, else 200"""
+
+    def _reply(self):
+        server = self.server
+        server.requests.append((self.command, self.path))
+        statuses = server.statuses.get(self.path)
+        status = statuses.pop(0) if statuses else 200
+        body = json.dumps({"response": f"{self.command} {self.path} #{len(server.requests)}"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class ApiClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Backend)
+        self.server.requests = []
+        self.server.statuses = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = apiUtils.ApiClient(f"http://127.0.0.1:{self.server.server_port}", backoff=0.01)
+        self.addCleanup(self.client.close)
+
+    def test_idempotent_requests_are_retried(self):
+        self.server.statuses["/view/dbc"] = [503, 503]
+        body = self.client.get("/view/dbc").result(timeout=5)
+        self.assertEqual(body["response"], "GET /view/dbc #3")
+
+        self.server.statuses["/get_can_settings"] = [503] * 4
+        with self.assertRaises(apiUtils.ApiError) as raised:
+            self.client.get("/get_can_settings").result(timeout=5)
+        self.assertEqual(raised.exception.status, 503)
+        # Three retries after the first attempt
+        self.assertEqual(len(self.server.requests), 7)
+
+    def test_backoff_doubles(self):
+        delays = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        self.server.statuses["/get_can_settings"] = [503, 503, 503]
+        with mock.patch.object(apiUtils.random, "uniform", return_value=1.0), \
+                mock.patch.object(apiUtils.asyncio, "sleep", sleep):
+            self.client.get("/get_can_settings").result(timeout=5)
+        self.assertEqual(delays, [0.01, 0.02, 0.04])
+
+    def test_posts_are_not_retried(self):
+        self.server.statuses["/transmit"] = [503]
+        with self.assertRaises(apiUtils.ApiError) as raised:
+            self.client.post("/transmit", json={}).result(timeout=5)
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(self.server.requests, [("POST", "/transmit")])
+
+    def test_dbc_list_is_cached_until_a_mutating_request(self):
+        first = self.client.get("/view/dbc").result(timeout=5)
+        self.assertEqual(self.client.get("/view/dbc").result(timeout=5), first)
+        self.assertEqual(len(self.server.requests), 1)
+
+        for method, path in (("POST", "/transmit"), ("PUT", "/change_can_settings")):
+            self.client.request(method, path, json={}).result(timeout=5)
+            self.assertNotEqual(self.client.get("/view/dbc").result(timeout=5), first)
+            first = self.client.get("/view/dbc").result(timeout=5)
+        self.assertEqual(len(self.server.requests), 5)
+
+        # A failed mutation may still have changed something
+        self.server.statuses["/transmit"] = [400]
+        with self.assertRaises(apiUtils.ApiError):
+            self.client.post("/transmit", json={}).result(timeout=5)
+        self.assertNotEqual(self.client.get("/view/dbc").result(timeout=5), first)
+
+    def test_file_views_are_not_cached(self):
+        # GET /view/can/<file> also selects the file on the server
+        self.client.get("/view/can/a.dbc").result(timeout=5)
+        self.client.get("/view/can/a.dbc").result(timeout=5)
+        self.assertEqual(self.server.requests, [("GET", "/view/can/a.dbc")] * 2)
+
+
+class CallOnTkTests(unittest.TestCase):
+
+    def setUp(self):
+        # root.after callbacks are queued and run by the test, standing in for the Tk thread
+        self.pending = queue.Queue()
+        self.root = mock.Mock()
+        self.root.after.side_effect = lambda delay, callback: self.pending.put(callback)
+
+    def run_tk(self, future):
+        while True:
+            self.pending.get(timeout=5)()
+            if future.done() and self.pending.empty():
+                return
+
+    def test_result_is_delivered_on_the_tk_thread(self):
+        future = Future()
+        threads = []
+        apiUtils.call_on_tk(self.root, future, lambda result: threads.append((threading.get_ident(), result)))
+        threading.Timer(0.05, future.set_result, ("done",)).start()
+        self.run_tk(future)
+        self.assertEqual(threads, [(threading.get_ident(), "done")])
+
+    def test_errors_go_to_the_error_callback_or_the_log(self):
+        future = Future()
+        future.set_exception(apiUtils.ApiError(404, "missing"))
+        errors = []
+        apiUtils.call_on_tk(self.root, future, self.fail, errors.append)
+        self.run_tk(future)
+        self.assertEqual(errors[0].status, 404)
+
+        apiUtils.call_on_tk(self.root, future, self.fail)
+        with self.assertLogs("apiUtils", "ERROR"):
+            self.run_tk(future)
+
+
+if __name__ == "__main__":
+    unittest.main()
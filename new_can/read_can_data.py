@@ -12,32 +12,158 @@ import can
 import requests
 import asyncio
 import queue
+import logging
+import atexit
 
+from canutils import dbc_snapshot
+from canutils.stats import StatsEngine
+from canutils.filters import compile_filter
+from canutils.capture import CaptureWriter
+from canutils import metrics
+from canutils import profiler
+from canutils.asynclog import setup_logging
+from canutils.router import DecodeRouter
+from canutils.dbc_diff import DbcReloader, DbcWatcher, diff_changes
+from canutils.transport import Reassembler
+from canutils.delta import DeltaEncoder, parse_deadbands
+from canutils.export import open_exporter
+from canutils.shm import FrameRing, DEFAULT_NAME as DEFAULT_RING_NAME
+from canutils.triggers import (TriggerEngine, MatchCondition, CrossingCondition, SequenceCondition,
+                               MissingCondition, DEFAULT_PRE_FRAMES, DEFAULT_POST_FRAMES)
 
+try:
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+except ImportError:
+    InfluxDBClient = None
 
-# Disables printing
-def blockPrint():
-    sys.stdout = open(os.devnull, 'w')
-
-# Restores printing
-def enablePrint():
-    sys.stdout = sys.__stdout__
 
 parser = argparse.ArgumentParser()
-parser.add_argument('-s', action='store_true', help="silence output")
+parser.add_argument('-s', action='store_true', help="silence per-frame output")
+parser.add_argument('-b', '--bustype', default="socketcan", help="python-can interface to read from (default: %(default)s)")
+parser.add_argument('-d', '--dbc', action='append', metavar='[CHANNEL=]FILE', help="DBC file to decode with, optionally for one channel only; repeat for several files or buses")
+parser.add_argument('-c', '--capture', help="record received frames to a binary capture file")
+parser.add_argument('--trigger', action='append', metavar='EXPR', help="with --capture, only record around frames matching a filter expression, e.g. \"id == 0x123\"")
+parser.add_argument('--trigger-rise', action='append', metavar='EXPR', help="with --capture, only record around the expression becoming true, e.g. \"Battery.Voltage > 400\"")
+parser.add_argument('--trigger-sequence', action='append', nargs=3, metavar=('A', 'B', 'MS'), help="with --capture, only record around a frame matching B within MS milliseconds of one matching A")
+parser.add_argument('--trigger-missing', action='append', nargs=2, metavar=('ID', 'FACTOR'), help="with --capture, only record around ID being absent for more than FACTOR cycle times")
+parser.add_argument('--pre-frames', type=int, default=DEFAULT_PRE_FRAMES, help="frames kept from before a trigger")
+parser.add_argument('--post-frames', type=int, default=DEFAULT_POST_FRAMES, help="frames recorded after a trigger")
+parser.add_argument('-f', '--filter', help="only handle frames matching a filter expression, e.g. \"id in 0x100..0x1FF and Battery.Voltage > 380\"")
+parser.add_argument('-t', '--isotp', metavar='ID[,ID...]', help="reassemble ISO-TP messages on these CAN IDs, e.g. 0x7E0,0x7E8")
+parser.add_argument('-j', '--j1939-tp', action='store_true', help="reassemble J1939 multi-packet (TP.CM/TP.DT) messages")
+parser.add_argument('-x', '--changes-only', action='store_true', help="only pass on (and capture) signals whose value changed")
+parser.add_argument('--deadband', action='append', metavar='[MESSAGE.]SIGNAL=VALUE', help="with --changes-only, ignore changes of a signal up to this size; repeat for several signals")
+parser.add_argument('--refresh', type=float, metavar='SECONDS', help="with --changes-only, still send every signal of an ID this often")
+parser.add_argument('-e', '--export', metavar='PATH', help="stream decoded signals to PATH (.csv, .parquet or .mf4); .csv and .parquet are directories with one file per message")
+parser.add_argument('--shm', nargs='?', const=DEFAULT_RING_NAME, metavar='NAME', help="publish decoded frames to a shared-memory ring the GUI can attach to (default name: %(const)s)")
+parser.add_argument('-r', '--reload', action='store_true', help="watch the DBC files and reload them in place when they change, swapping only the messages that differ")
+parser.add_argument('-m', '--metrics', action='store_true', help="collect latency metrics and push them to the backend's /metrics endpoint")
+parser.add_argument('-p', '--profile', type=float, metavar='SECONDS', help="profile the reader for this many seconds, writing to profiles/")
 options = parser.parse_args()
+trigger_options = (options.trigger, options.trigger_rise, options.trigger_sequence, options.trigger_missing)
+if any(trigger_options) and not options.capture:
+    parser.error("triggers need --capture")
+
+# Output is written by a listener thread so a slow terminal never stalls ingest
+setup_logging(stream=sys.stdout)
+logger = logging.getLogger("can.reader")
+frame_logger = logging.getLogger("can.frames")
+if options.s:
+    frame_logger.setLevel(logging.WARNING)
 
-client = InfluxDBClient(url="http://localhost:8086", token=token)
-write_api = client.write_api(write_options=SYNCHRONOUS)
+if options.metrics:
+    metrics.enable()
+if options.profile:
+    profiler.profile_for(
+        options.profile,
+        profiler.output_prefix("profiles", "reader"),
+        callback=lambda result: sys.stderr.write(f"Profile written to {result.paths[0]}\n{result.report(10)}")
+    )
+FRAMES_RECEIVED = metrics.counter("can_frames_received_total", "Frames received from the CAN bus")
+RECV_LATENCY = metrics.histogram("can_recv_latency_seconds", "Time from a frame's bus timestamp until the reader handles it")
+DECODE_TIME = metrics.histogram("can_decode_seconds", "Time to decode one received frame")
+SIGNALS_SUPPRESSED = metrics.counter("can_signals_suppressed_total", "Decoded signals dropped by --changes-only because they did not change")
+REASSEMBLED = metrics.counter("can_reassembled_total", "Transport protocol payloads reassembled from several frames")
 
-message_queue=queue
+# The InfluxDB client is optional: it is only set up when the package is
+# installed and INFLUXDB_TOKEN is set
+write_api = None
+if InfluxDBClient is not None and os.environ.get("INFLUXDB_TOKEN"):
+    client = InfluxDBClient(url="http://localhost:8086", token=os.environ["INFLUXDB_TOKEN"])
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+
+# Nothing reads the queue yet, so only the newest messages are kept
+MAX_QUEUED_MESSAGES = 50
+message_queue = queue.Queue()
 can_channel="vcan0"
-can_bustype="socketcan"
+can_bustype=options.bustype
 can_bitrate=800000
 can_dbc_file="system_can.dbc"
 
-can_bus = can.interface.Bus(can_channel, bustype=can_bustype, bitrate=can_bitrate)
-db = cantools.database.load_file(can_dbc_file)
+# Every DBC is merged into one router keyed by (channel, ID); ID conflicts
+# between files on the same channel are logged here, at load time
+dbc_specs = [spec.split('=', 1) if '=' in spec else (None, spec) for spec in options.dbc or [can_dbc_file]]
+router = DecodeRouter()
+for channel, dbc_path in dbc_specs:
+    router.add_database(dbc_snapshot.load_file(dbc_path), channel, os.path.basename(dbc_path))
+# Filters and statistics only need the message list, which the router provides
+db = router
+# With --reload, edited DBC files are re-parsed in a worker process and only
+# their added, removed and changed messages are swapped into the router
+dbc_watcher = None
+if options.reload:
+    dbc_paths = sorted({dbc_path for _, dbc_path in dbc_specs})
+    dbc_watcher = DbcWatcher(dbc_paths)
+    dbc_reloader = DbcReloader(dbc_paths)
+    atexit.register(dbc_reloader.close)
+
+# ID constraints in the filter are pushed down to the kernel through can_filters
+message_filter = compile_filter(options.filter, db) if options.filter else None
+can_filters = message_filter.can_filters() if message_filter else None
+
+# One bus per channel named in --dbc, or the default channel
+can_channels = sorted({channel for channel, _ in dbc_specs if channel}) or [can_channel]
+can_buses = [can.interface.Bus(channel, bustype=can_bustype, bitrate=can_bitrate, can_filters=can_filters)
+             for channel in can_channels]
+can_bus = can_buses[0]
+# Multi-frame ISO-TP and J1939 transport messages are reassembled before
+# decoding; their payloads join the stream like any other message
+isotp_ids = [int(frame_id, 0) for frame_id in options.isotp.split(',')] if options.isotp else []
+reassembler = Reassembler(isotp_ids, j1939=options.j1939_tp) if isotp_ids or options.j1939_tp else None
+# With --changes-only only signals that changed (beyond their deadband) are
+# published, and the capture skips frames that repeat the last payload
+delta = DeltaEncoder(parse_deadbands(options.deadband), options.refresh) if options.changes_only else None
+capture_writer = CaptureWriter(options.capture, background=True, changes_only=options.changes_only,
+                               refresh=options.refresh) if options.capture else None
+# With triggers the capture only gets the frames around each trigger event;
+# conditions see the frames the --filter ID check lets through
+trigger_engine = None
+if any(trigger_options):
+    conditions = [MatchCondition(expression, db) for expression in options.trigger or []]
+    conditions += [CrossingCondition(expression, db) for expression in options.trigger_rise or []]
+    conditions += [SequenceCondition(first, second, float(ms) / 1000.0, db)
+                   for first, second, ms in options.trigger_sequence or []]
+    conditions += [MissingCondition(int(frame_id, 0), float(factor), db)
+                   for frame_id, factor in options.trigger_missing or []]
+    trigger_engine = TriggerEngine(capture_writer, conditions, options.pre_frames, options.post_frames)
+    # Trigger events are buffered in the open .triggers file until then
+    atexit.register(trigger_engine.close)
+if capture_writer:
+    # The last, partly filled chunk and any chunks still queued to the
+    # writer thread are written out when the reader exits
+    atexit.register(capture_writer.close)
+exporter = open_exporter(options.export, db, background=True) if options.export else None
+# GUIs on this machine map the ring instead of going through the backend
+frame_ring = FrameRing(options.shm) if options.shm else None
+if frame_ring:
+    atexit.register(frame_ring.close)
+if exporter:
+    # Buffered rows are written out when the reader exits
+    atexit.register(exporter.close)
+
+stats = StatsEngine(bitrate=can_bitrate)
+stats.set_database(db)
 
 # python concurrency leaves much to be desired, so we have to use some 'tricks'
 # https://stackoverflow.com/questions/8600161/executing-periodic-actions/20169930#20169930
@@ -52,45 +178,259 @@ async def do_every(period, f, *args):
         time.sleep(next(g))
         f(*args)
 
+# Seconds between checks of the settings stored in the backend
+SETTINGS_PERIOD = 1.0
+# The backend's API; its routes are mounted under api/
+BACKEND_URL = "http://localhost:8000/api"
+# Seconds to wait for the backend before giving up on a request
+BACKEND_TIMEOUT = 0.5
+
+def fetch_can_settings():
+    response = requests.get(f"{BACKEND_URL}/get_can_settings", timeout=BACKEND_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
 async def update_can_settings():
+    # The buses are opened once at startup; changed settings are reported
+    # and take effect when the reader is restarted
+    in_use = (can_channels, can_bustype, can_bitrate)
+    reported = in_use
     while True:
         try:
-            response = requests.get("http://localhost:8000/get_can_settings")
-            r = response.json()
-            can_channel = r['channel']
-            can_bustype = r['bustype']
-            can_bitrate = r['bitrate']
-            can_bus = can.interface.Bus(can_channel, bustype=can_bustype, bitrate=can_bitrate)
-            await asyncio.sleep(0.01)
+            r = await asyncio.get_event_loop().run_in_executor(None, fetch_can_settings)
+            settings = ([r['channel']], r['bustype'], int(r['bitrate']))
+            if settings != in_use and settings != reported:
+                logger.info(f"CAN settings changed to {r}; restart the reader to apply them")
+            reported = settings
         except Exception as e:
-            await asyncio.sleep(0.01)
+            pass
+        await asyncio.sleep(SETTINGS_PERIOD)
+
+def message_info(timestamp, channel, name, sender, frame_id, data, decoded):
+    return {
+         "timestamp" :str(datetime.fromtimestamp(timestamp)),
+         "channel": channel,
+         "name" : name,
+         "sender" : sender,
+         "arbitration_id": hex(frame_id),
+         "dlc": len(data),
+         "hex": data.hex(),
+         "bin_data": ''.join(format(byte, '08b') for byte in data),
+         "dec" : int.from_bytes(data, byteorder='big', signed=False),
+         "decoded_data": decoded
+    }
+
+def reassembled_info(payload):
+    # J1939 payloads are decoded by the DBC message for their PGN, if any;
+    # ISO-TP payloads (UDS and the like) are passed on raw
+    name = f"ISO-TP {hex(payload.frame_id)}" if payload.pgn is None else f"PGN {hex(payload.pgn)}"
+    sender = hex(payload.source)
+    decoded = {}
+    route = router.route(payload.channel, payload.frame_id, payload.pgn is not None)
+    if route is not None:
+        try:
+            decoded = route.message.decode(payload.data)
+            name = route.message.name
+            sender = route.message.senders[0] if route.message.senders else sender
+        except Exception as e:
+            frame_id = hex(payload.frame_id)
+            logger.error("Error decoding reassembled %s: %s", frame_id, e, extra={"rate_key": frame_id})
+        else:
+            decoded = changed_signals(payload.channel, payload.frame_id, name, decoded, payload.timestamp)
+            if decoded is None:
+                return None
+    return message_info(payload.timestamp, payload.channel, name, sender, payload.frame_id, payload.data, decoded)
+
+def changed_signals(channel, frame_id, name, decoded, timestamp):
+    # Without --changes-only every signal is passed on
+    if delta is None:
+        return decoded
+    changed = delta.changes((channel, frame_id), decoded, name, timestamp)
+    if metrics.enabled:
+        SIGNALS_SUPPRESSED.inc(len(decoded) - (len(changed) if changed else 0))
+    return changed
+
+def publish(msg_info):
+    message_queue.put(msg_info)
+    clear_queue()
+    if frame_logger.isEnabledFor(logging.INFO):
+        frame_logger.info("%s", msg_info, extra={"rate_key": False})
 
 async def decode_and_send():
+    # Frames from every bus arrive through one reader, tagged with their channel
+    reader = can.AsyncBufferedReader()
+    notifier = can.Notifier(can_buses, [reader], loop=asyncio.get_event_loop())
     while True:
-        message = can_bus.recv()
+        message = await reader.get_message()
         if message:
-            decoded = db.decode_message(message.arbitration_id, message.data)
-
-            msg_info={
-                 "timestamp" :str(datetime.fromtimestamp(message.timestamp)),
-                 "name" : db.get_message_by_frame_id(message.arbitration_id).name,
-                 "sender" : db.get_message_by_frame_id(message.arbitration_id).senders[0],
-                 "arbitration_id": hex(message.arbitration_id),
-                 "dlc": message.dlc,
-                 "hex": message.data.hex(),
-                 "bin_data": ''.join(format(byte, '08b')).
-                 "dec" : int.from_bytes(message.data, byteorder='big', signed=False), 
-                 "decoded_data": decoded
-            }
-            message_queue.put(msg_info)
-            print(msg_info) 
+            if metrics.enabled:
+                FRAMES_RECEIVED.inc()
+                RECV_LATENCY.observe(time.time() - message.timestamp)
+            stats.update(message.arbitration_id, message.timestamp, message.dlc, message.is_extended_id)
+            if trigger_engine:
+                trigger_engine.record(message)
+            elif capture_writer:
+                capture_writer.write_message(message)
+
+            # Reject on ID before paying for the decode
+            if message_filter and not message_filter.match_id(message.arbitration_id):
+                await asyncio.sleep(0)
+                continue
+
+            if reassembler and reassembler.handles(message.arbitration_id, message.is_extended_id):
+                payload = reassembler.feed(message.channel, message.arbitration_id, message.data,
+                                           message.timestamp, message.is_extended_id)
+                if payload is not None:
+                    if metrics.enabled:
+                        REASSEMBLED.inc()
+                    msg_info = reassembled_info(payload)
+                    if msg_info is not None:
+                        publish(msg_info)
+                await asyncio.sleep(0)
+                continue
+
+            if metrics.enabled:
+                start = time.perf_counter()
+            route = router.route(message.channel, message.arbitration_id, message.is_extended_id)
+            db_msg = route.message if route else None
+            decoded = None
+            if route is None:
+                frame_id = hex(message.arbitration_id)
+                logger.warning("No DBC defines %s on %s", frame_id, message.channel, extra={"rate_key": frame_id})
+            else:
+                try:
+                    decoded = db_msg.decode(message.data)
+                except Exception as e:
+                    # Repeats for the same ID are summarised once a second
+                    frame_id = hex(message.arbitration_id)
+                    logger.error("Error decoding %s: %s", frame_id, e, extra={"rate_key": frame_id})
+            if trigger_engine:
+                # Undecodable frames can still match on id, name and dlc
+                trigger_engine.evaluate(message.arbitration_id, db_msg.name if db_msg else None,
+                                        message.dlc, decoded or {}, message.timestamp)
+            if decoded is None:
+                await asyncio.sleep(0)
+                continue
+            if metrics.enabled:
+                DECODE_TIME.observe(time.perf_counter() - start)
+
+            if message_filter and not message_filter.predicate(message.arbitration_id, db_msg.name, message.dlc, decoded):
+                await asyncio.sleep(0)
+                continue
+
+            decoded = changed_signals(message.channel, message.arbitration_id, db_msg.name, decoded, message.timestamp)
+            if decoded is None:
+                await asyncio.sleep(0)
+                continue
+
+            if exporter:
+                exporter.add(message.arbitration_id, message.timestamp, decoded, db_msg)
+            if frame_ring:
+                frame_ring.write_message(message, db_msg, decoded)
+            publish(message_info(message.timestamp, message.channel, db_msg.name, db_msg.senders[0],
+                                 message.arbitration_id, message.data, decoded))
             await asyncio.sleep(0)
 
-async def clear_queue():
-    if message_queue.size()>50:
+def replace_dbc(dbc_path):
+    # Runs in a worker thread: the router swaps its tables in one step, and
+    # decoding carries on with the old definitions until then
+    changed, removed = dbc_reloader.changes(dbc_path)
+    source = os.path.basename(dbc_path)
+    diffs = []
+    for channel, path in dbc_specs:
+        if path == dbc_path:
+            diff = diff_changes(router.source_messages(channel, source), changed, removed)
+            router.apply_diff(diff, channel, source)
+            diffs.append(diff)
+    if any(diffs):
+        stats.set_database(db)
+    return diffs
+
+# Changed DBC files waiting to be reloaded, in the order they changed. One
+# reload runs at a time, and a file that changes again meanwhile is only
+# reloaded once more, at its latest version.
+pending_reloads = {}
+reload_task = None
+
+async def reload_pending():
+    while pending_reloads:
+        dbc_path = next(iter(pending_reloads))
+        del pending_reloads[dbc_path]
+        await reload_dbc(dbc_path)
+
+async def reload_dbc(dbc_path):
+    global message_filter
+    try:
+        diffs = await asyncio.get_event_loop().run_in_executor(None, replace_dbc, dbc_path)
+    except Exception as e:
+        logger.error(f"Not reloading {dbc_path}: {e}")
+        return
+    for diff in diffs:
+        if not diff:
+            continue
+        logger.info(f"Reloaded {dbc_path}: {diff.summary()}")
+        if delta:
+            delta.forget(diff.affected_ids)
+        if exporter:
+            exporter.update_database(diff)
+    if message_filter and any(diffs):
+        # Signal conditions are resolved against the database; the kernel
+        # ID filters set up at startup stay as they are
+        message_filter = compile_filter(options.filter, db)
+
+def send_bus_stats(bus_stats, reader_metrics):
+    # Runs in the executor, so a slow or unreachable backend never holds up decoding
+    posts = [("stats", bus_stats)]
+    if reader_metrics is not None:
+        posts.append(("metrics", reader_metrics))
+    for path, body in posts:
+        try:
+            response = requests.post(f"{BACKEND_URL}/{path}", json=body, timeout=BACKEND_TIMEOUT)
+        except Exception as e:
+            # No backend running is normal; the reader works without one
+            continue
+        if not response.ok:
+            logger.warning("Backend rejected %s: %s %s", path, response.status_code, response.text[:200],
+                           extra={"rate_key": path})
+
+async def post_bus_stats():
+    global reload_task
+    pending = None
+    while True:
+        if dbc_watcher:
+            pending_reloads.update(dict.fromkeys(dbc_watcher.changed()))
+            if pending_reloads and (reload_task is None or reload_task.done()):
+                reload_task = asyncio.ensure_future(reload_pending())
+        if reassembler:
+            # Sessions that stopped mid-message are dropped even if their IDs go quiet
+            reassembler.expire(time.time())
+        if trigger_engine:
+            # Missing-frame triggers must fire even when the bus goes quiet
+            trigger_engine.poll(time.time())
+        # Snapshots are taken here, on the loop; an update still in flight
+        # means the backend is slow, and this one is dropped
+        if pending is None or pending.done():
+            pending = asyncio.get_event_loop().run_in_executor(
+                None, send_bus_stats, stats.snapshot(now=time.time()),
+                metrics.snapshot() if metrics.enabled else None)
+        await asyncio.sleep(1)
+
+def clear_queue():
+    while message_queue.qsize() > MAX_QUEUED_MESSAGES:
+        message_queue.get_nowait()
 
 def start_reading():
-    loop = asyncio.get_event_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     asyncio.ensure_future(decode_and_send())
     asyncio.ensure_future(update_can_settings())
+    asyncio.ensure_future(post_bus_stats())
     loop.run_forever()
+
+if __name__ == "__main__":
+    try:
+        start_reading()
+    except KeyboardInterrupt:
+        # Ctrl-C is the normal way to stop; atexit handlers finish the outputs
+        pass
+